@@ -0,0 +1,16 @@
+# Сборка app.exe для monitor.bat: pyinstaller app.spec
+#
+# Точка входа - app/launcher.py, а не app.py: сервер отвечает сразу, а приложение
+# импортируется и мигрирует БД в фоне, пока /ready отвечает 503.
+# Модули приложения лежат в app/ и импортируются без пакета.
+
+a = Analysis(
+    ['app/launcher.py'],
+    pathex=['app'],
+    datas=[('app/templates', 'templates'), ('app/static', 'static')],
+    # Приложение импортируется в потоке загрузки, графики и аналитика - в обработчиках
+    hiddenimports=['app', 'downsample', 'dashboard', 'waitress'],
+)
+pyz = PYZ(a.pure)
+exe = EXE(pyz, a.scripts, [], exclude_binaries=True, name='app', console=True)
+coll = COLLECT(exe, a.binaries, a.datas, name='app')
@@ -0,0 +1,171 @@
+import operator
+import time
+
+from sqlalchemy import select, func, and_
+
+from events import subscribe
+from latest import withdrawn
+from models import db, Hydrochemistry, AlertRule, Alert, HYDROCHEMISTRY_PARAMETERS as PARAMETERS
+from versions import data_version
+
+KINDS = {'threshold': 'последнее значение', 'rate': 'скорость изменения в час', 'window': 'среднее за окно'}
+# Сравнения применяются к массивам NumPy поэлементно
+OPERATORS = {'<': operator.lt, '>': operator.gt}
+# Глубина окна последних измерений, в котором ищется значение для пороговых правил
+MIN_LOOKBACK = 3600
+
+# (версия таблицы правил в БД, включенные правила): правила перечитываются после записи из любого процесса
+_rules = None
+
+
+def enabled_rules(executor):
+    global _rules
+    version = data_version(executor, AlertRule.__table__.name)
+    cached = _rules
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    rules = executor.execute(
+        select(AlertRule.id, AlertRule.parameter, AlertRule.group_pool_id, AlertRule.kind,
+               AlertRule.operator, AlertRule.threshold, AlertRule.window)
+        .where(AlertRule.enabled.is_(True))
+    ).all()
+    _rules = (version, rules)
+    return rules
+
+
+def recent_window_statement(group_pool_ids, lookback):
+    latest = select(Hydrochemistry.group_pool_id, func.max(Hydrochemistry.hydrochem_date).label('latest'))\
+        .where(Hydrochemistry.group_pool_id.in_(group_pool_ids))\
+        .group_by(Hydrochemistry.group_pool_id).subquery()
+    return select(Hydrochemistry.group_pool_id, Hydrochemistry.hydrochem_date,
+                  *[getattr(Hydrochemistry, parameter) for parameter in PARAMETERS])\
+        .join(latest, and_(Hydrochemistry.group_pool_id == latest.c.group_pool_id,
+                           Hydrochemistry.hydrochem_date >= latest.c.latest - lookback))\
+        .order_by(Hydrochemistry.group_pool_id, Hydrochemistry.hydrochem_date)
+
+
+def recent_window(executor, group_pool_ids, lookback):
+    """Измерения за lookback секунд до последнего измерения каждого группового бассейна.
+
+    Читаются только указанные бассейны по индексу (бассейн, дата), поэтому объем
+    не зависит от размера журнала. Возвращает массивы бассейнов, дат и значений (n x 9).
+    """
+    # NumPy загружается при первой проверке правил, а не при запуске приложения
+    import numpy as np
+
+    rows = executor.execute(recent_window_statement(group_pool_ids, lookback)).all()
+    data = np.array(rows, dtype=np.float64).reshape(-1, len(PARAMETERS) + 2)
+    return data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2:]
+
+
+def evaluate(group_pool_ids, dates, values, rules):
+    """Вычисляет правила сразу для всех групповых бассейнов окна.
+
+    Массивы отсортированы по (бассейн, дата), пропуски в values - NaN.
+    Возвращает словарь (rule_id, group_pool_id) -> (значение, сработало, время измерения);
+    бассейны, по которым в окне нет значений параметра, в него не попадают.
+    """
+    import numpy as np
+
+    n = len(dates)
+    if not n:
+        return {}
+    pools, starts = np.unique(group_pool_ids, return_index=True)
+    counts = np.diff(np.append(starts, n))
+    latest = dates[starts + counts - 1]
+    row_latest = np.repeat(latest, counts)
+    positions = np.arange(n)
+
+    results = {}
+    for rule in rules:
+        column = values[:, PARAMETERS.index(rule.parameter)]
+        valid = ~np.isnan(column)
+        if rule.kind != 'threshold':
+            valid &= dates >= row_latest - rule.window
+        if rule.group_pool_id is not None:
+            valid &= group_pool_ids == rule.group_pool_id
+        valid_count = np.add.reduceat(valid.astype(np.int64), starts)
+        found = valid_count > 0
+        last = np.maximum.reduceat(np.where(valid, positions, -1), starts)
+
+        if rule.kind == 'window':
+            value = np.add.reduceat(np.where(valid, column, 0.0), starts) / np.maximum(valid_count, 1)
+        elif rule.kind == 'rate':
+            first = np.minimum.reduceat(np.where(valid, positions, n - 1), starts)
+            hours = (dates[last] - dates[first]) / 3600
+            found &= hours > 0
+            value = np.divide(column[last] - column[first], hours, out=np.zeros(len(pools)), where=found)
+        else:
+            value = column[last]
+
+        triggered = found & OPERATORS[rule.operator](np.where(found, value, 0.0), rule.threshold)
+        for i in np.flatnonzero(found):
+            results[(rule.id, int(pools[i]))] = (float(value[i]), bool(triggered[i]), int(latest[i]))
+    return results
+
+
+def update_alerts(executor, results, rechecked=(), resolved_at=None):
+    """Открывает, продлевает и закрывает оповещения по результатам вычисления правил.
+
+    rechecked - бассейны, перепроверенные после удаления или исправления измерений:
+    их открытые оповещения без результата (значений параметра не осталось) тоже закрываются.
+    Время закрытия - resolved_at, если задано, иначе время последнего измерения.
+    """
+    group_pool_ids = {group_pool_id for _, group_pool_id in results} | set(rechecked)
+    active = {(rule_id, group_pool_id): alert_id for alert_id, rule_id, group_pool_id in executor.execute(
+        select(Alert.id, Alert.rule_id, Alert.group_pool_id)
+        .where(Alert.resolved_at.is_(None), Alert.group_pool_id.in_(group_pool_ids))
+    )}
+
+    opened, seen, resolved = [], [], []
+    for key, (value, triggered, at) in results.items():
+        alert_id = active.get(key)
+        if triggered and alert_id is None:
+            opened.append({'rule_id': key[0], 'group_pool_id': key[1], 'value': value,
+                           'started_at': at, 'last_seen_at': at})
+        elif triggered:
+            seen.append({'_id': alert_id, '_value': value, '_at': at})
+        elif alert_id is not None:
+            resolved.append({'_id': alert_id, '_at': resolved_at or at})
+    rule_ids = {rule.id for rule in enabled_rules(executor)}
+    resolved += [{'_id': alert_id, '_at': resolved_at or int(time.time())} for key, alert_id in active.items()
+                 if key[1] in rechecked and key[0] in rule_ids and key not in results]
+
+    table = Alert.__table__
+    if opened:
+        executor.execute(table.insert(), opened)
+    if seen:
+        executor.execute(table.update().where(table.c.id == db.bindparam('_id'))
+                         .values(value=db.bindparam('_value'), last_seen_at=db.bindparam('_at')), seen)
+    if resolved:
+        executor.execute(table.update().where(table.c.id == db.bindparam('_id'))
+                         .values(resolved_at=db.bindparam('_at')), resolved)
+
+
+def check_alerts(executor, group_pool_ids, recheck=False):
+    """Вычисляет все включенные правила по последним измерениям указанных бассейнов.
+
+    С recheck бассейны проверяются после удаления измерений: закрываются и оповещения,
+    для которых не осталось значений, а время закрытия - текущее, а не время измерения.
+    """
+    rules = enabled_rules(executor)
+    if not rules or not group_pool_ids:
+        return
+    lookback = max([MIN_LOOKBACK] + [rule.window for rule in rules])
+    results = evaluate(*recent_window(executor, list(group_pool_ids), lookback), rules)
+    if recheck:
+        update_alerts(executor, results, set(group_pool_ids), int(time.time()))
+    else:
+        update_alerts(executor, results)
+
+
+@subscribe('hydrochemistry')
+def _on_hydrochemistry(session, changes):
+    # Удаленное или исправленное измерение могло держать оповещение открытым: такие бассейны
+    # перепроверяются по новому последнему измерению
+    stale = set()
+    for change in changes:
+        if withdrawn(change):
+            stale.update((change.old['group_pool_id'], change.row['group_pool_id']))
+    check_alerts(session, {change.row['group_pool_id'] for change in changes if change.op != 'delete'} - stale)
+    check_alerts(session, stale, recheck=True)
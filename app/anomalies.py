@@ -0,0 +1,156 @@
+from collections import defaultdict
+
+from sqlalchemy import select, func
+
+from archive import archive_horizon
+from events import subscribe
+from models import db, Hydrochemistry, HydrochemistryAnomaly, HYDROCHEMISTRY_PARAMETERS as PARAMETERS
+from versions import bump, bump_periods, period_start, PERIOD
+
+# Скользящее окно сезонной базы для медианы и MAD, секунды
+BASELINE = 30 * 86400
+# Период полураспада EWMA, секунды: быстрая база для обнаружения дрейфа датчика
+EWMA_HALFLIFE = 86400
+# Сколько измерений параметра должно быть в окне, чтобы оценка имела смысл
+MIN_PERIODS = 20
+# Пороги: модифицированная z-оценка (Iglewicz-Hoaglin) и z-оценка по EWMA
+ROBUST_LIMIT = 3.5
+EWMA_LIMIT = 4.0
+# Измерения читаются частями по CHUNK на групповой бассейн, с предысторией длиной в BASELINE
+CHUNK = 30 * 86400
+
+
+def robust_scores(frame):
+    """Модифицированная z-оценка относительно скользящей медианы и MAD."""
+    window = f'{BASELINE}s'
+    median = frame.rolling(window, min_periods=MIN_PERIODS).median()
+    deviation = frame - median
+    mad = deviation.abs().rolling(window, min_periods=MIN_PERIODS).median()
+    return 0.6745 * deviation / mad.where(mad > 0)
+
+
+def ewma_scores(frame):
+    """z-оценка отклонения от EWMA по предыдущим измерениям."""
+    halflife = f'{EWMA_HALFLIFE}s'
+    mean = frame.ewm(halflife=halflife, times=frame.index, ignore_na=True).mean().shift(1)
+    residual = frame - mean
+    variance = (residual ** 2).ewm(halflife=halflife, times=frame.index, ignore_na=True).mean().shift(1)
+    counts = frame.notna().cumsum().shift(1)
+    return (residual / variance.where(variance > 0) ** 0.5).where(counts >= MIN_PERIODS)
+
+
+def read_frame(group_pool_id, start, end):
+    # NumPy и pandas загружаются при первом расчете, а не при запуске приложения
+    import numpy as np
+    import pandas as pd
+
+    rows = db.session.execute(
+        select(Hydrochemistry.id, Hydrochemistry.hydrochem_date,
+               *[getattr(Hydrochemistry, parameter) for parameter in PARAMETERS])
+        .where(Hydrochemistry.group_pool_id == group_pool_id,
+               Hydrochemistry.hydrochem_date >= start, Hydrochemistry.hydrochem_date < end)
+        .order_by(Hydrochemistry.hydrochem_date, Hydrochemistry.id)
+    ).all()
+    data = np.array(rows, dtype=np.float64).reshape(-1, len(PARAMETERS) + 2)
+    frame = pd.DataFrame(data[:, 2:], columns=PARAMETERS, index=pd.to_datetime(data[:, 1], unit='s'))
+    return data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), frame
+
+
+def score_chunk(group_pool_id, start, end):
+    """Оценки всех измерений группового бассейна за [start, end) с отметкой аномальных.
+
+    Предыстория нужна только для окон; пустые значения параметров не оцениваются.
+    """
+    import numpy as np
+
+    ids, dates, frame = read_frame(group_pool_id, start - BASELINE, end)
+    if not len(ids):
+        return []
+    robust = robust_scores(frame).to_numpy()
+    ewma = ewma_scores(frame).to_numpy()
+    values = frame.to_numpy()
+
+    with np.errstate(invalid='ignore'):
+        flagged = (np.abs(robust) >= ROBUST_LIMIT) | (np.abs(ewma) >= EWMA_LIMIT)
+    scored = ~np.isnan(values) & (dates >= start)[:, np.newaxis]
+    rows, columns = np.nonzero(scored)
+    return [{
+        'hydrochemistry_id': int(ids[row]), 'parameter': PARAMETERS[column], 'group_pool_id': group_pool_id,
+        'hydrochem_date': int(dates[row]), 'value': float(values[row, column]),
+        'robust_score': None if np.isnan(robust[row, column]) else float(robust[row, column]),
+        'ewma_score': None if np.isnan(ewma[row, column]) else float(ewma[row, column]),
+        'flagged': bool(flagged[row, column]),
+    } for row, column in zip(rows, columns)]
+
+
+def detect_anomalies(start=None, end=None):
+    """Пересчитывает оценки журнала за [start, end) по групповым бассейнам и частям.
+
+    Памяти нужно не больше одной части одного бассейна вместе с предысторией;
+    месяцы, перенесенные в архив, не пересчитываются. Возвращает число аномалий.
+    """
+    first, last = db.session.query(func.min(Hydrochemistry.hydrochem_date),
+                                   func.max(Hydrochemistry.hydrochem_date)).one()
+    if first is None:
+        return 0
+    start = max(start if start is not None else first, archive_horizon('hydrochemistry') or 0)
+    end = end if end is not None else last + 1
+
+    ranges = db.session.query(Hydrochemistry.group_pool_id, func.min(Hydrochemistry.hydrochem_date),
+                              func.max(Hydrochemistry.hydrochem_date))\
+        .filter(Hydrochemistry.hydrochem_date >= start, Hydrochemistry.hydrochem_date < end)\
+        .group_by(Hydrochemistry.group_pool_id).all()
+    found = 0
+    for group_pool_id, pool_first, pool_last in ranges:
+        db.session.execute(HydrochemistryAnomaly.__table__.delete().where(
+            HydrochemistryAnomaly.group_pool_id == group_pool_id,
+            HydrochemistryAnomaly.hydrochem_date >= start, HydrochemistryAnomaly.hydrochem_date < end))
+        for chunk_start in range(pool_first, pool_last + 1, CHUNK):
+            rows = score_chunk(group_pool_id, chunk_start, min(chunk_start + CHUNK, pool_last + 1))
+            if rows:
+                db.session.execute(HydrochemistryAnomaly.__table__.insert(), rows)
+            found += sum(row['flagged'] for row in rows)
+        # Запись Core обходит события сессии; по версиям графики с отметками перестроятся во всех процессах
+        bump(db.session, [HydrochemistryAnomaly.__table__.name])
+        bump_periods(db.session, [(group_pool_id, timestamp)
+                                  for timestamp in range(period_start(pool_first), pool_last + 1, PERIOD)])
+        db.session.commit()
+    return found
+
+
+def anomaly_scores(record_ids):
+    """Аномальные параметры записей журнала: {id: {параметр: оценка}}."""
+    scores = defaultdict(dict)
+    if not record_ids:
+        return scores
+    for record_id, parameter, robust, ewma in db.session.execute(
+            select(HydrochemistryAnomaly.hydrochemistry_id, HydrochemistryAnomaly.parameter,
+                   HydrochemistryAnomaly.robust_score, HydrochemistryAnomaly.ewma_score)
+            .where(HydrochemistryAnomaly.hydrochemistry_id.in_(record_ids), HydrochemistryAnomaly.flagged)):
+        scores[record_id][parameter] = max(abs(robust or 0), abs(ewma or 0))
+    return scores
+
+
+def anomaly_points(parameter, start_timestamp, end_timestamp, group_pool_ids, limit=5000):
+    """Аномальные измерения параметра для графика: {group_pool_id: (даты, значения)}."""
+    points = defaultdict(lambda: ([], []))
+    for group_pool_id, date, value in db.session.execute(
+            select(HydrochemistryAnomaly.group_pool_id, HydrochemistryAnomaly.hydrochem_date,
+                   HydrochemistryAnomaly.value)
+            .where(HydrochemistryAnomaly.parameter == parameter, HydrochemistryAnomaly.flagged,
+                   HydrochemistryAnomaly.hydrochem_date.between(start_timestamp, end_timestamp),
+                   HydrochemistryAnomaly.group_pool_id.in_(group_pool_ids))
+            .order_by(HydrochemistryAnomaly.hydrochem_date).limit(limit)):
+        dates, values = points[group_pool_id]
+        dates.append(date)
+        values.append(value)
+    return dict(points)
+
+
+@subscribe('hydrochemistry')
+def _on_hydrochemistry(session, changes):
+    # Оценки измененных и удаленных записей устарели; новые появятся при следующем запуске
+    stale = [change.row['id'] for change in changes if change.op != 'insert']
+    if stale:
+        session.execute(HydrochemistryAnomaly.__table__.delete()
+                        .where(HydrochemistryAnomaly.hydrochemistry_id.in_(stale)))
@@ -0,0 +1,220 @@
+import gzip
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from archive import ARCHIVES, archive_connections
+from models import db, Pool, GroupPool, FishType, FeedType, Hydrochemistry, FishInventory, FishBoning, Feed, \
+                   FishMovement, group_pool_pool
+from pagination import keyset_order, encode_cursor, decode_cursor
+from versions import table_versions
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Коллекция -> (модель, столбец даты для фильтра и порядка или None, поля фильтра по равенству)
+COLLECTIONS = {
+    'pools': (Pool, None, ()),
+    'group_pools': (GroupPool, None, ()),
+    'fish_types': (FishType, None, ()),
+    'feed_types': (FeedType, None, ()),
+    'hydrochemistry': (Hydrochemistry, Hydrochemistry.hydrochem_date, ('group_pool_id',)),
+    'inventories': (FishInventory, FishInventory.control_date, ('pool_id', 'fish_type_id')),
+    'bonings': (FishBoning, None, ('fish_inventory_id',)),
+    'feeds': (Feed, Feed.feed_date, ('pool_id', 'feed_type_id')),
+    'movements': (FishMovement, FishMovement.movement_date, ('pool_id_from', 'pool_id_to', 'fish_type_id')),
+}
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# Ответы меньше этого размера не сжимаются: выигрыш меньше затрат
+MIN_COMPRESS_SIZE = 512
+
+
+class ApiError(ValueError):
+    pass
+
+
+def validators(table_name):
+    """(ETag, время последнего изменения или None) таблицы по ее версии в БД.
+
+    Версия общая для всех процессов и меняется при каждой записи; время изменения
+    входит в ETag, чтобы ETag не повторился после восстановления БД из копии.
+    Это один запрос к table_version по первичному ключу: условный GET стоит его,
+    а не чтения коллекции. Валидаторы читаются до данных ответа, поэтому ответ
+    не может получить ETag версии новее своих данных.
+    """
+    version, modified = table_versions(db.session, [table_name])[table_name]
+    return f'{table_name}-{version}-{int((modified or 0) * 1000)}', modified
+
+
+def confirmed_modified(modified):
+    """Время изменения с точностью до секунды для Last-Modified или None.
+
+    Секунда, в которую таблица изменилась, еще не закончилась - в нее же может
+    попасть следующая запись, и If-Modified-Since ее не заметит. Такой ответ
+    отдается только с ETag.
+    """
+    if modified is None or int(modified) >= int(time.time()):
+        return None
+    return int(modified)
+
+
+def not_modified(request, current):
+    """Совпадают ли валидаторы клиента с текущими (validators); ETag проверяется первым."""
+    etag, modified = current
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    modified = confirmed_modified(modified)
+    return request.if_modified_since is not None and modified is not None and \
+        modified <= request.if_modified_since.timestamp()
+
+
+def set_validators(response, current):
+    etag, modified = current
+    # Слабый ETag: сжатые и несжатые ответы отличаются побайтно
+    response.set_etag(etag, weak=True)
+    modified = confirmed_modified(modified)
+    if modified is not None:
+        response.last_modified = datetime.fromtimestamp(modified, timezone.utc)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def compress(response, request):
+    """Сжимает JSON-ответ в brotli (если установлен пакет brotli) или gzip."""
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=5))
+    elif encoding == 'gzip':
+        response.set_data(gzip.compress(data, compresslevel=6))
+    else:
+        return response
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def parse_int(args, name):
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(f'Параметр {name} должен быть целым числом')
+
+
+def parse_timestamp(args, name):
+    # UNIX-время или дата ISO 8601
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise ApiError(f'Параметр {name}: ожидается UNIX-время или дата ISO 8601')
+
+
+def selected_fields(model, args):
+    available = [column.key for column in model.__table__.columns]
+    if model is GroupPool:
+        available.append('pools')
+    if not args.get('fields'):
+        return available
+    fields = [field.strip() for field in args['fields'].split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}; доступны: {", ".join(available)}')
+    return fields
+
+
+def group_pool_members(group_pool_ids):
+    members = {group_pool_id: [] for group_pool_id in group_pool_ids}
+    for group_pool_id, pool_id in db.session.execute(
+            select(group_pool_pool.c.group_pool_id, group_pool_pool.c.pool_id)
+            .where(group_pool_pool.c.group_pool_id.in_(group_pool_ids))
+            .order_by(group_pool_pool.c.group_pool_id, group_pool_pool.c.pool_id)):
+        members[group_pool_id].append(pool_id)
+    return members
+
+
+def collection_page(name, args):
+    """Страница коллекции по курсору (дата, id) или (id, id) с выбранными полями.
+
+    Для журналов с архивом в страницу попадают и строки частей архива, но только
+    тех, что не раньше курсора, поэтому после архивного периода файлы не открываются.
+    """
+    model, date_column, filter_fields = COLLECTIONS[name]
+    table = model.__table__
+    fields = selected_fields(model, args)
+    limit = parse_int(args, 'limit') or DEFAULT_LIMIT
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ApiError(f'Параметр limit должен быть от 1 до {MAX_LIMIT}')
+    cursor = decode_cursor(args.get('after'))
+    if args.get('after') and cursor is None:
+        raise ApiError('Некорректный курсор after')
+
+    sort_column = table.c[date_column.key] if date_column is not None else table.c.id
+    columns = [column for column in table.columns if column.key in fields]
+    statement = select(*columns, sort_column.label('_sort'), table.c.id.label('_id'))
+    conditions = []
+    for field in filter_fields:
+        value = parse_int(args, field)
+        if value is not None:
+            conditions.append(table.c[field] == value)
+    start = parse_timestamp(args, 'start')
+    end = parse_timestamp(args, 'end')
+    if (start is not None or end is not None) and date_column is None:
+        raise ApiError('У этой коллекции нет даты для фильтра start/end')
+    if start is not None:
+        conditions.append(sort_column >= start)
+    if end is not None:
+        conditions.append(sort_column <= end)
+    statement = keyset_order(statement.where(*conditions), sort_column, table.c.id, cursor).limit(limit + 1)
+
+    rows = db.session.execute(statement).mappings().all()
+    if table.name in ARCHIVES:
+        archive_start = max(value for value in (start, cursor[0] if cursor else None, 0) if value is not None)
+        for conn in archive_connections(table.name, archive_start, end):
+            rows += conn.execute(statement).mappings().all()
+        rows = sorted(rows, key=lambda row: (row['_sort'], row['_id']))[:limit + 1]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]['_sort'], rows[-1]['_id']])
+    records = [{field: row[field] for field in fields if field != 'pools'} for row in rows]
+    if 'pools' in fields:
+        members = group_pool_members([row['_id'] for row in rows])
+        for record, row in zip(records, rows):
+            record['pools'] = members[row['_id']]
+    return {'data': records, 'next': next_cursor}
+
+
+def collection_record(name, record_id, args):
+    """Одна запись коллекции из основной БД или None."""
+    model, _, _ = COLLECTIONS[name]
+    table = model.__table__
+    fields = selected_fields(model, args)
+    row = db.session.execute(
+        select(*[column for column in table.columns if column.key in fields], table.c.id.label('_id'))
+        .where(table.c.id == record_id)
+    ).mappings().first()
+    if row is None:
+        return None
+    record = {field: row[field] for field in fields if field != 'pools'}
+    if 'pools' in fields:
+        record['pools'] = group_pool_members([record_id])[record_id]
+    return record
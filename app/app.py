@@ -1,23 +1,82 @@
-from flask import Flask, render_template, redirect, url_for, request, flash
+from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, abort, \
+                  Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from forms import LoginForm, PoolForm, GroupPoolForm, HydrochemistryForm, FishTypeForm, \
                   FishInventoryForm, FishBoningForm, FeedForm, FeedTypeForm,\
-                  FishMovementForm, PoolSelectionForm, HydrochemistryGraphForm, HydrochemistryFilterForm
+                  FishMovementForm, HydrochemistryGraphForm, HydrochemistryFilterForm, ImportForm, JournalForm, \
+                  ExportForm, FcrForm, AlertRuleForm, InventoryFilterForm, DashboardForm, PARAMETER_CHOICES
 from models import db, User, Pool, GroupPool, Hydrochemistry, FishType,\
-                   FishInventory, FishBoning, FeedType, Feed, FishMovement, group_pool_pool
+                   FishInventory, FishBoning, FeedType, Feed, FishMovement, PoolStock, AlertRule, Alert
+from pagination import keyset_page, keyset_order, decode_cursor
+from migrations import upgrade_database, check_query_plans
+from stock import stock_by_fish_type, boning_totals
+from latest import water_status, rebuild_latest
+from versions import bump as bump_versions, bump_all_periods
+from reference import choices, reference_cache
+from columnar import encode_series, CONTENT_TYPE as SERIES_CONTENT_TYPE
+from plot_cache import plot_cache, source_version
+from importer import import_rows, RowError
+from exporter import EXPORTS, generate_csv, generate_parquet, write_parquet
+from journal import parse_journal_form, save_journal
+from ledger import stock_at, rebuild_ledger
+from fcr import fcr_report, rebuild_rollups
+from rollups import rebuild_hydrochemistry_rollups
+from archive import archived_hydrochemistry, archived_records
+from retention import apply_retention
+from alerts import check_alerts, KINDS as ALERT_KINDS
+from anomalies import detect_anomalies, anomaly_scores, anomaly_points
+from metrics import metrics
+from database import init_sqlite, DEFAULT_PRAGMAS
+from ingest import get_buffer, parse_reading, ReadingError, replay_dead_letter, dead_letter_path
+from startup import mark_ready, start_warm_up, readiness
+from api import COLLECTIONS as API_COLLECTIONS, ApiError, collection_page, collection_record, not_modified, \
+                set_validators, validators, compress, parse_timestamp
 from datetime import datetime, timedelta
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload, joinedload
 
-import plotly.graph_objs as go
-import plotly.offline as pyo
+import click
+import gzip
+import hmac
+import os
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_secret_key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///db.sqlite3'
+# Другую БД (например, синтетическую для замеров из bench/) можно указать в DATABASE_URL
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///db.sqlite3')
+app.config['HYDROCHEMISTRY_PER_PAGE'] = 100
+app.config['INVENTORY_PER_PAGE'] = 50
+app.config['JOURNAL_PER_PAGE'] = 100
+app.config['PLOT_POINT_BUDGET'] = 1000
+# Строк на групповой бассейн, после которых панель сравнения читает сводки вместо журнала
+app.config['DASHBOARD_POINT_BUDGET'] = 2000
+# Токены сборщика метрик для /metrics и бюджеты, при превышении которых запрос пишется в лог
+app.config['METRICS_TOKENS'] = [token for token in os.environ.get('METRICS_TOKENS', '').split(',') if token]
+app.config['METRICS_QUERY_BUDGET'] = 50
+app.config['METRICS_LATENCY_BUDGET'] = 1.0
+# Сроки хранения сырых строк в основной БД; более старые переносятся командой archive-data
+app.config['RETENTION_HYDROCHEMISTRY_MONTHS'] = 12
+app.config['RETENTION_FEED_YEARS'] = 3
+app.config['RETENTION_MOVEMENT_YEARS'] = 3
+# Каталог файлов архива, по умолчанию instance/archive
+app.config['ARCHIVE_DIR'] = None
+# Токены датчиков для /api/ingest, через запятую в переменной окружения INGEST_TOKENS
+app.config['INGEST_TOKENS'] = [token for token in os.environ.get('INGEST_TOKENS', '').split(',') if token]
+# Токены скриптов и панелей для чтения /api/v1, через запятую в переменной окружения API_TOKENS
+app.config['API_TOKENS'] = [token for token in os.environ.get('API_TOKENS', '').split(',') if token]
+# Пул соединений на процесс: не меньше потоков сервера плюс поток приема данных
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': int(os.environ.get('WEB_THREADS', 8)) + 2,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+}
+app.config['SQLITE_PRAGMAS'] = DEFAULT_PRAGMAS
 
 db.init_app(app)
+init_sqlite(app)
+metrics.init_app(app)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -29,12 +88,148 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 def create_tables():
-    db.create_all()
+    upgrade_database()
     if not User.query.filter_by(username='admin').first():
         admin = User(username='admin', password=generate_password_hash('admin', method='pbkdf2:sha256'))
         db.session.add(admin)
         db.session.commit()
 
+def prepare_app(warm_up=True):
+    """Путь запуска для боевого режима и app.exe: схема БД, затем прогрев в фоне.
+
+    Приложение готово принимать запросы сразу после миграций; Plotly, pandas,
+    шаблоны и справочники загружаются отдельным потоком.
+    """
+    with app.app_context():
+        create_tables()
+        # Соединения, открытые миграциями, не должны достаться рабочим потокам и процессам
+        db.engine.dispose()
+    mark_ready()
+    if warm_up:
+        start_warm_up(app)
+    return app
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Обновить схему БД до текущей версии."""
+    create_tables()
+    print('Схема БД обновлена')
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Проверить, что горячие запросы используют индексы."""
+    with db.engine.connect() as conn:
+        failures = check_query_plans(conn)
+    for name, detail in failures:
+        print(f'{name}: {detail}')
+    if failures:
+        raise SystemExit(1)
+    print('Все запросы используют индексы')
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(['hydrochemistry', 'feed', 'movement']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=1000, show_default=True)
+def import_data_command(kind, path, batch_size):
+    """Загрузить журнал из файла CSV или XLSX."""
+    file_format = 'xlsx' if path.lower().endswith('.xlsx') else 'csv'
+    with open(path, 'rb') as stream:
+        try:
+            report = import_rows(kind, stream, file_format, batch_size=batch_size)
+        except RowError as error:
+            raise click.ClickException(str(error))
+    for line, message in report.errors:
+        print(f'Строка {line}: {message}')
+    print(f'Добавлено: {report.inserted}, отклонено: {report.rejected}')
+
+@app.cli.command('rebuild-stock')
+def rebuild_stock_command():
+    """Пересчитать журнал запасов рыбы по бассейнам."""
+    rebuild_ledger(db.session)
+    db.session.commit()
+    print(f'Пересчитано записей: {PoolStock.query.count()}')
+
+@app.cli.command('rebuild-fcr')
+def rebuild_fcr_command():
+    """Пересчитать суточные итоги кормления и биомассы."""
+    rebuild_rollups(db.session)
+    db.session.commit()
+    print('Суточные итоги пересчитаны')
+
+@app.cli.command('rebuild-hydrochemistry')
+def rebuild_hydrochemistry_command():
+    """Пересчитать часовые и суточные сводки гидрохимии."""
+    rebuild_hydrochemistry_rollups(db.session)
+    # Сводки пишутся запросами Core в обход событий; по версиям графики перестроятся во всех процессах
+    bump_versions(db.session, ['hydrochemistry_hourly', 'hydrochemistry_daily'])
+    bump_all_periods(db.session)
+    db.session.commit()
+    print('Сводки гидрохимии пересчитаны')
+
+@app.cli.command('rebuild-latest')
+def rebuild_latest_command():
+    """Пересчитать последние значения гидрохимии по групповым бассейнам."""
+    rebuild_latest(db.session)
+    db.session.commit()
+    print('Последние значения гидрохимии пересчитаны')
+
+@app.cli.command('replay-ingest')
+def replay_ingest_command():
+    """Повторно сохранить измерения датчиков, которые прием не смог записать в БД."""
+    path = dead_letter_path(app)
+    if not os.path.exists(path):
+        print('Несохраненных измерений нет')
+        return
+    saved, left = replay_dead_letter(get_buffer(app), path)
+    print(f'Сохранено измерений: {saved}, осталось в {path}: {left}')
+
+@app.cli.command('archive-data')
+@click.option('--vacuum', is_flag=True, help='Сжать основную БД после переноса')
+def archive_data_command(vacuum):
+    """Перенести старые строки журналов в архив по срокам хранения."""
+    reports = apply_retention(app.config['RETENTION_HYDROCHEMISTRY_MONTHS'], app.config['RETENTION_FEED_YEARS'],
+                              app.config['RETENTION_MOVEMENT_YEARS'])
+    for table_name, report in reports.items():
+        print(f"{table_name}: перенесено строк {report['moved']}, частей архива {report['periods']}")
+        for start in report['skipped']:
+            print(f'  пропущен {datetime.fromtimestamp(start):%Y-%m}: сводки не сходятся с журналом')
+    if vacuum:
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('VACUUM')
+        print('Основная БД сжата')
+
+@app.cli.command('detect-anomalies')
+@click.option('--days', type=int, default=None, help='Пересчитать только последние N суток')
+def detect_anomalies_command(days):
+    """Пересчитать оценки аномальных измерений гидрохимии."""
+    start = int((datetime.now() - timedelta(days=days)).timestamp()) if days else None
+    found = detect_anomalies(start)
+    print(f'Найдено аномальных измерений: {found}')
+
+def parse_export_date(value, end=False):
+    if not value:
+        return None
+    timestamp = int(datetime.strptime(value, '%Y-%m-%d').timestamp())
+    # Конечная дата включается в период целиком
+    return timestamp + 86399 if end else timestamp
+
+@app.cli.command('export-data')
+@click.argument('kind', type=click.Choice(list(EXPORTS)))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--start', help='Начальная дата ГГГГ-ММ-ДД')
+@click.option('--end', help='Конечная дата ГГГГ-ММ-ДД включительно')
+def export_data_command(kind, path, start, end):
+    """Выгрузить журнал в CSV или Parquet (по расширению файла)."""
+    start_timestamp, end_timestamp = parse_export_date(start), parse_export_date(end, end=True)
+    if path.lower().endswith('.parquet'):
+        rows = write_parquet(kind, path, start_timestamp, end_timestamp)
+        print(f'Выгружено строк: {rows}')
+    else:
+        with open(path, 'w', encoding='utf-8', newline='') as target:
+            for chunk in generate_csv(kind, start_timestamp, end_timestamp):
+                target.write(chunk)
+        print(f'Журнал выгружен в {path}')
+
 # Add datetimeformat filter
 @app.template_filter('datetimeformat')
 def datetimeformat(value, format='%Y-%m-%d %H:%M:%S'):
@@ -42,34 +237,121 @@ def datetimeformat(value, format='%Y-%m-%d %H:%M:%S'):
 
 @app.route('/')
 def home():
-    return render_template('home.html')
+    alerts = active_alerts() if current_user.is_authenticated else []
+    return render_template('home.html', alerts=alerts, kinds=ALERT_KINDS)
+
+def active_alerts():
+    return Alert.query.options(joinedload(Alert.rule), joinedload(Alert.group_pool))\
+        .filter(Alert.resolved_at.is_(None)).order_by(Alert.started_at.desc()).all()
+
+@app.route('/alerts', methods=['GET', 'POST'])
+@login_required
+def alerts():
+    form = AlertRuleForm()
+    if form.validate_on_submit():
+        rule = AlertRule(name=form.name.data, parameter=form.parameter.data,
+                         group_pool_id=form.group_pool_id.data or None, kind=form.kind.data,
+                         operator=form.operator.data, threshold=form.threshold.data,
+                         window=(form.window.data or 0) * 60 if form.kind.data != 'threshold' else 0)
+        db.session.add(rule)
+        db.session.commit()
+        # Новое правило сразу проверяется по последним измерениям всех бассейнов
+        check_alerts(db.session, [gp_id for gp_id, in db.session.query(GroupPool.id)])
+        db.session.commit()
+        flash('Правило добавлено', 'success')
+        return redirect(url_for('alerts'))
+
+    rules = AlertRule.query.options(joinedload(AlertRule.group_pool)).order_by(AlertRule.parameter, AlertRule.id).all()
+    resolved = Alert.query.options(joinedload(Alert.rule), joinedload(Alert.group_pool))\
+        .filter(Alert.resolved_at.isnot(None)).order_by(Alert.resolved_at.desc()).limit(50).all()
+    return render_template('alerts.html', form=form, rules=rules, alerts=active_alerts(), resolved=resolved,
+                           kinds=ALERT_KINDS, parameters=dict(PARAMETER_CHOICES))
+
+@app.route('/alerts/rule/<int:rule_id>/delete', methods=['POST'])
+@login_required
+def delete_alert_rule(rule_id):
+    rule = AlertRule.query.get_or_404(rule_id)
+    db.session.delete(rule)
+    db.session.commit()
+    flash('Правило удалено', 'success')
+    return redirect(url_for('alerts'))
+
+def request_cursor():
+    """Курсор страницы из параметра after; некорректный курсор - ошибка 400."""
+    cursor = decode_cursor(request.args.get('after'))
+    if request.args.get('after') and cursor is None:
+        abort(400, 'Некорректный курсор страницы')
+    return cursor
+
+def journal_page(query, date_column, relations):
+    """Страница журнала по курсору (дата, id) вместе со строками архива.
+
+    Части архива открываются только начиная с даты курсора, как в API, поэтому
+    страницы после архивного периода файлы архива не читают.
+    """
+    table = date_column.class_.__table__
+    per_page = max(1, min(request.args.get('per_page', app.config['JOURNAL_PER_PAGE'], type=int), 1000))
+    cursor = request_cursor()
+    archived = archived_records(
+        table.name,
+        keyset_order(db.select(table), date_column, table.c.id, cursor).limit(per_page + 1),
+        relations, cursor[0] if cursor else None
+    )
+    records, next_cursor = keyset_page(query, date_column, date_column.class_.id, cursor=cursor,
+                                       per_page=per_page, extra=archived)
+    return records, next_cursor, {'per_page': per_page}
 
 @app.route('/hydrochemistry', methods=['GET', 'POST'])
 @login_required
 def hydrochemistry():
     filter_form = HydrochemistryFilterForm()
-    query = Hydrochemistry.query
+    # Групповые бассейны и их бассейны подгружаются пакетно для всей страницы
+    query = Hydrochemistry.query.options(
+        selectinload(Hydrochemistry.group_pool).selectinload(GroupPool.pools)
+    )
 
+    start_date = request.args.get('start', type=int)
+    end_date = request.args.get('end', type=int)
     if filter_form.validate_on_submit():
         start_date = int(filter_form.start_date.data.timestamp())
         end_date = int(filter_form.end_date.data.timestamp())
-        query = query.filter(Hydrochemistry.hydrochem_date >= start_date, Hydrochemistry.hydrochem_date <= end_date)
+    elif start_date is not None and end_date is not None:
+        filter_form.start_date.data = datetime.fromtimestamp(start_date)
+        filter_form.end_date.data = datetime.fromtimestamp(end_date)
+
+    date_filter = []
+    if start_date is not None and end_date is not None:
+        date_filter = [Hydrochemistry.hydrochem_date >= start_date, Hydrochemistry.hydrochem_date <= end_date]
+        query = query.filter(*date_filter)
 
         # Обработка сортировки
     sort_by = request.args.get('sort_by', 'hydrochem_date')  # По умолчанию сортируем по дате
     reverse = bool(request.args.get('reverse'))  # Если параметр reverse есть в URL, сортируем в обратном порядке
 
-    # Сортировка данных
-    if sort_by in ['hydrochem_date', 'doxy', 'temperature', 'ph', 'no2', 'no3', 'nh4', 'po4', 'salinity',
-                   'illumination']:
-        sort_attr = getattr(Hydrochemistry, sort_by)
-        if reverse:
-            query = query.order_by(sort_attr.desc())
-        else:
-            query = query.order_by(sort_attr)
-
-    records = query.all()
-    return render_template('hydrochemistry.html', records=records, filter_form=filter_form)
+    if sort_by not in ['hydrochem_date', 'doxy', 'temperature', 'ph', 'no2', 'no3', 'nh4', 'po4', 'salinity',
+                       'illumination']:
+        sort_by = 'hydrochem_date'
+
+    # Постраничный вывод по курсору (значение сортировки, id)
+    per_page = request.args.get('per_page', app.config['HYDROCHEMISTRY_PER_PAGE'], type=int)
+    per_page = max(1, min(per_page, 1000))
+    sort_attr = getattr(Hydrochemistry, sort_by)
+    cursor = request_cursor()
+    # Записи из архивных месяцев, попадающих в период, показываются вместе с остальными
+    archived = archived_hydrochemistry(
+        keyset_order(db.select(Hydrochemistry.__table__).where(*date_filter), sort_attr, Hydrochemistry.id,
+                     cursor, reverse).limit(per_page + 1),
+        start_date, end_date
+    )
+    records, next_cursor = keyset_page(query, sort_attr, Hydrochemistry.id, cursor=cursor,
+                                       reverse=reverse, per_page=per_page, extra=archived)
+    anomalies = anomaly_scores([record.id for record in records])
+
+    page_args = {'sort_by': sort_by, 'reverse': 'true' if reverse else None,
+                 'start': start_date, 'end': end_date, 'per_page': per_page}
+    return render_template('hydrochemistry.html', records=records, anomalies=anomalies, filter_form=filter_form,
+                           sort_by=sort_by, reverse=reverse, page_args=page_args, next_cursor=next_cursor,
+                           is_first_page=request.args.get('after') is None)
 
 @app.route('/hydrochemistry/new', methods=['GET', 'POST'])
 @login_required
@@ -94,7 +376,13 @@ def new_hydrochemistry():
                 illumination=(form.illumination.data)
             )
             db.session.add(record)
-            db.session.commit()
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Запись с тем же ключом могла появиться после проверки, например из приема данных
+                db.session.rollback()
+                flash('Басейн с таким названием уже существует для текущей даты', 'danger')
+                return render_template('edit_hydrochemistry.html', form=form)
             flash('Запись успешно добавленна', 'success')
             return redirect(url_for('hydrochemistry'))
     return render_template('edit_hydrochemistry.html', form=form)
@@ -108,8 +396,15 @@ def edit_hydrochemistry(record_id):
     form.hydrochem_date.data = datetime.fromtimestamp(record.hydrochem_date)
 
     if form.validate_on_submit():
+        hydrochem_date = int(form.hydrochem_date.data.timestamp())
+        duplicate = Hydrochemistry.query.filter(Hydrochemistry.group_pool_id == form.group_pool_id.data,
+                                                Hydrochemistry.hydrochem_date == hydrochem_date,
+                                                Hydrochemistry.id != record.id).first()
+        if duplicate:
+            flash('Для этого группового бассейна уже есть запись на эту дату', 'danger')
+            return render_template('edit_hydrochemistry.html', form=form, record=record)
         record.group_pool_id = form.group_pool_id.data
-        record.hydrochem_date = int(form.hydrochem_date.data.timestamp())
+        record.hydrochem_date = hydrochem_date
         record.doxy = (form.doxy.data)
         record.temperature = (form.temperature.data)
         record.ph = (form.ph.data)
@@ -119,7 +414,13 @@ def edit_hydrochemistry(record_id):
         record.po4 = (form.po4.data)
         record.salinity = (form.salinity.data)
         record.illumination = (form.illumination.data)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Запись с тем же ключом могла появиться после проверки, например из приема данных
+            db.session.rollback()
+            flash('Для этого группового бассейна уже есть запись на эту дату', 'danger')
+            return render_template('edit_hydrochemistry.html', form=form, record=record)
         flash('Запись гидрохимии успешно обновлена', 'success')
         return redirect(url_for('hydrochemistry'))
     return render_template('edit_hydrochemistry.html', form=form, record=record)
@@ -138,29 +439,19 @@ def delete_hydrochemistry(record_id):
     return redirect(url_for('hydrochemistry'))
 
 
-@app.route('/pools', methods=['GET', 'POST'])
+@app.route('/pools')
 @login_required
 def pools():
     pool_form = PoolForm()
     group_pool_form = GroupPoolForm()
-    pool_selection_form = PoolSelectionForm()
     pools = Pool.query.all()
     group_pools = GroupPool.query.all()
-    latest_hydrochemistry = None
-
-    if pool_selection_form.validate_on_submit():
-        selected_pool_id = pool_selection_form.pool_id.data
-        latest_hydrochemistry = Hydrochemistry.query\
-            .join(GroupPool)\
-            .join(group_pool_pool)\
-            .join(Pool)\
-            .filter(Pool.id == selected_pool_id)\
-            .order_by(Hydrochemistry.hydrochem_date.desc())\
-            .first()
+    # Текущее состояние воды всех бассейнов - одно чтение таблицы последних значений
+    status = water_status()
 
     return render_template('pools.html', pools=pools, group_pools=group_pools,
                            pool_form=pool_form, group_pool_form=group_pool_form,
-                           pool_selection_form=pool_selection_form, latest_hydrochemistry=latest_hydrochemistry)
+                           water_status=status, parameters=PARAMETER_CHOICES)
 
 @app.route('/pool/new', methods=['GET', 'POST'])
 @login_required
@@ -308,16 +599,41 @@ def edit_fish_type(fish_type_id):
 @app.route('/inventory')
 @login_required
 def inventory():
-    fish_inventories = FishInventory.query.all()
-    fish_bonings = FishBoning.query.all()
-    return render_template('inventory.html', fish_inventories=fish_inventories, fish_bonings=fish_bonings, title='Инвентаризация')
+    filter_form = InventoryFilterForm(request.args)
+    # Бассейны, виды рыбы и навески страницы подгружаются пакетно, а не по одной записи
+    query = FishInventory.query.options(selectinload(FishInventory.pool), selectinload(FishInventory.fish_type),
+                                        selectinload(FishInventory.fish_bonings))
+    if filter_form.validate():
+        if filter_form.pool_id.data:
+            query = query.filter(FishInventory.pool_id == filter_form.pool_id.data)
+        if filter_form.fish_type_id.data:
+            query = query.filter(FishInventory.fish_type_id == filter_form.fish_type_id.data)
+        if filter_form.start_date.data:
+            start_day = datetime.combine(filter_form.start_date.data, datetime.min.time())
+            query = query.filter(FishInventory.control_date >= int(start_day.timestamp()))
+        if filter_form.end_date.data:
+            end_day = datetime.combine(filter_form.end_date.data + timedelta(days=1), datetime.min.time())
+            query = query.filter(FishInventory.control_date < int(end_day.timestamp()))
+
+    # Новые инвентаризации первыми, постранично по курсору (дата, id)
+    per_page = max(1, min(request.args.get('per_page', app.config['INVENTORY_PER_PAGE'], type=int), 1000))
+    fish_inventories, next_cursor = keyset_page(query, FishInventory.control_date, FishInventory.id,
+                                                cursor=request_cursor(), reverse=True,
+                                                per_page=per_page)
+    totals = boning_totals([fish_inventory.id for fish_inventory in fish_inventories])
+
+    page_args = {key: value for key, value in request.args.items() if key not in ('after', 'submit')}
+    return render_template('inventory.html', fish_inventories=fish_inventories, totals=totals,
+                           filter_form=filter_form, page_args=page_args, next_cursor=next_cursor,
+                           is_first_page=request.args.get('after') is None, title='Инвентаризация')
+
 
 @app.route('/fish_inventory/new', methods=['GET', 'POST'])
 @login_required
 def new_fish_inventory():
     form = FishInventoryForm()
-    form.pool_id.choices = [(pool.id, pool.name) for pool in Pool.query.all()]
-    form.fish_type_id.choices = [(fish_type.id, fish_type.name) for fish_type in FishType.query.all()]
+    form.pool_id.choices = choices('pools')
+    form.fish_type_id.choices = choices('fish_types')
     if form.validate_on_submit():
         fish_inventory = FishInventory(
             control_date=int(form.control_date.data.timestamp()),
@@ -337,8 +653,8 @@ def new_fish_inventory():
 def edit_fish_inventory(inventory_id):
     fish_inventory = FishInventory.query.get_or_404(inventory_id)
     form = FishInventoryForm(obj=fish_inventory)
-    form.pool_id.choices = [(pool.id, pool.name) for pool in Pool.query.all()]
-    form.fish_type_id.choices = [(fish_type.id, fish_type.name) for fish_type in FishType.query.all()]
+    form.pool_id.choices = choices('pools')
+    form.fish_type_id.choices = choices('fish_types')
 
     # Преобразуем дату из UNIX timestamp в datetime, если форма инициализируется данными из записи
     if request.method == 'GET':
@@ -373,7 +689,9 @@ def delete_fish_inventory(inventory_id):
 @login_required
 def new_fish_boning():
     form = FishBoningForm()
-    form.fish_inventory_id.choices = [(fish_inventory.id, f"{fish_inventory.pool.name} - {datetime.fromtimestamp(fish_inventory.control_date).strftime('%Y-%m-%d %H:%M:%S')}") for fish_inventory in FishInventory.query.all()]
+    form.fish_inventory_id.choices = choices('inventories')
+    if request.method == 'GET':
+        form.fish_inventory_id.data = request.args.get('fish_inventory_id', type=int)
     if form.validate_on_submit():
         fish_boning = FishBoning(
             fish_inventory_id=form.fish_inventory_id.data,
@@ -392,7 +710,7 @@ def new_fish_boning():
 def edit_fish_boning(boning_id):
     fish_boning = FishBoning.query.get_or_404(boning_id)
     form = FishBoningForm(obj=fish_boning)
-    form.fish_inventory_id.choices = [(fi.id, f"{fi.pool.name} - {datetime.fromtimestamp(fi.control_date).strftime('%Y-%m-%d %H:%M:%S')}") for fi in FishInventory.query.all()]
+    form.fish_inventory_id.choices = choices('inventories')
 
     if form.validate_on_submit():
         fish_boning.fish_inventory_id = form.fish_inventory_id.data
@@ -421,8 +739,13 @@ def delete_fish_boning(boning_id):
 @login_required
 def feeding():
     feed_types = FeedType.query.all()
-    feeds = Feed.query.all()
-    return render_template('feeding.html', feed_types=feed_types, feeds=feeds)
+    query = Feed.query.options(selectinload(Feed.pool), selectinload(Feed.feed_type))
+    feeds, next_cursor, page_args = journal_page(query, Feed.feed_date, {
+        'pool': (Pool, 'pool_id'),
+        'feed_type': (FeedType, 'feed_type_id'),
+    })
+    return render_template('feeding.html', feed_types=feed_types, feeds=feeds, page_args=page_args,
+                           next_cursor=next_cursor, is_first_page=request.args.get('after') is None)
 
 @app.route('/feed_type/new', methods=['GET', 'POST'])
 @login_required
@@ -440,8 +763,8 @@ def new_feed_type():
 @login_required
 def new_feed():
     form = FeedForm()
-    form.pool_id.choices = [(pool.id, pool.name) for pool in Pool.query.all()]
-    form.feed_type_id.choices = [(feed_type.id, feed_type.name) for feed_type in FeedType.query.all()]
+    form.pool_id.choices = choices('pools')
+    form.feed_type_id.choices = choices('feed_types')
     if form.validate_on_submit():
         feed = Feed(
             pool_id=form.pool_id.data,
@@ -463,8 +786,8 @@ def edit_feed(feed_id):
     form = FeedForm(obj=feed)
     # Преобразуем дату из UNIX timestamp в datetime, если форма инициализируется данными из записи
     form.feed_date.data = datetime.fromtimestamp(feed.feed_date)
-    form.pool_id.choices = [(pool.id, pool.name) for pool in Pool.query.all()]
-    form.feed_type_id.choices = [(feed_type.id, feed_type.name) for feed_type in FeedType.query.all()]
+    form.pool_id.choices = choices('pools')
+    form.feed_type_id.choices = choices('feed_types')
 
     if form.validate_on_submit():
         feed.pool_id = form.pool_id.data
@@ -521,16 +844,23 @@ def delete_feed_type(feed_type_id):
 @app.route('/movement')
 @login_required
 def movement():
-    movements = FishMovement.query.all()
-    return render_template('movement.html', movements=movements)
+    query = FishMovement.query.options(selectinload(FishMovement.pool_from), selectinload(FishMovement.pool_to),
+                                       selectinload(FishMovement.fish_type))
+    movements, next_cursor, page_args = journal_page(query, FishMovement.movement_date, {
+        'pool_from': (Pool, 'pool_id_from'),
+        'pool_to': (Pool, 'pool_id_to'),
+        'fish_type': (FishType, 'fish_type_id'),
+    })
+    return render_template('movement.html', movements=movements, page_args=page_args, next_cursor=next_cursor,
+                           is_first_page=request.args.get('after') is None)
 
 @app.route('/fish_movement/new', methods=['GET', 'POST'])
 @login_required
 def new_fish_movement():
     form = FishMovementForm()
-    form.pool_id_from.choices = [(pool.id, pool.name) for pool in Pool.query.all()]
-    form.pool_id_to.choices = [(pool.id, pool.name) for pool in Pool.query.all()]
-    form.fish_type_id.choices = [(fish_type.id, fish_type.name) for fish_type in FishType.query.all()]
+    form.pool_id_from.choices = choices('pools')
+    form.pool_id_to.choices = choices('pools')
+    form.fish_type_id.choices = choices('fish_types')
     if form.validate_on_submit():
         if form.pool_id_from.data == form.pool_id_to.data:
             flash('Басейны совпадают', 'danger')
@@ -555,9 +885,9 @@ def new_fish_movement():
 def edit_fish_movement(movement_id):
     fish_movement = FishMovement.query.get_or_404(movement_id)
     form = FishMovementForm(obj=fish_movement)
-    form.pool_id_from.choices = [(pool.id, pool.name) for pool in Pool.query.all()]
-    form.pool_id_to.choices = [(pool.id, pool.name) for pool in Pool.query.all()]
-    form.fish_type_id.choices = [(fish_type.id, fish_type.name) for fish_type in FishType.query.all()]
+    form.pool_id_from.choices = choices('pools')
+    form.pool_id_to.choices = choices('pools')
+    form.fish_type_id.choices = choices('fish_types')
 
     # Преобразуем дату из UNIX timestamp в datetime, если форма инициализируется данными из записи
     if request.method == 'GET':
@@ -596,96 +926,235 @@ def delete_fish_movement(movement_id):
 @app.route('/fish_composition', methods=['GET'])
 @login_required
 def fish_composition():
-    # Получение последней инвентаризации для каждого бассейна
-    subquery = db.session.query(
-        FishInventory.pool_id,
-        FishInventory.fish_type_id,
-        db.func.max(FishInventory.control_date).label('latest_date')
-    ).group_by(FishInventory.pool_id, FishInventory.fish_type_id).subquery()
-
-    latest_inventories = db.session.query(FishInventory).join(
-        subquery,
-        db.and_(
-            FishInventory.pool_id == subquery.c.pool_id,
-            FishInventory.fish_type_id == subquery.c.fish_type_id,
-            FishInventory.control_date == subquery.c.latest_date
-        )
-    ).all()
-
-    fish_data = {}
-
-    for inventory in latest_inventories:
-        pool_id = inventory.pool_id
-        fish_type_id = inventory.fish_type_id
-        fish_type_name = inventory.fish_type.name
-
-        bonings = FishBoning.query.filter_by(fish_inventory_id=inventory.id).all()
-        total_count = sum(boning.fish_number for boning in bonings)
-        total_mass = sum(boning.fish_biomass for boning in bonings)
-
-        if fish_type_name not in fish_data:
-            fish_data[fish_type_name] = {
-                'total_count': 0,
-                'total_mass': 0,
-                'pools': set()
-            }
+    # Последние инвентаризации по бассейнам считаются одним сгруппированным запросом
+    fish_data = stock_by_fish_type()
+    return render_template('fish_composition.html', fish_data=fish_data, enumerate=enumerate, map=map)
 
-        fish_data[fish_type_name]['total_count'] += total_count
-        fish_data[fish_type_name]['total_mass'] += total_mass
-        pool_name = Pool.query.filter_by(id=pool_id).first()
-        fish_data[fish_type_name]['pools'].add(pool_name.name)
+@app.route('/stock')
+@login_required
+def stock():
+    stocks = PoolStock.query.options(selectinload(PoolStock.pool), selectinload(PoolStock.fish_type))\
+        .join(Pool).order_by(Pool.name, PoolStock.fish_type_id).all()
+    return render_template('stock.html', stocks=stocks)
 
-    return render_template('fish_composition.html', fish_data=fish_data, enumerate=enumerate, map=map)
+@app.route('/stock/<int:pool_id>')
+@login_required
+def pool_stock(pool_id):
+    # Момент времени - UNIX timestamp в параметре at, по умолчанию текущий
+    timestamp = request.args.get('at', int(datetime.now().timestamp()), type=int)
+    biomass = stock_at(pool_id, timestamp)
+    return jsonify({'pool_id': pool_id, 'at': timestamp,
+                    'biomass': {str(fish_type_id): value for fish_type_id, value in biomass.items()}})
+
+@app.route('/fcr', methods=['GET', 'POST'])
+@login_required
+def fcr():
+    form = FcrForm()
+    intervals, weeks, plot = [], [], None
+    if form.validate_on_submit():
+        start_day = int(datetime.combine(form.start_date.data, datetime.min.time()).timestamp())
+        end_day = int(datetime.combine(form.end_date.data, datetime.min.time()).timestamp())
+        intervals, weeks = fcr_report(start_day, end_day, pool_id=form.pool_id.data or None)
+        pools = reference_cache.names('pools')
+        fish_types = reference_cache.names('fish_types')
+        for row in intervals + weeks:
+            row['pool'] = pools.get(row['pool_id'])
+            row['fish_type'] = fish_types.get(row['fish_type_id'])
+        if weeks:
+            plot = create_fcr_plot(weeks)
+    return render_template('fcr.html', form=form, intervals=intervals, weeks=weeks, plot=plot,
+                           plotly_version=plotly_version() if plot else None)
+
+
+def create_fcr_plot(weeks):
+    import plotly.graph_objs as go
+    import plotly.offline as pyo
+
+    series = {}
+    for row in weeks:
+        x, y = series.setdefault(f"{row['pool']} - {row['fish_type']}", ([], []))
+        x.append(datetime.fromtimestamp(row['week']))
+        y.append(row['fcr'])
+    traces = [go.Scatter(x=x, y=y, mode='lines+markers', name=name) for name, (x, y) in series.items()]
+    layout = go.Layout(title='Кормовой коэффициент по неделям', xaxis=dict(title='Неделя'),
+                       yaxis=dict(title='Кормовой коэффициент'))
+    # Сам Plotly.js подключается в шаблоне из /plotly.min.js и кэшируется браузером
+    return pyo.plot(go.Figure(data=traces, layout=layout), output_type='div', include_plotlyjs=False)
 
 @app.route('/hydrochemistry/generate', methods=['GET', 'POST'])
 @login_required
 def generate_journal():
-    group_pools = GroupPool.query.all()
+    group_pools = GroupPool.query.options(selectinload(GroupPool.pools)).all()
     current_date = datetime.utcnow()
-    record_add = 0
-    if request.method == 'POST':
-        for gp in group_pools:
-            if request.form.get(f'select_{gp.id}'):
-                date_str = request.form.get(f'date_{gp.id}')
-                try:
-                    datetime_obj = datetime.strptime(date_str, '%Y-%m-%dT%H:%M')
-                except ValueError:
-                    flash(f'Некорректный формат даты для группового бассейна {gp.name}', 'danger')
-                    continue
-
-                def get_float_value(field_name):
-                    value = request.form.get(field_name)
-                    return float(value) if value else None
-
-                record = Hydrochemistry(
-                    group_pool_id=gp.id,
-                    hydrochem_date=int(datetime_obj.timestamp()),
-                    doxy=get_float_value(f'doxy_{gp.id}'),
-                    temperature=get_float_value(f'temperature_{gp.id}'),
-                    ph=get_float_value(f'ph_{gp.id}'),
-                    no2=get_float_value(f'no2_{gp.id}'),
-                    no3=get_float_value(f'no3_{gp.id}'),
-                    nh4=get_float_value(f'nh4_{gp.id}'),
-                    po4=get_float_value(f'po4_{gp.id}'),
-                    salinity=get_float_value(f'salinity_{gp.id}'),
-                    illumination=get_float_value(f'illumination_{gp.id}')
-                )
-                db.session.add(record)
-                record_add = record_add + 1
-        db.session.commit()
-        if record_add == 0:
-            flash('Ни одна запись не добавлена', 'danger')
+    form = JournalForm()
+    errors = {}
+    if request.method == 'POST' and not form.validate():
+        flash('Форма устарела, обновите страницу и отправьте журнал еще раз', 'danger')
+    elif request.method == 'POST':
+        # Все строки проверяются заранее и сохраняются одной вставкой либо не сохраняются вовсе
+        rows, errors = parse_journal_form(request.form, group_pools)
+        if not errors:
+            errors = save_journal(rows, group_pools)
+        if errors:
+            for message in errors.values():
+                flash(message, 'danger')
+            flash('Журнал не сохранен, исправьте ошибки', 'danger')
         else:
-            flash('Журнал успешно создан', 'success')
-        return redirect(url_for('hydrochemistry'))
-    return render_template('generate_journal.html', group_pools=group_pools, current_date=current_date)
+            if rows:
+                flash('Журнал успешно создан', 'success')
+            else:
+                flash('Ни одна запись не добавлена', 'danger')
+            return redirect(url_for('hydrochemistry'))
+    return render_template('generate_journal.html', form=form, group_pools=group_pools, current_date=current_date,
+                           errors=errors, form_data=request.form)
 
+@app.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_data():
+    form = ImportForm()
+    if request.method == 'GET' and request.args.get('kind'):
+        form.kind.data = request.args.get('kind')
+    report = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        file_format = 'xlsx' if upload.filename.lower().endswith('.xlsx') else 'csv'
+        try:
+            report = import_rows(form.kind.data, upload.stream, file_format)
+        except RowError as error:
+            flash(str(error), 'danger')
+        else:
+            if report.inserted:
+                flash(f'Добавлено записей: {report.inserted}', 'success')
+            if report.rejected:
+                flash(f'Отклонено строк: {report.rejected}', 'danger')
+    return render_template('import_data.html', form=form, report=report)
+
+def export_response(kind, file_format, start_timestamp, end_timestamp):
+    filename = f'{kind}.{file_format}'
+    if file_format == 'parquet':
+        # Группы строк уходят клиенту по мере записи, файл целиком нигде не собирается
+        return Response(stream_with_context(generate_parquet(kind, start_timestamp, end_timestamp)),
+                        mimetype='application/vnd.apache.parquet',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+    return Response(stream_with_context(generate_csv(kind, start_timestamp, end_timestamp)),
+                    mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/export', methods=['GET', 'POST'])
+@login_required
+def export_data():
+    form = ExportForm()
+    if form.validate_on_submit():
+        start_timestamp = end_timestamp = None
+        if form.start_date.data:
+            start_timestamp = int(datetime.combine(form.start_date.data, datetime.min.time()).timestamp())
+        if form.end_date.data:
+            end_timestamp = int(datetime.combine(form.end_date.data, datetime.min.time()).timestamp()) + 86399
+        return export_response(form.kind.data, form.file_format.data, start_timestamp, end_timestamp)
+    return render_template('export_data.html', form=form)
+
+@app.route('/export/<kind>.<file_format>')
+@login_required
+def export_file(kind, file_format):
+    if kind not in EXPORTS or file_format not in ('csv', 'parquet'):
+        abort(404)
+    try:
+        start_timestamp = parse_export_date(request.args.get('start'))
+        end_timestamp = parse_export_date(request.args.get('end'), end=True)
+    except ValueError:
+        abort(400)
+    return export_response(kind, file_format, start_timestamp, end_timestamp)
+
+def bearer_authorized(tokens):
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):] if header.startswith('Bearer ') else ''
+    return bool(token) and any(hmac.compare_digest(token, allowed) for allowed in tokens)
+
+def ingest_authorized():
+    return bearer_authorized(app.config['INGEST_TOKENS'])
+
+@app.route('/ready')
+def ready():
+    # Для запускающего скрипта: 200, когда приложение готово принимать запросы
+    state = readiness()
+    return jsonify(state), 200 if state['ready'] else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Сборщик метрик входит по токену, пользователь - по обычному логину
+    if not (current_user.is_authenticated or bearer_authorized(app.config['METRICS_TOKENS'])):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def api_authorized():
+    # Токен проверяется первым: без cookie сессии пользователь не загружается из БД
+    return bearer_authorized(app.config['API_TOKENS']) or current_user.is_authenticated
+
+def api_response(collection, build):
+    if not api_authorized():
+        return jsonify({'error': 'Требуется вход или токен API'}), 401
+    if collection not in API_COLLECTIONS:
+        return jsonify({'error': 'Неизвестная коллекция', 'collections': list(API_COLLECTIONS)}), 404
+    table_name = API_COLLECTIONS[collection][0].__table__.name
+    # Неизменившаяся коллекция отвечает 304 после одного запроса к версии таблицы в БД,
+    # без чтения самой коллекции
+    current = validators(table_name)
+    if not_modified(request, current):
+        return set_validators(Response(status=304), current)
+    try:
+        body = build()
+    except ApiError as error:
+        return jsonify({'error': str(error)}), 400
+    if body is None:
+        return jsonify({'error': 'Запись не найдена'}), 404
+    return compress(set_validators(jsonify(body), current), request)
+
+@app.route('/api/v1/<collection>')
+def api_collection(collection):
+    return api_response(collection, lambda: collection_page(collection, request.args))
+
+@app.route('/api/v1/<collection>/<int:record_id>')
+def api_record(collection, record_id):
+    return api_response(collection, lambda: collection_record(collection, record_id, request.args))
+
+@app.route('/api/ingest/hydrochemistry', methods=['POST'])
+def ingest_hydrochemistry():
+    if not ingest_authorized():
+        return jsonify({'error': 'Требуется токен датчика'}), 401
+    payload = request.get_json(silent=True)
+    readings = payload.get('readings') if isinstance(payload, dict) else payload
+    if not isinstance(readings, list):
+        return jsonify({'error': 'Ожидается список измерений'}), 400
+
+    buffer = get_buffer(app)
+    group_pool_ids = buffer.group_pool_ids()
+    rows, rejected = [], []
+    for index, reading in enumerate(readings):
+        try:
+            rows.append(parse_reading(reading, group_pool_ids))
+        except ReadingError as error:
+            rejected.append({'index': index, 'error': str(error)})
+
+    # Измерения ставятся в очередь, запись в БД идет в отдельном потоке
+    accepted = buffer.submit(rows)
+    body = {'accepted': accepted, 'rejected': rejected}
+    if accepted < len(rows):
+        # Повторная отправка безопасна: совпадающие измерения не дублируются
+        body['error'] = 'Очередь заполнена, повторите отправку позже'
+        return jsonify(body), 503, {'Retry-After': '1'}
+    return jsonify(body), 202
+
+@app.route('/api/ingest/status')
+def ingest_status():
+    if not ingest_authorized():
+        return jsonify({'error': 'Требуется токен датчика'}), 401
+    return jsonify(get_buffer(app).stats())
 
 @app.route('/plot_graph', methods=['GET', 'POST'])
 @login_required
 def plot_graph():
     form = HydrochemistryGraphForm()
-    plot = None
+    series_url = None
     parameter_display_name = None
 
     if form.validate_on_submit():
@@ -697,35 +1166,120 @@ def plot_graph():
         # Convert dates to Unix timestamp
         start_timestamp = int(datetime.combine(start_date, datetime.min.time()).timestamp())
         end_timestamp = int(datetime.combine(end_date, datetime.min.time()).timestamp())
+        # Серии загружает и рисует страница, сервер отдает только двоичные массивы
+        series_url = url_for('hydrochemistry_series', parameter=parameter, start=start_timestamp, end=end_timestamp)
 
-        data = Hydrochemistry.query.filter(Hydrochemistry.hydrochem_date.between(start_timestamp, end_timestamp)).all()
-
-        if data:
-            plot = create_plot(data, parameter, parameter_display_name)
-
-    return render_template('plot_graph.html', form=form, plot=plot, parameter_display_name=parameter_display_name)
-
+    return render_template('plot_graph.html', form=form, series_url=series_url,
+                           parameter_display_name=parameter_display_name, plotly_version=plotly_version())
 
-def create_plot(data, parameter, parameter_display_name):
-    traces = []
-    pool_ids = {record.group_pool_id for record in data}
-    pools = {pool.id: pool.name for pool in GroupPool.query.filter(GroupPool.id.in_(pool_ids)).all()}
 
-    for pool_id in pools:
-        pool_data = [record for record in data if record.group_pool_id == pool_id]
-        pool_data.sort(key=lambda x: x.hydrochem_date)
-        x = [datetime.fromtimestamp(record.hydrochem_date) for record in pool_data]
-        y = [getattr(record, parameter) for record in pool_data]
-
-        traces.append(go.Scatter(x=x, y=y, mode='lines', name=pools[pool_id]))
+@app.route('/plot_graph/cache')
+@login_required
+def plot_cache_stats():
+    return jsonify(plot_cache.stats())
+
+
+def series_payload(parameter, start_timestamp, end_timestamp):
+    """Серии параметра в формате columnar.encode_series из кэша или из БД."""
+    # Модули на NumPy загружаются с первым графиком, а не при запуске приложения
+    from downsample import downsample_series
+
+    cache_key = plot_cache.make_key(parameter, start_timestamp, end_timestamp,
+                                    version=source_version(db.session, start_timestamp, end_timestamp))
+    payload = plot_cache.get(cache_key)
+    if payload is None:
+        series = downsample_series(parameter, start_timestamp, end_timestamp,
+                                   budget=app.config['PLOT_POINT_BUDGET'])
+        anomalies = anomaly_points(parameter, start_timestamp, end_timestamp, list(series)) if series else {}
+        payload = encode_series(series, reference_cache.names('group_pools'), anomalies,
+                                parameter=parameter, start=start_timestamp, end=end_timestamp)
+        plot_cache.put(cache_key, payload)
+    return payload
+
+
+@app.route('/api/v1/hydrochemistry/series')
+def hydrochemistry_series():
+    if not api_authorized():
+        return jsonify({'error': 'Требуется вход или токен API'}), 401
+    parameter = request.args.get('parameter')
+    if parameter not in dict(PARAMETER_CHOICES):
+        return jsonify({'error': 'Неизвестный параметр', 'parameters': [name for name, _ in PARAMETER_CHOICES]}), 400
+    try:
+        start_timestamp = parse_timestamp(request.args, 'start')
+        end_timestamp = parse_timestamp(request.args, 'end')
+    except ApiError as error:
+        return jsonify({'error': str(error)}), 400
+    if start_timestamp is None or end_timestamp is None:
+        return jsonify({'error': 'Параметры start и end обязательны'}), 400
+    response = Response(series_payload(parameter, start_timestamp, end_timestamp), mimetype=SERIES_CONTENT_TYPE)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return compress(response, request)
+
+
+@app.route('/dashboard', methods=['GET', 'POST'])
+@login_required
+def dashboard():
+    form = DashboardForm()
+    data_url = None
+    if form.validate_on_submit():
+        start_timestamp = int(datetime.combine(form.start_date.data, datetime.min.time()).timestamp())
+        end_timestamp = int(datetime.combine(form.end_date.data, datetime.min.time()).timestamp())
+        data_url = url_for('hydrochemistry_dashboard', start=start_timestamp, end=end_timestamp)
+    return render_template('dashboard.html', form=form, data_url=data_url, plotly_version=plotly_version())
 
-    layout = go.Layout(title=f'{parameter_display_name} по времени', xaxis=dict(title='Время'),
-                       yaxis=dict(title=parameter_display_name))
-    fig = go.Figure(data=traces, layout=layout)
 
-    return pyo.plot(fig, output_type='div')
+@app.route('/api/v1/hydrochemistry/dashboard')
+def hydrochemistry_dashboard():
+    """Все параметры за период одним запросом: ряды, статистика и корреляции для панели сравнения."""
+    if not api_authorized():
+        return jsonify({'error': 'Требуется вход или токен API'}), 401
+    try:
+        start_timestamp = parse_timestamp(request.args, 'start')
+        end_timestamp = parse_timestamp(request.args, 'end')
+    except ApiError as error:
+        return jsonify({'error': str(error)}), 400
+    if start_timestamp is None or end_timestamp is None:
+        return jsonify({'error': 'Параметры start и end обязательны'}), 400
+    # В кэше графиков панель хранится под отдельным ключом и сбрасывается теми же изменениями журнала
+    cache_key = plot_cache.make_key('dashboard', start_timestamp, end_timestamp,
+                                    version=source_version(db.session, start_timestamp, end_timestamp))
+    payload = plot_cache.get(cache_key)
+    if payload is None:
+        from dashboard import dashboard_payload
+        payload = dashboard_payload(start_timestamp, end_timestamp, reference_cache.names('group_pools'),
+                                    budget=app.config['DASHBOARD_POINT_BUDGET'], labels=dict(PARAMETER_CHOICES))
+        plot_cache.put(cache_key, payload)
+    response = Response(payload, mimetype=SERIES_CONTENT_TYPE)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return compress(response, request)
+
+
+def plotly_version():
+    import plotly
+    return plotly.__version__
+
+
+_plotly_js = {}
+
+
+@app.route('/plotly.min.js')
+def plotly_js():
+    # Библиотека не меняется без обновления пакета: версия в адресе, кэш браузера на год.
+    # Сжатый вариант готовится один раз на процесс
+    if not _plotly_js:
+        from plotly.offline import get_plotlyjs
+        body = get_plotlyjs().encode('utf-8')
+        _plotly_js.update({None: body, 'gzip': gzip.compress(body, compresslevel=9)})
+    encoding = request.accept_encodings.best_match(['gzip'])
+    response = Response(_plotly_js[encoding], mimetype='application/javascript')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 if __name__ == '__main__':
     with app.app_context():
         create_tables()
+    mark_ready()
     app.run(debug=True)
@@ -0,0 +1,187 @@
+import os
+import sqlite3
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy import create_engine, select, func, MetaData, Table, Column, Index
+from sqlalchemy.orm import selectinload
+
+from models import db, Hydrochemistry, Feed, FishMovement, GroupPool, ArchivePartition
+from versions import bump
+
+# Архивируемые журналы: таблица -> (модель, столбец даты, длина части архива)
+ARCHIVES = {
+    'hydrochemistry': (Hydrochemistry, Hydrochemistry.hydrochem_date, 'month'),
+    'feed': (Feed, Feed.feed_date, 'year'),
+    'fish_movement': (FishMovement, FishMovement.movement_date, 'year'),
+}
+
+_engines = {}
+
+
+def period_start(timestamp, period):
+    date = datetime.fromtimestamp(timestamp).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if period == 'year':
+        date = date.replace(month=1)
+    return int(date.timestamp())
+
+
+def next_period(start, period):
+    date = datetime.fromtimestamp(start)
+    if period == 'year':
+        date = date.replace(year=date.year + 1)
+    elif date.month == 12:
+        date = date.replace(year=date.year + 1, month=1)
+    else:
+        date = date.replace(month=date.month + 1)
+    return int(date.timestamp())
+
+
+def archive_dir():
+    return current_app.config.get('ARCHIVE_DIR') or os.path.join(current_app.instance_path, 'archive')
+
+
+def archive_file(table_name, start):
+    _, _, period = ARCHIVES[table_name]
+    suffix = datetime.fromtimestamp(start).strftime('%Y-%m' if period == 'month' else '%Y')
+    return f'{table_name}-{suffix}.sqlite3'
+
+
+def archive_engine(path):
+    # Части архива читаются отдельными соединениями только на чтение
+    engine = _engines.get(path)
+    if engine is None:
+        engine = _engines[path] = create_engine(f'sqlite:///file:{path}?mode=ro&uri=true')
+    return engine
+
+
+def partitions(table_name, start_timestamp=None, end_timestamp=None, executor=None):
+    """Части архива журнала, пересекающиеся с периодом, от старых к новым."""
+    executor = executor or db.session
+    query = select(ArchivePartition).where(ArchivePartition.table_name == table_name)
+    if start_timestamp is not None:
+        query = query.where(ArchivePartition.period_end > start_timestamp)
+    if end_timestamp is not None:
+        query = query.where(ArchivePartition.period_start <= end_timestamp)
+    return [row[0] for row in executor.execute(query.order_by(ArchivePartition.period_start))]
+
+
+def archive_connections(table_name, start_timestamp=None, end_timestamp=None, executor=None):
+    """Соединения с частями архива, пересекающимися с периодом.
+
+    В файле архива таблица называется так же, как в основной БД, поэтому
+    к соединению применимы те же запросы, что и к основной БД.
+    """
+    directory = archive_dir()
+    for partition in partitions(table_name, start_timestamp, end_timestamp, executor):
+        with archive_engine(os.path.join(directory, partition.path)).connect() as conn:
+            yield conn
+
+
+def archive_horizon(table_name, executor=None):
+    """Конец самой поздней части архива журнала или None, если архива нет."""
+    executor = executor or db.session
+    return executor.execute(
+        select(func.max(ArchivePartition.period_end)).where(ArchivePartition.table_name == table_name)
+    ).scalar()
+
+
+def archive_table(table, schema):
+    # Копия таблицы без внешних ключей: справочников в файле архива нет
+    copy = Table(table.name, MetaData(), *[Column(column.name, column.type, primary_key=column.primary_key,
+                                                  nullable=column.nullable) for column in table.columns],
+                 schema=schema)
+    for index in table.indexes:
+        Index(index.name, *[copy.c[column.name] for column in index.columns])
+    return copy
+
+
+def move_to_archive(conn, table_name, start, end, *conditions):
+    """Переносит строки журнала за [start, end) в файл части архива и удаляет их из основной БД.
+
+    Файл подключается к соединению основной БД через ATTACH, поэтому копирование
+    и удаление выполняются одной транзакцией. Возвращает число перенесенных строк.
+    """
+    model, date_column, _ = ARCHIVES[table_name]
+    table = model.__table__
+    directory = archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = archive_file(table_name, start)
+
+    where = db.and_(date_column >= start, date_column < end, *conditions)
+    if conn.execute(select(table.c.id).where(where).limit(1)).first() is None:
+        return 0
+    conn.exec_driver_sql('ATTACH DATABASE ? AS archive', (os.path.join(directory, path),))
+    try:
+        target = archive_table(table, 'archive')
+        target.create(conn, checkfirst=True)
+        conn.execute(target.insert().prefix_with('OR REPLACE').from_select(
+            [column.name for column in table.columns], select(table).where(where)))
+        moved = conn.execute(table.delete().where(where)).rowcount
+        if moved:
+            partition = conn.execute(select(ArchivePartition.id).where(
+                ArchivePartition.table_name == table_name, ArchivePartition.period_start == start)).scalar()
+            if partition is None:
+                conn.execute(ArchivePartition.__table__.insert().values(
+                    table_name=table_name, period_start=start, period_end=end, path=path,
+                    row_count=moved, archived_at=int(time.time())))
+            else:
+                conn.execute(ArchivePartition.__table__.update().where(ArchivePartition.id == partition).values(
+                    row_count=ArchivePartition.row_count + moved, archived_at=int(time.time())))
+            # Соединение обходит сессию и ее события, поэтому версии увеличиваются здесь
+            bump(conn, [table_name, ArchivePartition.__table__.name])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.exec_driver_sql('DETACH DATABASE archive')
+    if moved:
+        compact_partition(os.path.join(directory, path))
+    return moved
+
+
+def compact_partition(path):
+    # Файл части архива остается базой SQLite, чтобы читать его теми же запросами;
+    # VACUUM убирает свободные страницы после замены строк и плотно упаковывает индексы
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+
+def archived_rows(table_name, statement, start_timestamp=None, end_timestamp=None, executor=None):
+    """Строки запроса из всех частей архива журнала, пересекающихся с периодом."""
+    rows = []
+    for conn in archive_connections(table_name, start_timestamp, end_timestamp, executor):
+        rows += conn.execute(statement).mappings().all()
+    return rows
+
+
+def archived_records(table_name, statement, relations, start_timestamp=None, end_timestamp=None):
+    """Записи журнала из архива для просмотра: только чтение, со связанными записями.
+
+    relations - {атрибут: (модель, столбец внешнего ключа, параметры загрузки...)};
+    связанные записи загружаются одним запросом на атрибут, а не по одной строке.
+    """
+    rows = archived_rows(table_name, statement, start_timestamp, end_timestamp)
+    if not rows:
+        return []
+    related = {}
+    for attribute, (model, key, *options) in relations.items():
+        ids = {row[key] for row in rows if row[key] is not None}
+        related[attribute] = {record.id: record for record in
+                              model.query.options(*options).filter(model.id.in_(ids))} if ids else {}
+    return [SimpleNamespace(**row, **{attribute: related[attribute].get(row[key])
+                                      for attribute, (_, key, *_) in relations.items()}, archived=True)
+            for row in rows]
+
+
+def archived_hydrochemistry(statement, start_timestamp=None, end_timestamp=None):
+    """Записи журнала гидрохимии из архива для просмотра, с групповыми бассейнами и их бассейнами."""
+    return archived_records('hydrochemistry', statement,
+                            {'group_pool': (GroupPool, 'group_pool_id', selectinload(GroupPool.pools))},
+                            start_timestamp, end_timestamp)
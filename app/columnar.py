@@ -0,0 +1,103 @@
+"""Колоночное двоичное представление серий гидрохимии для графиков в браузере.
+
+Формат ответа (все числа little-endian):
+- 4 байта 'FSH1';
+- uint32 - длина заголовка;
+- заголовок JSON в UTF-8, дополненный пробелами до кратной 8 длины;
+- массивы подряд, каждый выровнен на 8 байт.
+
+Заголовок: {"dtypes": {столбец: "int64" | "float32"}, "series": [{..., "columns":
+{столбец: [смещение, длина] или null}}], ...}, где смещение отсчитывается от начала
+данных, то есть от конца заголовка. Разбирает ответ static/js/columnar.js.
+"""
+import json
+import math
+import struct
+
+MAGIC = b'FSH1'
+CONTENT_TYPE = 'application/octet-stream'
+DTYPES = {'int64': '<i8', 'float32': '<f4'}
+# Столбцы серий графика: время измерения или начала интервала сводки,
+# среднее и границы интервала, даты и значения аномалий
+SERIES_DTYPES = {'x': 'int64', 'mean': 'float32', 'min': 'float32', 'max': 'float32',
+                 'anomaly_x': 'int64', 'anomaly_y': 'float32'}
+
+
+def fetch_array(conn, statement, dtype):
+    """Результат запроса в структурированный массив NumPy.
+
+    Строки читаются прямо из курсора DB-API, без объектов Row SQLAlchemy;
+    столбцы запроса сопоставляются полям dtype по порядку, NULL становится NaN.
+    """
+    # NumPy загружается с первым графиком, а не при запуске приложения
+    import numpy as np
+
+    result = conn.execute(statement)
+    try:
+        return np.fromiter(result.cursor, dtype=dtype)
+    finally:
+        result.close()
+
+
+def _padding(size):
+    return -size % 8
+
+
+def json_safe(value):
+    # JSON.parse в браузере не принимает NaN и Infinity
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    return value
+
+
+def encode_columns(entries, dtypes, **meta):
+    """Кодирует серии в байты формата FSH1.
+
+    entries - список пар (поля серии для заголовка, {столбец: массив или None}),
+    dtypes - тип каждого столбца из DTYPES; meta попадает в заголовок как есть.
+    """
+    import numpy as np
+
+    header = {**json_safe(meta), 'dtypes': dtypes, 'series': []}
+    arrays = []
+    offset = 0
+    for fields, columns in entries:
+        layout = {}
+        for name, column in columns.items():
+            if column is None:
+                layout[name] = None
+                continue
+            array = np.ascontiguousarray(column, dtype=DTYPES[dtypes[name]])
+            layout[name] = [offset, len(array)]
+            arrays.append(array)
+            offset += array.nbytes + _padding(array.nbytes)
+        header['series'].append({**json_safe(fields), 'columns': layout})
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    header_bytes += b' ' * _padding(len(header_bytes))
+
+    parts = [MAGIC, struct.pack('<I', len(header_bytes)), header_bytes]
+    for array in arrays:
+        parts.append(array.tobytes())
+        parts.append(b'\0' * _padding(array.nbytes))
+    return b''.join(parts)
+
+
+def encode_series(series, names, anomalies=None, **meta):
+    """Кодирует серии downsample_series и точки anomaly_points для графика."""
+    anomalies = anomalies or {}
+    entries = []
+    for group_pool_id, pool_series in series.items():
+        dates, values = anomalies.get(group_pool_id, ((), ()))
+        entries.append(({'group_pool_id': group_pool_id, 'name': names.get(group_pool_id, str(group_pool_id))}, {
+            'x': pool_series['x'],
+            'mean': pool_series['mean'],
+            'min': pool_series['min'],
+            'max': pool_series['max'],
+            'anomaly_x': dates,
+            'anomaly_y': values,
+        }))
+    return encode_columns(entries, SERIES_DTYPES, **meta)
@@ -0,0 +1,173 @@
+import numpy as np
+from sqlalchemy import select, func
+
+from archive import archive_connections
+from columnar import fetch_array, encode_columns
+from fcr import day_start
+from models import db, Hydrochemistry, HYDROCHEMISTRY_PARAMETERS as PARAMETERS, hydrochemistry_daily, \
+                   hydrochemistry_hourly
+from rollups import choose_resolution, hour_start
+
+# Строка запроса панели: group_pool_id, время и все параметры; пропуски - NaN
+DASHBOARD_DTYPE = np.dtype([('group_pool_id', np.int64), ('x', np.int64)]
+                           + [(parameter, np.float64) for parameter in PARAMETERS])
+# Меньше общих измерений пара параметров не получает коэффициент корреляции
+MIN_PAIRS = 3
+
+
+def row_counts(start_timestamp, end_timestamp):
+    """Оценка числа строк журнала по групповым бассейнам по суточной сводке.
+
+    В строке журнала может быть заполнена часть параметров, поэтому за сутки
+    берется число измерений самого частого параметра.
+    """
+    counts = [hydrochemistry_daily.c[f'{parameter}_count'] for parameter in PARAMETERS]
+    return dict(db.session.execute(
+        select(hydrochemistry_daily.c.group_pool_id, func.sum(func.max(*counts)))
+        .where(hydrochemistry_daily.c.bucket.between(day_start(start_timestamp), end_timestamp))
+        .group_by(hydrochemistry_daily.c.group_pool_id)
+    ).all())
+
+
+def parameters_statement(table, start_timestamp, end_timestamp):
+    """Все параметры одним запросом: из журнала или средние интервалов сводки."""
+    if table is None:
+        return select(Hydrochemistry.group_pool_id, Hydrochemistry.hydrochem_date,
+                      *[getattr(Hydrochemistry, parameter) for parameter in PARAMETERS])\
+            .where(Hydrochemistry.hydrochem_date.between(start_timestamp, end_timestamp))
+    start = hour_start(start_timestamp) if table is hydrochemistry_hourly else day_start(start_timestamp)
+    return select(table.c.group_pool_id, table.c.bucket,
+                  *[table.c[f'{parameter}_mean'] for parameter in PARAMETERS])\
+        .where(table.c.bucket.between(start, end_timestamp))
+
+
+def read_parameters(start_timestamp, end_timestamp, budget=2000):
+    """Структурированный массив DASHBOARD_DTYPE, упорядоченный по бассейну и времени, и таблица-источник.
+
+    Журнал читается, если в каждом групповом бассейне не больше budget строк,
+    иначе часовая или суточная сводка - как для графиков.
+    """
+    counts = row_counts(start_timestamp, end_timestamp)
+    if not counts:
+        return np.empty(0, dtype=DASHBOARD_DTYPE), None
+    table = choose_resolution(max(counts.values()), end_timestamp - start_timestamp, budget)
+    statement = parameters_statement(table, start_timestamp, end_timestamp)
+    data = fetch_array(db.session.connection(), statement, DASHBOARD_DTYPE)
+    if table is None:
+        data = np.concatenate([data] + [fetch_array(conn, statement, DASHBOARD_DTYPE)
+                                        for conn in archive_connections('hydrochemistry', start_timestamp,
+                                                                        end_timestamp)])
+    return data[np.lexsort((data['x'], data['group_pool_id']))], table
+
+
+def parameter_matrix(data):
+    return np.column_stack([data[parameter] for parameter in PARAMETERS]) if len(data) \
+        else np.empty((0, len(PARAMETERS)))
+
+
+def pool_statistics(group_pool_ids, values):
+    """Число измерений, среднее, стандартное отклонение, минимум и максимум параметров.
+
+    Строки должны быть упорядочены по group_pool_id. Возвращает идентификаторы групповых
+    бассейнов, границы их строк и словарь массивов размером (бассейны, параметры).
+    """
+    starts = np.flatnonzero(np.r_[True, group_pool_ids[1:] != group_pool_ids[:-1]])
+    sizes = np.diff(np.r_[starts, len(group_pool_ids)])
+    present = ~np.isnan(values)
+    count = np.add.reduceat(present.astype(np.int64), starts, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.add.reduceat(np.where(present, values, 0.0), starts, axis=0) / count
+        deviation = np.where(present, values - np.repeat(mean, sizes, axis=0), 0.0)
+        std = np.sqrt(np.add.reduceat(deviation ** 2, starts, axis=0) / count)
+    statistics = {
+        'count': count,
+        'mean': mean,
+        'std': std,
+        # fmin/fmax пропускают NaN; параметр без измерений остается NaN
+        'min': np.fmin.reduceat(values, starts, axis=0),
+        'max': np.fmax.reduceat(values, starts, axis=0),
+    }
+    return group_pool_ids[starts], starts, statistics
+
+
+def rollup_statistics(table, start_timestamp, end_timestamp):
+    """Статистика параметров по групповым бассейнам из столбцов сводки: {group_pool_id: словарь списков}.
+
+    Число, среднее, минимум и максимум совпадают с посчитанными по журналу; стандартное
+    отклонение сводка не хранит, поэтому это разброс средних интервалов, взвешенных числом измерений.
+    """
+    start = hour_start(start_timestamp) if table is hydrochemistry_hourly else day_start(start_timestamp)
+    columns = []
+    for parameter in PARAMETERS:
+        count, mean = table.c[f'{parameter}_count'], table.c[f'{parameter}_mean']
+        columns += [func.sum(count), func.sum(mean * count), func.sum(mean * mean * count),
+                    func.min(table.c[f'{parameter}_min']), func.max(table.c[f'{parameter}_max'])]
+    result = {}
+    for group_pool_id, *values in db.session.execute(
+            select(table.c.group_pool_id, *columns).where(table.c.bucket.between(start, end_timestamp))
+            .group_by(table.c.group_pool_id)):
+        sums = np.array(values, dtype=np.float64).reshape(len(PARAMETERS), 5).T
+        count, total, squares, minimum, maximum = sums
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            std = np.sqrt(np.maximum(squares / count - mean ** 2, 0.0))
+        result[group_pool_id] = {'count': np.nan_to_num(count).astype(np.int64).tolist(), 'mean': _rounded(mean),
+                                 'std': _rounded(std), 'min': _rounded(minimum), 'max': _rounded(maximum)}
+    return result
+
+
+def correlation_matrix(values):
+    """Коэффициенты корреляции Пирсона между столбцами по строкам, где заполнены оба параметра.
+
+    Суммы для всех пар считаются матричными произведениями; пары, у которых
+    меньше MIN_PAIRS общих измерений или нет разброса, получают NaN.
+    """
+    present = ~np.isnan(values)
+    mask = present.astype(np.float64)
+    count = mask.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Сдвиг на среднее столбца не меняет корреляцию, но уменьшает потерю точности
+        column_mean = np.where(count > 0, np.where(present, values, 0.0).sum(axis=0) / count, 0.0)
+        z = np.where(present, values - column_mean, 0.0)
+        pairs = mask.T @ mask
+        # sums[i, j] - сумма параметра i по строкам, где заполнен и параметр j
+        sums = z.T @ mask
+        squares = (z * z).T @ mask
+        covariance = z.T @ z - sums * sums.T / pairs
+        variance = squares - sums ** 2 / pairs
+        correlation = covariance / np.sqrt(variance * variance.T)
+    correlation[(pairs < MIN_PAIRS) | ~np.isfinite(correlation)] = np.nan
+    return np.clip(correlation, -1.0, 1.0)
+
+
+def _rounded(matrix, digits=4):
+    return np.round(matrix, digits).tolist()
+
+
+def dashboard_payload(start_timestamp, end_timestamp, names, budget=2000, **meta):
+    """Данные панели в формате FSH1: ряды всех параметров по групповым бассейнам,
+    их статистика и матрицы корреляции (общая и по каждому бассейну) в заголовке.
+    """
+    data, table = read_parameters(start_timestamp, end_timestamp, budget)
+    values = parameter_matrix(data)
+    entries = []
+    if len(data):
+        group_pool_ids, starts, statistics = pool_statistics(data['group_pool_id'], values)
+        # Средние интервалов сводки дают неверные число измерений, минимум и максимум
+        pool_stats = rollup_statistics(table, start_timestamp, end_timestamp) if table is not None else \
+            {group_pool_id: {name: _rounded(array[index]) for name, array in statistics.items()}
+             for index, group_pool_id in enumerate(group_pool_ids.tolist())}
+        for group_pool_id, pool_values, pool_data in zip(
+                group_pool_ids.tolist(), np.split(values, starts[1:]), np.split(data, starts[1:])):
+            fields = {
+                'group_pool_id': group_pool_id,
+                'name': names.get(group_pool_id, str(group_pool_id)),
+                'statistics': pool_stats.get(group_pool_id),
+                'correlation': _rounded(correlation_matrix(pool_values)),
+            }
+            entries.append((fields, {'x': pool_data['x'], **{parameter: pool_data[parameter]
+                                                              for parameter in PARAMETERS}}))
+    dtypes = {'x': 'int64', **{parameter: 'float32' for parameter in PARAMETERS}}
+    return encode_columns(entries, dtypes, parameters=PARAMETERS, start=start_timestamp, end=end_timestamp,
+                          resolution=table.name if table is not None else 'hydrochemistry', rows=len(data),
+                          correlation=_rounded(correlation_matrix(values)), **meta)
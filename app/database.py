@@ -0,0 +1,40 @@
+from sqlalchemy import event
+
+from models import db
+
+# PRAGMA каждого нового соединения с основной БД. WAL позволяет читать журналы,
+# пока прием данных датчиков пишет в БД; NORMAL в режиме WAL не теряет
+# согласованность при сбое, а лишь может потерять последние транзакции.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+
+def init_sqlite(app):
+    """Подключает настройку соединений к движку основной БД; вызывается после db.init_app.
+
+    Файлы архива открываются своими движками только на чтение и не затрагиваются.
+    """
+    app.config.setdefault('SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _configure_connection(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, app.config['SQLITE_PRAGMAS'])
@@ -0,0 +1,84 @@
+import numpy as np
+
+from archive import archive_connections
+from columnar import fetch_array
+from models import db, Hydrochemistry
+from rollups import choose_resolution, measurement_counts, raw_measurement_counts, rollup_statement
+
+# Сколько точек на серию допускается передать в LTTB после агрегации
+LTTB_INPUT_FACTOR = 10
+# Строка запроса серий: group_pool_id, время, среднее, минимум, максимум
+SERIES_DTYPE = np.dtype([('group_pool_id', np.int64), ('x', np.int64), ('mean', np.float64),
+                         ('min', np.float64), ('max', np.float64)])
+
+
+def lttb(x, y, threshold):
+    """Индексы точек, отобранных алгоритмом Largest-Triangle-Three-Buckets."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def downsample_series(parameter, start_timestamp, end_timestamp, budget=1000):
+    """Серии параметра по групповым бассейнам, не длиннее budget точек каждая.
+
+    Возвращает словарь group_pool_id -> {'x', 'mean', 'min', 'max'}; при чтении
+    из часовой или суточной сводки 'min' и 'max' содержат границы интервала, иначе равны None.
+    """
+    counts = measurement_counts(parameter, start_timestamp, end_timestamp)
+    if counts:
+        table = choose_resolution(max(counts.values()), end_timestamp - start_timestamp, budget, LTTB_INPUT_FACTOR)
+    else:
+        # Суточная сводка за период пуста (еще не построена или отстает) - серии строятся
+        # по сырым измерениям, если они есть
+        counts = raw_measurement_counts(parameter, start_timestamp, end_timestamp)
+        table = None
+    if not counts:
+        return {}
+
+    if table is None:
+        column = getattr(Hydrochemistry, parameter)
+        statement = db.select(Hydrochemistry.group_pool_id, Hydrochemistry.hydrochem_date, column, column, column)\
+            .where(Hydrochemistry.hydrochem_date.between(start_timestamp, end_timestamp), column.isnot(None))\
+            .order_by(Hydrochemistry.group_pool_id, Hydrochemistry.hydrochem_date)
+    else:
+        statement = rollup_statement(table, parameter, start_timestamp, end_timestamp)
+
+    data = fetch_array(db.session.connection(), statement, SERIES_DTYPE)
+    if table is None:
+        # Сырые измерения за архивные месяцы читаются из файлов архива
+        parts = [data] + [fetch_array(conn, statement, SERIES_DTYPE)
+                          for conn in archive_connections('hydrochemistry', start_timestamp, end_timestamp)]
+        data = np.concatenate(parts)
+    if not len(data):
+        return {}
+    data = data[np.lexsort((data['x'], data['group_pool_id']))]
+    bounds = np.flatnonzero(np.diff(data['group_pool_id'])) + 1
+
+    series = {}
+    for chunk in np.split(data, bounds):
+        x, mean = chunk['x'], chunk['mean']
+        keep = lttb(x.astype(np.float64), mean, budget)
+        series[int(chunk['group_pool_id'][0])] = {
+            'x': x[keep],
+            'mean': mean[keep],
+            'min': chunk['min'][keep] if table is not None else None,
+            'max': chunk['max'][keep] if table is not None else None,
+        }
+    return series
@@ -0,0 +1,99 @@
+from collections import namedtuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# Изменение строки таблицы: op - 'insert', 'update' или 'delete';
+# row - значения после изменения (для удаления - удаленная строка), old - значения до изменения
+Change = namedtuple('Change', 'op row old')
+
+_listeners = {}
+_table_listeners = []
+
+
+def subscribe(table_name, after_commit=False):
+    """Регистрирует обработчик изменений таблицы.
+
+    Обработчик вызывается как func(session, changes). Без after_commit он работает
+    внутри той же транзакции перед фиксацией и может сам писать в БД,
+    с after_commit=True - после успешной фиксации (для сброса кэшей в памяти).
+    """
+    def decorator(func):
+        _listeners.setdefault(table_name, []).append((func, after_commit))
+        return func
+    return decorator
+
+
+def subscribe_tables(func):
+    """Регистрирует обработчик func(session, table_names) для всех таблиц сразу.
+
+    Он вызывается внутри транзакции перед фиксацией, после обработчиков отдельных
+    таблиц, с именами всех таблиц, которые транзакция изменила.
+    """
+    _table_listeners.append(func)
+    return func
+
+
+def record(session, table_name, changes):
+    """Добавляет изменения, сделанные в обход ORM (массовые вставки Core)."""
+    pending = session.info.setdefault('pending_changes', {})
+    pending.setdefault(table_name, []).extend(changes)
+
+
+def row_values(obj):
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs}
+
+
+def old_values(obj):
+    state = inspect(obj)
+    values = {}
+    for attr in state.mapper.column_attrs:
+        history = state.attrs[attr.key].history
+        values[attr.key] = history.deleted[0] if history.deleted else getattr(obj, attr.key)
+    return values
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    for obj in session.new:
+        record(session, inspect(obj).mapper.local_table.name, [Change('insert', row_values(obj), None)])
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            record(session, inspect(obj).mapper.local_table.name,
+                   [Change('update', row_values(obj), old_values(obj))])
+    for obj in session.deleted:
+        values = old_values(obj)
+        record(session, inspect(obj).mapper.local_table.name, [Change('delete', values, values)])
+
+
+@event.listens_for(Session, 'before_commit')
+def _dispatch_in_transaction(session):
+    session.flush()
+    dispatched = session.info.setdefault('dispatched_changes', {})
+    # Обработчики могут породить новые изменения, поэтому повторяем до пустой очереди
+    while session.info.get('pending_changes'):
+        pending = session.info.pop('pending_changes')
+        for table_name, changes in pending.items():
+            for func, after_commit in _listeners.get(table_name, ()):
+                if not after_commit:
+                    func(session, changes)
+            dispatched.setdefault(table_name, []).extend(changes)
+        session.flush()
+    if dispatched:
+        for func in _table_listeners:
+            func(session, set(dispatched))
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_after_commit(session):
+    dispatched = session.info.pop('dispatched_changes', {})
+    for table_name, changes in dispatched.items():
+        for func, after_commit in _listeners.get(table_name, ()):
+            if after_commit:
+                func(session, changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('pending_changes', None)
+    session.info.pop('dispatched_changes', None)
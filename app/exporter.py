@@ -0,0 +1,186 @@
+import csv
+import io
+import itertools
+import os
+from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import select
+
+from archive import ARCHIVES, archive_connections
+from models import db, Hydrochemistry, Feed, FishMovement, FishInventory, FishBoning
+
+# Журнал -> (модель, столбец даты для фильтра по периоду)
+EXPORTS = {
+    'hydrochemistry': (Hydrochemistry, Hydrochemistry.hydrochem_date),
+    'feed': (Feed, Feed.feed_date),
+    'movement': (FishMovement, FishMovement.movement_date),
+    'inventory': (FishInventory, FishInventory.control_date),
+    'boning': (FishBoning, FishInventory.control_date),
+}
+
+DATE_COLUMNS = {'hydrochem_date', 'feed_date', 'movement_date', 'control_date'}
+# Даты в обоих форматах - местное время сервера, как на страницах и при загрузке CSV обратно
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def local_timezone():
+    """Часовой пояс сервера для меток времени Parquet: имя IANA или смещение вида +03:00."""
+    name = os.environ.get('TZ', '').lstrip(':')
+    if not name and os.path.islink('/etc/localtime'):
+        name = os.path.realpath('/etc/localtime').partition('/zoneinfo/')[2]
+    if name:
+        try:
+            ZoneInfo(name)
+            return name
+        except (ValueError, ZoneInfoNotFoundError):
+            pass
+    # Windows не сообщает имя пояса; смещение верно, пока пояс без перехода на летнее время
+    offset = datetime.now().astimezone().strftime('%z')
+    return f'{offset[:3]}:{offset[3:]}'
+
+
+def export_statement(kind, start_timestamp=None, end_timestamp=None):
+    model, date_column = EXPORTS[kind]
+    statement = select(*model.__table__.columns)
+    if model is FishBoning:
+        # У бонитировки нет своей даты, период берется из инвентаризации
+        statement = statement.join(FishInventory, FishBoning.fish_inventory_id == FishInventory.id)
+    if start_timestamp is not None:
+        statement = statement.where(date_column >= start_timestamp)
+    if end_timestamp is not None:
+        statement = statement.where(date_column <= end_timestamp)
+    return statement.order_by(date_column, model.id)
+
+
+def iter_partitions(kind, start_timestamp=None, end_timestamp=None, chunk_size=5000):
+    """Строки журнала частями по chunk_size через курсор на стороне сервера.
+
+    Если период заходит в архив, сначала выдаются строки из частей архива, затем из основной БД.
+    """
+    model, _ = EXPORTS[kind]
+    statement = export_statement(kind, start_timestamp, end_timestamp).execution_options(yield_per=chunk_size)
+    sources = []
+    if model.__table__.name in ARCHIVES:
+        sources = archive_connections(model.__table__.name, start_timestamp, end_timestamp)
+    for conn in itertools.chain(sources, [db.session]):
+        result = conn.execute(statement)
+        try:
+            for partition in result.partitions():
+                yield result.keys(), partition
+        finally:
+            result.close()
+
+
+def format_value(key, value):
+    if key in DATE_COLUMNS and value is not None:
+        return datetime.fromtimestamp(value).strftime(DATE_FORMAT)
+    return value
+
+
+def generate_csv(kind, start_timestamp=None, end_timestamp=None, chunk_size=5000):
+    """Генератор CSV-текста: заголовок, затем по одному куску на каждую часть строк."""
+    model, _ = EXPORTS[kind]
+    keys = [column.key for column in model.__table__.columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(keys)
+    yield buffer.getvalue()
+
+    for _, partition in iter_partitions(kind, start_timestamp, end_timestamp, chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([format_value(key, value) for key, value in zip(keys, row)] for row in partition)
+        yield buffer.getvalue()
+
+
+def import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('Для выгрузки в Parquet требуется пакет pyarrow')
+    return pa, pq
+
+
+def parquet_schema(pa, model):
+    """Схема Arrow журнала; даты - метки времени с часовым поясом сервера."""
+    fields = []
+    for column in model.__table__.columns:
+        if column.key in DATE_COLUMNS:
+            arrow_type = pa.timestamp('s', tz=local_timezone())
+        elif isinstance(column.type, db.Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, db.Float):
+            arrow_type = pa.float64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.key, arrow_type, nullable=column.nullable))
+    return pa.schema(fields)
+
+
+def parquet_row_groups(kind, target, start_timestamp=None, end_timestamp=None, chunk_size=50000):
+    """Пишет журнал в Parquet по одной группе строк на каждую часть выборки.
+
+    Генератор: после каждой записанной группы выдает число ее строк, после
+    закрытия файла (записи футера) завершается.
+    """
+    pa, pq = import_pyarrow()
+    model, _ = EXPORTS[kind]
+    schema = parquet_schema(pa, model)
+    with pq.ParquetWriter(target, schema, compression='zstd') as writer:
+        for _, partition in iter_partitions(kind, start_timestamp, end_timestamp, chunk_size):
+            columns = list(zip(*partition))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema
+            ))
+            yield len(partition)
+
+
+def write_parquet(kind, target, start_timestamp=None, end_timestamp=None, chunk_size=50000):
+    """Пишет журнал в файл Parquet; возвращает число строк."""
+    return sum(parquet_row_groups(kind, target, start_timestamp, end_timestamp, chunk_size))
+
+
+class ChunkSink:
+    """Файловый объект для ParquetWriter: копит записанные байты, пока их не заберет ответ."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def generate_parquet(kind, start_timestamp=None, end_timestamp=None, chunk_size=50000):
+    """Генератор байтов Parquet для потокового ответа: кусок на каждую группу строк, затем футер.
+
+    Наличие pyarrow проверяется сразу, до начала ответа.
+    """
+    import_pyarrow()
+    sink = ChunkSink()
+
+    def chunks():
+        for _ in parquet_row_groups(kind, sink, start_timestamp, end_timestamp, chunk_size):
+            yield sink.take()
+        yield sink.take()
+    return chunks()
@@ -0,0 +1,296 @@
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func, and_
+from sqlalchemy.dialects.sqlite import insert
+
+from archive import archive_horizon
+from events import subscribe
+from models import db, Feed, FishMovement, FishInventory, FishBoning, FeedDaily, BiomassDaily
+
+# Суточные итоги считаются по местным суткам, как и даты во всех журналах приложения
+
+
+def day_start(timestamp):
+    return int(datetime.fromtimestamp(timestamp).replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+
+
+def next_day(day):
+    return day_start(int((datetime.fromtimestamp(day) + timedelta(days=1, hours=3)).timestamp()))
+
+
+def week_start(day):
+    date = datetime.fromtimestamp(day)
+    return day_start(int((date - timedelta(days=date.weekday())).timestamp()))
+
+
+def upsert(executor, model, rows, keys, values):
+    if not rows:
+        return
+    statement = insert(model.__table__)
+    executor.execute(statement.on_conflict_do_update(
+        index_elements=keys, set_={key: statement.excluded[key] for key in values}
+    ), rows)
+
+
+def refresh_feed_days(executor, keys):
+    """Пересчитывает суточные итоги кормления для ключей (бассейн, тип корма, сутки)."""
+    rows, empty = [], []
+    for pool_id, feed_type_id, day in keys:
+        total = executor.execute(
+            select(func.sum(Feed.feed_value))
+            .where(Feed.pool_id == pool_id, Feed.feed_type_id == feed_type_id,
+                   Feed.feed_date >= day, Feed.feed_date < next_day(day))
+        ).scalar()
+        if total is None:
+            empty.append((pool_id, feed_type_id, day))
+        else:
+            rows.append({'pool_id': pool_id, 'feed_type_id': feed_type_id, 'day': day, 'feed_total': total})
+    for pool_id, feed_type_id, day in empty:
+        executor.execute(FeedDaily.__table__.delete().where(
+            FeedDaily.pool_id == pool_id, FeedDaily.feed_type_id == feed_type_id, FeedDaily.day == day))
+    upsert(executor, FeedDaily, rows, ['pool_id', 'feed_type_id', 'day'], ['feed_total'])
+
+
+def inventory_biomass(executor, pool_id, fish_type_id, day):
+    """Биомасса по последней за сутки инвентаризации или None, если ее не было."""
+    latest = executor.execute(
+        select(func.max(FishInventory.control_date))
+        .where(FishInventory.pool_id == pool_id, FishInventory.fish_type_id == fish_type_id,
+               FishInventory.control_date >= day, FishInventory.control_date < next_day(day))
+    ).scalar()
+    if latest is None:
+        return None
+    return executor.execute(
+        select(func.coalesce(func.sum(FishBoning.fish_biomass), 0.0))
+        .select_from(FishInventory)
+        .join(FishBoning, FishBoning.fish_inventory_id == FishInventory.id)
+        .where(FishInventory.pool_id == pool_id, FishInventory.fish_type_id == fish_type_id,
+               FishInventory.control_date == latest)
+    ).scalar()
+
+
+def refresh_biomass_days(executor, keys):
+    """Пересчитывает суточные изменения биомассы для ключей (бассейн, вид рыбы, сутки)."""
+    rows, empty = [], []
+    for pool_id, fish_type_id, day in keys:
+        moved = {}
+        for name, column in (('moved_in', FishMovement.pool_id_to), ('moved_out', FishMovement.pool_id_from)):
+            moved[name] = executor.execute(
+                select(func.coalesce(func.sum(FishMovement.fish_biomass), 0.0))
+                .where(column == pool_id, FishMovement.fish_type_id == fish_type_id,
+                       FishMovement.movement_date >= day, FishMovement.movement_date < next_day(day))
+            ).scalar()
+        biomass = inventory_biomass(executor, pool_id, fish_type_id, day)
+        if biomass is None and not moved['moved_in'] and not moved['moved_out']:
+            empty.append((pool_id, fish_type_id, day))
+        else:
+            rows.append({'pool_id': pool_id, 'fish_type_id': fish_type_id, 'day': day,
+                         'inventory_biomass': biomass, **moved})
+    for pool_id, fish_type_id, day in empty:
+        executor.execute(BiomassDaily.__table__.delete().where(
+            BiomassDaily.pool_id == pool_id, BiomassDaily.fish_type_id == fish_type_id, BiomassDaily.day == day))
+    upsert(executor, BiomassDaily, rows, ['pool_id', 'fish_type_id', 'day'],
+           ['moved_in', 'moved_out', 'inventory_biomass'])
+
+
+def rebuild_rollups(executor):
+    """Перестраивает суточные итоги одним проходом по журналам.
+
+    Итоги за сутки, строки которых уже перенесены в архив, сохраняются как есть.
+    """
+    feed_horizon = archive_horizon('feed', executor) or 0
+    movement_horizon = archive_horizon('fish_movement', executor) or 0
+    executor.execute(FeedDaily.__table__.delete().where(FeedDaily.day >= feed_horizon))
+    executor.execute(BiomassDaily.__table__.delete().where(BiomassDaily.day >= movement_horizon))
+
+    feed = defaultdict(float)
+    for pool_id, feed_type_id, feed_date, value in executor.execute(
+            select(Feed.pool_id, Feed.feed_type_id, Feed.feed_date, Feed.feed_value)
+            .where(Feed.feed_date >= feed_horizon)
+            .execution_options(yield_per=10000)):
+        feed[(pool_id, feed_type_id, day_start(feed_date))] += value
+    upsert(executor, FeedDaily,
+           [{'pool_id': key[0], 'feed_type_id': key[1], 'day': key[2], 'feed_total': total}
+            for key, total in feed.items()],
+           ['pool_id', 'feed_type_id', 'day'], ['feed_total'])
+
+    keys = set()
+    for pool_to, pool_from, fish_type_id, movement_date in executor.execute(
+            select(FishMovement.pool_id_to, FishMovement.pool_id_from, FishMovement.fish_type_id,
+                   FishMovement.movement_date)
+            .where(FishMovement.movement_date >= movement_horizon)
+            .execution_options(yield_per=10000)):
+        for pool_id in (pool_to, pool_from):
+            if pool_id is not None:
+                keys.add((pool_id, fish_type_id, day_start(movement_date)))
+    for pool_id, fish_type_id, control_date in executor.execute(
+            select(FishInventory.pool_id, FishInventory.fish_type_id, FishInventory.control_date)
+            .where(FishInventory.control_date >= movement_horizon)):
+        keys.add((pool_id, fish_type_id, day_start(control_date)))
+    refresh_biomass_days(executor, keys)
+
+
+def movement_keys(values):
+    day = day_start(values['movement_date'])
+    return {(pool_id, values['fish_type_id'], day)
+            for pool_id in (values['pool_id_to'], values['pool_id_from']) if pool_id is not None}
+
+
+@subscribe('feed')
+def _on_feed(session, changes):
+    keys = set()
+    for change in changes:
+        for values in (change.row, change.old):
+            if values is not None:
+                keys.add((values['pool_id'], values['feed_type_id'], day_start(values['feed_date'])))
+    refresh_feed_days(session, keys)
+
+
+@subscribe('fish_movement')
+def _on_movement(session, changes):
+    keys = set()
+    for change in changes:
+        for values in (change.row, change.old):
+            if values is not None:
+                keys |= movement_keys(values)
+    refresh_biomass_days(session, keys)
+
+
+@subscribe('fish_inventory')
+def _on_inventory(session, changes):
+    keys = set()
+    for change in changes:
+        for values in (change.row, change.old):
+            if values is not None:
+                keys.add((values['pool_id'], values['fish_type_id'], day_start(values['control_date'])))
+    refresh_biomass_days(session, keys)
+
+
+@subscribe('fish_boning')
+def _on_boning(session, changes):
+    inventory_ids = set()
+    for change in changes:
+        for values in (change.row, change.old):
+            if values is not None:
+                inventory_ids.add(values['fish_inventory_id'])
+    inventories = session.execute(
+        select(FishInventory.pool_id, FishInventory.fish_type_id, FishInventory.control_date)
+        .where(FishInventory.id.in_(inventory_ids))
+    ).all()
+    refresh_biomass_days(session, {(pool_id, fish_type_id, day_start(control_date))
+                                   for pool_id, fish_type_id, control_date in inventories})
+
+
+class DailySeries:
+    """Накопленные суммы по суткам для быстрых сумм за период (d1, d2]."""
+
+    def __init__(self):
+        self.days = []
+        self.totals = [0.0]
+
+    def add(self, day, value):
+        self.days.append(day)
+        self.totals.append(self.totals[-1] + value)
+
+    def between(self, after, until):
+        return self.totals[bisect_right(self.days, until)] - self.totals[bisect_right(self.days, after)]
+
+
+def fcr_report(start_day, end_day, pool_id=None):
+    """Кормовой коэффициент по интервалам между инвентаризациями и по неделям.
+
+    Все данные берутся из суточных итогов, поэтому время ответа определяется длиной
+    периода, а не объемом истории. Интервал (d1, d2] - от одной инвентаризации до
+    следующей; прирост = B2 - B1 - (завезено - вывезено). Корм бассейна делится между
+    видами рыбы пропорционально их биомассе на начало интервала, а единицы всех
+    типов корма считаются сопоставимыми. Недельный прирост распределяется равномерно
+    по суткам интервала.
+    """
+    def pool_filter(column):
+        return column == pool_id if pool_id is not None else db.true()
+
+    # Последняя инвентаризация до начала периода и все инвентаризации внутри него
+    previous = select(BiomassDaily.pool_id, BiomassDaily.fish_type_id, func.max(BiomassDaily.day).label('day'))\
+        .where(BiomassDaily.inventory_biomass.isnot(None), BiomassDaily.day < start_day,
+               pool_filter(BiomassDaily.pool_id))\
+        .group_by(BiomassDaily.pool_id, BiomassDaily.fish_type_id).subquery()
+    checkpoints = db.session.execute(
+        select(BiomassDaily.pool_id, BiomassDaily.fish_type_id, BiomassDaily.day, BiomassDaily.inventory_biomass)
+        .outerjoin(previous, and_(BiomassDaily.pool_id == previous.c.pool_id,
+                                  BiomassDaily.fish_type_id == previous.c.fish_type_id,
+                                  BiomassDaily.day == previous.c.day))
+        .where(BiomassDaily.inventory_biomass.isnot(None), pool_filter(BiomassDaily.pool_id),
+               db.or_(previous.c.day.isnot(None), BiomassDaily.day.between(start_day, end_day)))
+        .order_by(BiomassDaily.pool_id, BiomassDaily.fish_type_id, BiomassDaily.day)
+    ).all()
+    if not checkpoints:
+        return [], []
+    window_start = min(row.day for row in checkpoints)
+
+    feed = defaultdict(DailySeries)
+    for row in db.session.execute(
+            select(FeedDaily.pool_id, FeedDaily.day, func.sum(FeedDaily.feed_total))
+            .where(FeedDaily.day > window_start, FeedDaily.day <= end_day, pool_filter(FeedDaily.pool_id))
+            .group_by(FeedDaily.pool_id, FeedDaily.day).order_by(FeedDaily.pool_id, FeedDaily.day)):
+        feed[row[0]].add(row[1], row[2])
+    moved = defaultdict(DailySeries)
+    for row in db.session.execute(
+            select(BiomassDaily.pool_id, BiomassDaily.fish_type_id, BiomassDaily.day,
+                   BiomassDaily.moved_in - BiomassDaily.moved_out)
+            .where(BiomassDaily.day > window_start, BiomassDaily.day <= end_day, pool_filter(BiomassDaily.pool_id))
+            .order_by(BiomassDaily.pool_id, BiomassDaily.fish_type_id, BiomassDaily.day)):
+        moved[(row[0], row[1])].add(row[2], row[3])
+
+    # Инвентаризации по бассейнам: вид рыбы -> (сутки, биомасса)
+    pools = defaultdict(lambda: defaultdict(lambda: ([], [])))
+    for row in checkpoints:
+        days, values = pools[row.pool_id][row.fish_type_id]
+        days.append(row.day)
+        values.append(row.inventory_biomass)
+
+    def biomass_at(pool, day):
+        # Биомасса видов бассейна по последним на эту дату инвентаризациям
+        shares = {}
+        for fish_type_id, (days, values) in pools[pool].items():
+            index = bisect_right(days, day) - 1
+            if index >= 0:
+                shares[fish_type_id] = values[index]
+        return shares
+
+    intervals = []
+    weekly = defaultdict(lambda: [0.0, 0.0])
+    for pool, fish_types in pools.items():
+        for fish_type_id, (days, values) in fish_types.items():
+            points = list(zip(days, values))
+            for (day1, biomass1), (day2, biomass2) in zip(points, points[1:]):
+                shares = biomass_at(pool, day1)
+                total = sum(shares.values())
+                share = biomass1 / total if total else 1.0 / max(len(shares), 1)
+                net_moved = moved[(pool, fish_type_id)].between(day1, day2)
+                feed_total = feed[pool].between(day1, day2) * share
+                gain = biomass2 - biomass1 - net_moved
+                intervals.append({
+                    'pool_id': pool, 'fish_type_id': fish_type_id, 'start': day1, 'end': day2,
+                    'start_biomass': biomass1, 'end_biomass': biomass2, 'net_moved': net_moved,
+                    'feed': feed_total, 'gain': gain, 'fcr': feed_total / gain if gain > 0 else None,
+                })
+
+                # Недели внутри интервала: корм за неделю и равномерная доля прироста
+                span = max(day2 - day1, 1)
+                week = week_start(max(day1, start_day))
+                while week <= min(day2, end_day):
+                    week_end = week_start(week + 8 * 86400) - 1
+                    after, until = max(week - 1, day1), min(week_end, day2)
+                    if until > after:
+                        key = (pool, fish_type_id, week)
+                        weekly[key][0] += feed[pool].between(after, until) * share
+                        weekly[key][1] += gain * (until - after) / span
+                    week = week_end + 1
+
+    weeks = [{'pool_id': pool, 'fish_type_id': fish_type_id, 'week': week, 'feed': feed_total, 'gain': gain,
+              'fcr': feed_total / gain if gain > 0 else None}
+             for (pool, fish_type_id, week), (feed_total, gain) in sorted(weekly.items())]
+    intervals = [row for row in intervals if row['end'] >= start_day]
+    return intervals, weeks
@@ -1,8 +1,9 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, SelectField, SelectMultipleField, FloatField,\
     DateTimeField, BooleanField, IntegerField, TextAreaField, DateField
-from wtforms.validators import DataRequired, Length, Optional
-from models import Pool, GroupPool
+from wtforms.validators import DataRequired, InputRequired, Length, Optional, NumberRange
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from reference import choices
 
 from wtforms import DateTimeField
 from datetime import datetime, timedelta
@@ -24,25 +25,27 @@ class GroupPoolForm(FlaskForm):
 
     def __init__(self, *args, **kwargs):
         super(GroupPoolForm, self).__init__(*args, **kwargs)
-        self.pools.choices = [(pool.id, pool.name) for pool in Pool.query.all()]
+        self.pools.choices = choices('pools')
 
 class HydrochemistryFilterForm(FlaskForm):
     start_date = DateTimeField('Начальная дата', default=datetime.utcnow() - timedelta(days=90), format='%Y-%m-%d %H:%M:%S', validators=[DataRequired()])
     end_date = DateTimeField('Конечная дата', default=datetime.utcnow(), format='%Y-%m-%d %H:%M:%S', validators=[DataRequired()])
     submit = SubmitField('Фильтр')
 
+PARAMETER_CHOICES = [
+    ('doxy', 'Кислород'),
+    ('temperature', 'Температура'),
+    ('ph', 'pH'),
+    ('no2', 'NO2'),
+    ('no3', 'NO3'),
+    ('nh4', 'NH4'),
+    ('po4', 'PO4'),
+    ('salinity', 'Соленость'),
+    ('illumination', 'Освещенность')
+]
+
 class HydrochemistryGraphForm(FlaskForm):
-    parameter = SelectField('Параметр', choices=[
-        ('doxy', 'Кислород'),
-        ('temperature', 'Температура'),
-        ('ph', 'pH'),
-        ('no2', 'NO2'),
-        ('no3', 'NO3'),
-        ('nh4', 'NH4'),
-        ('po4', 'PO4'),
-        ('salinity', 'Соленость'),
-        ('illumination', 'Освещенность')
-    ], validators=[DataRequired()])
+    parameter = SelectField('Параметр', choices=PARAMETER_CHOICES, validators=[DataRequired()])
     start_date = DateField('Начальная дата', default=datetime.utcnow() - timedelta(days=90), format='%Y-%m-%d', validators=[DataRequired()])
     end_date = DateField('Конечная дата', default=datetime.utcnow() + timedelta(days=1), format='%Y-%m-%d', validators=[DataRequired()])
     submit = SubmitField('Построить')
@@ -63,7 +66,7 @@ class HydrochemistryForm(FlaskForm):
 
     def __init__(self, *args, **kwargs):
         super(HydrochemistryForm, self).__init__(*args, **kwargs)
-        self.group_pool_id.choices = [(gp.id, gp.name) for gp in GroupPool.query.all()]
+        self.group_pool_id.choices = choices('group_pools')
 
 # Форма для FishType
 class FishTypeForm(FlaskForm):
@@ -78,6 +81,22 @@ class FishInventoryForm(FlaskForm):
     control_desc = TextAreaField('Описание', validators=[Optional()])
     submit = SubmitField('Сохранить')
 
+class InventoryFilterForm(FlaskForm):
+    # Фильтр передается в адресе страницы, чтобы его сохраняли ссылки постраничного вывода
+    class Meta:
+        csrf = False
+
+    pool_id = SelectField('Бассейн', coerce=int, default=0, validators=[Optional()])
+    fish_type_id = SelectField('Вид рыбы', coerce=int, default=0, validators=[Optional()])
+    start_date = DateField('Начальная дата', format='%Y-%m-%d', validators=[Optional()])
+    end_date = DateField('Конечная дата', format='%Y-%m-%d', validators=[Optional()])
+    submit = SubmitField('Фильтр')
+
+    def __init__(self, *args, **kwargs):
+        super(InventoryFilterForm, self).__init__(*args, **kwargs)
+        self.pool_id.choices = [(0, 'Все бассейны')] + choices('pools')
+        self.fish_type_id.choices = [(0, 'Все виды')] + choices('fish_types')
+
 # Форма для FishBoning
 class FishBoningForm(FlaskForm):
     fish_inventory_id = SelectField('Идентификатор', coerce=int, validators=[DataRequired()])
@@ -109,11 +128,63 @@ class FishMovementForm(FlaskForm):
     movement_desc = TextAreaField('Описание', validators=[Optional()])
     submit = SubmitField('Сохранить')
 
-class PoolSelectionForm(FlaskForm):
-    pool_id = SelectField('Бассейн', coerce=int, validators=[DataRequired()])
-    submit = SubmitField('Расчитать')
+# Строки журнала по групповым бассейнам читаются из request.form, форма проверяет только CSRF-токен
+class JournalForm(FlaskForm):
+    pass
+
+class ImportForm(FlaskForm):
+    kind = SelectField('Журнал', choices=[
+        ('hydrochemistry', 'Гидрохимия'),
+        ('feed', 'Кормление'),
+        ('movement', 'Перемещение')
+    ], validators=[DataRequired()])
+    file = FileField('Файл CSV или XLSX', validators=[FileRequired(), FileAllowed(['csv', 'xlsx'], 'Только CSV или XLSX')])
+    submit = SubmitField('Загрузить')
+
+
+class ExportForm(FlaskForm):
+    kind = SelectField('Журнал', choices=[
+        ('hydrochemistry', 'Гидрохимия'),
+        ('feed', 'Кормление'),
+        ('movement', 'Перемещение'),
+        ('inventory', 'Инвентаризация'),
+        ('boning', 'Бонитировка')
+    ], validators=[DataRequired()])
+    file_format = SelectField('Формат', choices=[('csv', 'CSV'), ('parquet', 'Parquet')], validators=[DataRequired()])
+    start_date = DateField('Начальная дата', default=datetime.utcnow() - timedelta(days=365), format='%Y-%m-%d', validators=[Optional()])
+    end_date = DateField('Конечная дата', default=datetime.utcnow() + timedelta(days=1), format='%Y-%m-%d', validators=[Optional()])
+    submit = SubmitField('Выгрузить')
+
+
+class DashboardForm(FlaskForm):
+    # Параметры для сравнения выбираются на странице: данные загружаются сразу по всем
+    start_date = DateField('Начальная дата', default=datetime.utcnow() - timedelta(days=30), format='%Y-%m-%d', validators=[DataRequired()])
+    end_date = DateField('Конечная дата', default=datetime.utcnow() + timedelta(days=1), format='%Y-%m-%d', validators=[DataRequired()])
+    submit = SubmitField('Показать')
+
+
+class FcrForm(FlaskForm):
+    pool_id = SelectField('Бассейн', coerce=int, validators=[Optional()])
+    start_date = DateField('Начальная дата', default=datetime.utcnow() - timedelta(days=180), format='%Y-%m-%d', validators=[DataRequired()])
+    end_date = DateField('Конечная дата', default=datetime.utcnow(), format='%Y-%m-%d', validators=[DataRequired()])
+    submit = SubmitField('Рассчитать')
 
     def __init__(self, *args, **kwargs):
-        super(PoolSelectionForm, self).__init__(*args, **kwargs)
-        self.pool_id.choices = [(pool.id, pool.name) for pool in Pool.query.all()]
+        super(FcrForm, self).__init__(*args, **kwargs)
+        self.pool_id.choices = [(0, 'Все бассейны')] + choices('pools')
+
 
+class AlertRuleForm(FlaskForm):
+    name = StringField('Название', validators=[DataRequired(), Length(max=100)])
+    parameter = SelectField('Параметр', choices=PARAMETER_CHOICES, validators=[DataRequired()])
+    group_pool_id = SelectField('Групповой бассейн', coerce=int, validators=[Optional()])
+    kind = SelectField('Проверка', choices=[('threshold', 'Последнее значение'), ('rate', 'Скорость изменения в час'),
+                                            ('window', 'Среднее за окно')], validators=[DataRequired()])
+    operator = SelectField('Условие', choices=[('<', 'ниже'), ('>', 'выше')], validators=[DataRequired()])
+    threshold = FloatField('Порог', validators=[InputRequired()])
+    window = IntegerField('Окно, мин', default=30, validators=[Optional(), NumberRange(min=1, max=7 * 24 * 60)])
+    submit = SubmitField('Добавить')
+
+    def __init__(self, *args, **kwargs):
+        super(AlertRuleForm, self).__init__(*args, **kwargs)
+        self.group_pool_id.choices = [(0, 'Все групповые бассейны')] + choices('group_pools')
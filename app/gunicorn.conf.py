@@ -0,0 +1,27 @@
+# Настройки gunicorn: gunicorn -c gunicorn.conf.py wsgi:app
+import os
+
+bind = f"{os.environ.get('HOST', '127.0.0.1')}:{os.environ.get('PORT', 5000)}"
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
+# Кэши графиков, справочников и правил оповещений живут в памяти каждого процесса, но
+# сверяются с версиями таблиц в БД (versions.py), поэтому запись из любого процесса или
+# команды CLI видна всем. По умолчанию несколько процессов, чтобы построение графиков
+# не ждало GIL; записи в SQLite все равно идут по одной. Метрики /metrics у каждого
+# процесса свои: ответ показывает только тот процесс, который его выдал.
+workers = int(os.environ.get('WEB_WORKERS', max(2, min(4, os.cpu_count() or 1))))
+# Миграции выполняются один раз в главном процессе до запуска рабочих
+preload_app = True
+timeout = 60
+
+
+def post_fork(server, worker):
+    from wsgi import app
+    from models import db
+    from startup import start_warm_up
+
+    # Пул соединений у каждого рабочего процесса свой; унаследованные соединения не закрываем,
+    # ими владеет главный процесс
+    with app.app_context():
+        db.engine.dispose(close=False)
+    start_warm_up(app)
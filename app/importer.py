@@ -0,0 +1,259 @@
+import csv
+import io
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from wtforms import DateTimeField, FloatField, IntegerField, SelectField, SubmitField
+from wtforms.fields.core import UnboundField
+from wtforms.validators import DataRequired
+
+from events import Change, record
+from forms import HydrochemistryForm, FeedForm, FishMovementForm
+from journal import existing_hydrochemistry_keys
+from models import db, Pool, GroupPool, FishType, FeedType, Hydrochemistry, Feed, FishMovement
+
+# Что можно загрузить из файла: модель и форма, правила которой применяются к каждой строке
+IMPORTS = {
+    'hydrochemistry': (Hydrochemistry, HydrochemistryForm),
+    'feed': (Feed, FeedForm),
+    'movement': (FishMovement, FishMovementForm),
+}
+
+# Поля-справочники: в файле допускается название или числовой идентификатор
+REFERENCES = {
+    'group_pool_id': GroupPool,
+    'pool_id': Pool,
+    'pool_id_from': Pool,
+    'pool_id_to': Pool,
+    'fish_type_id': FishType,
+    'feed_type_id': FeedType,
+}
+
+MAX_REPORTED_ERRORS = 1000
+
+FieldRule = namedtuple('FieldRule', 'name label field_class required format')
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.rejected = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def form_rules(form_class):
+    """Правила полей формы: обязательность, тип и формат даты."""
+    fields = []
+    for name in dir(form_class):
+        field = getattr(form_class, name)
+        if not isinstance(field, UnboundField) or field.field_class is SubmitField:
+            continue
+        validators = field.kwargs.get('validators') or ()
+        label = field.args[0] if field.args else field.kwargs.get('label', name)
+        fields.append((field.creation_counter, FieldRule(
+            name, label, field.field_class,
+            any(isinstance(validator, DataRequired) for validator in validators),
+            field.kwargs.get('format')
+        )))
+    return [rule for _, rule in sorted(fields, key=lambda item: item[0])]
+
+
+def load_lookups(rules):
+    """Справочники название -> id для полей выбора, загружаемые один раз на весь файл."""
+    lookups = {}
+    for rule in rules:
+        model = REFERENCES.get(rule.name)
+        if model is None:
+            continue
+        by_name = {}
+        ids = set()
+        for item_id, name in db.session.query(model.id, model.name):
+            by_name.setdefault(name.strip().lower(), item_id)
+            ids.add(item_id)
+        lookups[rule.name] = (by_name, ids)
+    return lookups
+
+
+def required_columns(model):
+    """Столбцы таблицы с NOT NULL по схеме самой БД: в старых базах она строже модели."""
+    columns = inspect(db.session.connection()).get_columns(model.__table__.name)
+    return {column['name'] for column in columns if not column['nullable']}
+
+
+def convert_value(rule, value, lookups, nullable=True):
+    if isinstance(value, str):
+        value = value.strip()
+    if value is None or value == '':
+        # Пустой текст в столбец NOT NULL сохраняется пустой строкой
+        text = not issubclass(rule.field_class, (DateTimeField, FloatField, IntegerField, SelectField))
+        return '' if text and not nullable else None
+
+    if issubclass(rule.field_class, DateTimeField):
+        if isinstance(value, datetime):
+            return int(value.timestamp())
+        try:
+            return int(datetime.strptime(str(value), rule.format or '%Y-%m-%d %H:%M:%S').timestamp())
+        except ValueError:
+            raise RowError(f'Некорректная дата в поле «{rule.label}»: {value}')
+    if issubclass(rule.field_class, FloatField):
+        try:
+            return float(str(value).replace(',', '.')) if isinstance(value, str) else float(value)
+        except ValueError:
+            raise RowError(f'Некорректное число в поле «{rule.label}»: {value}')
+    if issubclass(rule.field_class, IntegerField):
+        try:
+            return int(value)
+        except ValueError:
+            raise RowError(f'Некорректное целое число в поле «{rule.label}»: {value}')
+    if issubclass(rule.field_class, SelectField) and rule.name in lookups:
+        by_name, ids = lookups[rule.name]
+        item_id = by_name.get(str(value).lower())
+        if item_id is None and str(value).isdigit() and int(value) in ids:
+            item_id = int(value)
+        if item_id is None:
+            raise RowError(f'Неизвестное значение в поле «{rule.label}»: {value}')
+        return item_id
+    return str(value)
+
+
+def column_index(header, rules):
+    """Номера столбцов файла для полей; справочник можно указать и без суффикса _id."""
+    positions = {str(name).strip().lower(): index for index, name in enumerate(header) if name is not None}
+    columns = {}
+    for rule in rules:
+        for alias in (rule.name, rule.name.replace('_id', '', 1)):
+            if alias in positions:
+                columns[rule.name] = positions[alias]
+                break
+    missing = [rule.label for rule in rules if rule.required and rule.name not in columns]
+    if missing:
+        raise RowError('В файле нет обязательных столбцов: ' + ', '.join(missing))
+    return columns
+
+
+def validate_row(kind, values, rules, columns, lookups, not_null=()):
+    row = {}
+    for rule in rules:
+        index = columns.get(rule.name)
+        raw = values[index] if index is not None and index < len(values) else None
+        value = convert_value(rule, raw, lookups, rule.name not in not_null)
+        if rule.required and not value:
+            raise RowError(f'Не заполнено поле «{rule.label}»')
+        row[rule.name] = value
+    if kind == 'movement' and row['pool_id_from'] == row['pool_id_to']:
+        raise RowError('Басейны совпадают')
+    return row
+
+
+def insert_batch(kind, model, batch, report):
+    if kind == 'hydrochemistry':
+        existing = existing_hydrochemistry_keys({(row['group_pool_id'], row['hydrochem_date']) for _, row in batch})
+        unique = []
+        for line, row in batch:
+            key = (row['group_pool_id'], row['hydrochem_date'])
+            if key in existing:
+                report.add_error(line, 'Запись для этого группового бассейна и даты уже существует')
+            else:
+                existing.add(key)
+                unique.append((line, row))
+        batch = unique
+    if not batch:
+        return
+
+    rows = [row for _, row in batch]
+    try:
+        db.session.execute(model.__table__.insert(), rows)
+        record(db.session, model.__table__.name, [Change('insert', row, None) for row in rows])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        insert_rows(model, batch, report)
+        return
+    report.inserted += len(rows)
+
+
+def insert_rows(model, batch, report):
+    """Вставляет пакет по одной строке, чтобы отчет назвал строки файла, нарушившие ограничения БД."""
+    inserted = []
+    for line, row in batch:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(model.__table__.insert(), [row])
+        except IntegrityError as error:
+            report.add_error(line, f'Строка не сохранена: {error.orig}')
+        else:
+            inserted.append(row)
+    if inserted:
+        record(db.session, model.__table__.name, [Change('insert', row, None) for row in inserted])
+    db.session.commit()
+    report.inserted += len(inserted)
+
+
+def read_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    first_line = text.readline()
+    # Excel с русской локалью сохраняет CSV через точку с запятой
+    delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+    yield 1, next(csv.reader([first_line], delimiter=delimiter), [])
+    reader = csv.reader(text, delimiter=delimiter)
+    for values in reader:
+        yield reader.line_num + 1, values
+
+
+def read_xlsx(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RowError('Для загрузки XLSX требуется пакет openpyxl')
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for line, values in enumerate(workbook.active.iter_rows(values_only=True), 1):
+            yield line, values
+    finally:
+        workbook.close()
+
+
+def import_rows(kind, stream, file_format='csv', batch_size=1000):
+    """Построчно загружает файл в журнал kind, вставляя строки пакетами.
+
+    Файл читается потоком, в памяти держится только текущий пакет, поэтому
+    расход памяти не зависит от размера файла.
+    """
+    model, form_class = IMPORTS[kind]
+    rules = form_rules(form_class)
+    lookups = load_lookups(rules)
+    not_null = required_columns(model)
+    report = ImportReport()
+
+    rows = read_xlsx(stream) if file_format == 'xlsx' else read_csv(stream)
+    try:
+        _, header = next(rows)
+    except StopIteration:
+        return report
+    columns = column_index(header, rules)
+
+    batch = []
+    for line, values in rows:
+        if not any(value not in (None, '') for value in values):
+            continue
+        try:
+            batch.append((line, validate_row(kind, values, rules, columns, lookups, not_null)))
+        except RowError as error:
+            report.add_error(line, str(error))
+            continue
+        if len(batch) >= batch_size:
+            insert_batch(kind, model, batch, report)
+            batch = []
+    insert_batch(kind, model, batch, report)
+    return report
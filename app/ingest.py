@@ -0,0 +1,297 @@
+import atexit
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+
+from events import Change, record
+from journal import PARAMETERS
+from metrics import metrics
+from models import db, GroupPool, Hydrochemistry
+from versions import bump, data_version
+
+logger = logging.getLogger(__name__)
+
+
+class ReadingError(ValueError):
+    pass
+
+
+# Допустимое время измерения: не раньше 2000 года и не позже суток вперед от часов сервера
+EARLIEST_TIMESTAMP = 946684800
+FUTURE_TOLERANCE = 86400
+
+
+def finite_number(value):
+    """Конечное число из JSON или None; NaN, бесконечность и слишком большие целые - не числа."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    try:
+        value = float(value)
+    except OverflowError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+def parse_timestamp(value):
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value).timestamp()
+        except (ValueError, OverflowError, OSError):
+            value = None
+    timestamp = finite_number(value)
+    if timestamp is None:
+        raise ReadingError('Некорректное время измерения')
+    if not EARLIEST_TIMESTAMP <= timestamp <= time.time() + FUTURE_TOLERANCE:
+        raise ReadingError('Время измерения вне допустимого диапазона')
+    return int(timestamp)
+
+
+def parse_reading(reading, group_pool_ids):
+    """Проверяет одно измерение датчика и приводит его к строке Hydrochemistry.
+
+    Ошибка в одном измерении отклоняет только его, поэтому в очередь писателя
+    попадают лишь строки, которые можно сохранить.
+    """
+    if not isinstance(reading, dict):
+        raise ReadingError('Измерение должно быть объектом')
+    group_pool_id = reading.get('group_pool_id')
+    if not isinstance(group_pool_id, int) or group_pool_id not in group_pool_ids:
+        raise ReadingError('Неизвестный групповой бассейн')
+    row = {'group_pool_id': group_pool_id,
+           'hydrochem_date': parse_timestamp(reading.get('timestamp', reading.get('hydrochem_date')))}
+    for parameter in PARAMETERS:
+        value = reading.get(parameter)
+        row[parameter] = finite_number(value)
+        if value is not None and row[parameter] is None:
+            raise ReadingError(f'Некорректное значение {parameter}')
+    if all(row[parameter] is None for parameter in PARAMETERS):
+        raise ReadingError('Нет ни одного параметра')
+    return row
+
+
+def merge(target, row):
+    # Повторное измерение дополняет запись: заданные значения заменяют прежние, пустые не трогают
+    for parameter in PARAMETERS:
+        if row[parameter] is not None:
+            target[parameter] = row[parameter]
+    return target
+
+
+class IngestBuffer:
+    """Очередь измерений датчиков со сбросом в БД отдельным потоком.
+
+    Запросы только кладут проверенные строки в очередь и сразу отвечают; поток-писатель
+    забирает их пачками и сохраняет одной транзакцией, когда набралось max_batch строк
+    или прошло max_delay секунд с первой строки пачки. Пачка, которую не удалось сохранить
+    за retries попыток, дописывается в файл dead_letter (строки JSON) и не теряется.
+    """
+
+    def __init__(self, app, max_batch=5000, max_delay=1.0, max_queue=200000, retries=3, dead_letter=None):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retries = retries
+        self.dead_letter = dead_letter
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.flushed = 0
+        self.merged = 0
+        self.retried = 0
+        self.failed = 0
+        self._group_pool_ids = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def group_pool_ids(self):
+        """Идентификаторы групповых бассейнов; перечитываются после записи в group_pool из любого процесса."""
+        version = data_version(db.session, GroupPool.__table__.name)
+        cached = self._group_pool_ids
+        if cached is None or cached[0] != version:
+            cached = self._group_pool_ids = (version, {gp_id for gp_id, in db.session.query(GroupPool.id)})
+        return cached[1]
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='hydrochemistry-ingest', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, rows):
+        """Ставит строки в очередь; возвращает число принятых до заполнения очереди."""
+        self.start()
+        accepted = 0
+        for row in rows:
+            try:
+                self.queue.put_nowait(row)
+            except queue.Full:
+                break
+            accepted += 1
+        return accepted
+
+    def stats(self):
+        return {'queued': self.queue.qsize(), 'flushed': self.flushed, 'merged': self.merged,
+                'retried': self.retried, 'failed': self.failed}
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping.is_set():
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self.save(batch)
+
+    def save(self, batch):
+        """Сохраняет пачку с повторами; после последней неудачи пишет ее в dead_letter."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                # Обычная причина ошибки - БД занята другим писателем; пауза растет с каждой попыткой
+                self.retried += 1
+                metrics.increment('fish_ingest_batch_retries_total', {})
+                time.sleep(min(0.5 * 2 ** (attempt - 1), 5.0))
+            with self.app.app_context():
+                try:
+                    self.flush(batch)
+                    return True
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Не удалось сохранить пачку измерений (попытка %d из %d)',
+                                     attempt + 1, self.retries + 1)
+                finally:
+                    db.session.remove()
+        self.failed += len(batch)
+        metrics.increment('fish_ingest_failed_batches_total', {})
+        metrics.increment('fish_ingest_failed_readings_total', {}, len(batch))
+        self._write_dead_letter(batch)
+        return False
+
+    def _write_dead_letter(self, batch):
+        if not self.dead_letter:
+            logger.error('Пачка из %d измерений потеряна: файл для несохраненных измерений не задан', len(batch))
+            return
+        try:
+            os.makedirs(os.path.dirname(self.dead_letter) or '.', exist_ok=True)
+            with self._lock, open(self.dead_letter, 'a', encoding='utf-8') as file:
+                for row in batch:
+                    file.write(json.dumps(row) + '\n')
+        except OSError:
+            logger.exception('Не удалось записать %d измерений в %s', len(batch), self.dead_letter)
+        else:
+            logger.error('%d измерений записаны в %s, загрузите их командой replay-ingest',
+                         len(batch), self.dead_letter)
+
+    def flush(self, batch):
+        """Сохраняет пачку: новые ключи вставляются, существующие дополняются.
+
+        Сначала увеличивается версия таблицы: эта запись берет блокировку записи SQLite,
+        поэтому прежние значения читаются уже без гонки с другими процессами. Строки пишутся
+        через INSERT ... ON CONFLICT по уникальному ключу (бассейн, время), так что
+        повторное измерение не может создать дубликат.
+        """
+        pending = {}
+        for row in batch:
+            key = (row['group_pool_id'], row['hydrochem_date'])
+            pending[key] = merge(pending[key], row) if key in pending else dict(row)
+
+        bump(db.session, [Hydrochemistry.__table__.name])
+        existing = {}
+        columns = [Hydrochemistry.id, Hydrochemistry.group_pool_id, Hydrochemistry.hydrochem_date] + \
+                  [getattr(Hydrochemistry, parameter) for parameter in PARAMETERS]
+        keys = list(pending)
+        for start in range(0, len(keys), 500):
+            for found in db.session.execute(db.select(*columns).where(
+                    db.tuple_(Hydrochemistry.group_pool_id, Hydrochemistry.hydrochem_date).in_(keys[start:start + 500]))):
+                values = found._asdict()
+                existing[(values['group_pool_id'], values['hydrochem_date'])] = values
+
+        rows, changes = [], []
+        inserted = 0
+        for key, row in pending.items():
+            old = existing.get(key)
+            if old is None:
+                rows.append(row)
+                changes.append(Change('insert', row, None))
+                inserted += 1
+                continue
+            new = merge(dict(old), row)
+            if new != old:
+                rows.append(row)
+                changes.append(Change('update', new, old))
+
+        if rows:
+            table = Hydrochemistry.__table__
+            statement = insert(table)
+            # Пустое значение повтора не затирает сохраненное, как в merge
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.group_pool_id, table.c.hydrochem_date],
+                set_={parameter: func.coalesce(statement.excluded[parameter], table.c[parameter])
+                      for parameter in PARAMETERS}
+            ), rows)
+        record(db.session, Hydrochemistry.__table__.name, changes)
+        db.session.commit()
+        self.flushed += inserted
+        self.merged += len(batch) - inserted
+
+
+def replay_dead_letter(buffer, path):
+    """Повторно сохраняет измерения из файла dead_letter; несохраненные остаются в файле.
+
+    Возвращает (сохранено, осталось).
+    """
+    with open(path, encoding='utf-8') as file:
+        rows = [json.loads(line) for line in file if line.strip()]
+    os.replace(path, path + '.replay')
+    saved = 0
+    for start in range(0, len(rows), buffer.max_batch):
+        batch = rows[start:start + buffer.max_batch]
+        # Неудачная пачка снова попадет в path
+        if buffer.save(batch):
+            saved += len(batch)
+    os.remove(path + '.replay')
+    return saved, len(rows) - saved
+
+
+_buffer = None
+
+
+def dead_letter_path(app):
+    return app.config.get('INGEST_DEAD_LETTER') or os.path.join(app.instance_path, 'ingest-failed.jsonl')
+
+
+def get_buffer(app):
+    global _buffer
+    if _buffer is None:
+        _buffer = IngestBuffer(app, max_batch=app.config.get('INGEST_MAX_BATCH', 5000),
+                               max_delay=app.config.get('INGEST_MAX_DELAY', 1.0),
+                               max_queue=app.config.get('INGEST_MAX_QUEUE', 200000),
+                               retries=app.config.get('INGEST_RETRIES', 3),
+                               dead_letter=dead_letter_path(app))
+        atexit.register(_buffer.stop)
+    return _buffer
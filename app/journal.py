@@ -0,0 +1,68 @@
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from events import Change, record
+from models import db, Hydrochemistry, HYDROCHEMISTRY_PARAMETERS
+
+PARAMETERS = HYDROCHEMISTRY_PARAMETERS
+
+
+def existing_hydrochemistry_keys(keys):
+    """Какие из пар (group_pool_id, hydrochem_date) уже есть в журнале - одним запросом."""
+    if not keys:
+        return set()
+    return set(db.session.query(Hydrochemistry.group_pool_id, Hydrochemistry.hydrochem_date)
+               .filter(db.tuple_(Hydrochemistry.group_pool_id, Hydrochemistry.hydrochem_date).in_(list(keys)))
+               .all())
+
+
+def parse_journal_form(form, group_pools):
+    """Строки журнала из формы generate_journal.html и ошибки по групповым бассейнам."""
+    rows = []
+    errors = {}
+    for gp in group_pools:
+        if not form.get(f'select_{gp.id}'):
+            continue
+        try:
+            datetime_obj = datetime.strptime(form.get(f'date_{gp.id}') or '', '%Y-%m-%dT%H:%M')
+        except ValueError:
+            errors[gp.id] = f'Некорректный формат даты для группового бассейна {gp.name}'
+            continue
+
+        row = {'group_pool_id': gp.id, 'hydrochem_date': int(datetime_obj.timestamp())}
+        for parameter in PARAMETERS:
+            value = form.get(f'{parameter}_{gp.id}')
+            try:
+                row[parameter] = float(value) if value else None
+            except ValueError:
+                errors[gp.id] = f'Некорректное значение {parameter} для группового бассейна {gp.name}'
+                break
+        else:
+            rows.append(row)
+    return rows, errors
+
+
+def save_journal(rows, group_pools):
+    """Сохраняет журнал одной массовой вставкой или не сохраняет ничего.
+
+    Возвращает словарь ошибок group_pool_id -> сообщение; если он не пуст,
+    транзакция откатывается целиком.
+    """
+    names = {gp.id: gp.name for gp in group_pools}
+    existing = existing_hydrochemistry_keys({(row['group_pool_id'], row['hydrochem_date']) for row in rows})
+    errors = {
+        row['group_pool_id']: f'Запись для группового бассейна {names.get(row["group_pool_id"])} на эту дату уже существует'
+        for row in rows if (row['group_pool_id'], row['hydrochem_date']) in existing
+    }
+    if errors or not rows:
+        return errors
+
+    try:
+        db.session.execute(Hydrochemistry.__table__.insert(), rows)
+        record(db.session, Hydrochemistry.__table__.name, [Change('insert', row, None) for row in rows])
+        db.session.commit()
+    except IntegrityError as error:
+        db.session.rollback()
+        return {row['group_pool_id']: f'Журнал не сохранен: {error.orig}' for row in rows}
+    return {}
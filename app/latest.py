@@ -0,0 +1,159 @@
+from collections import defaultdict
+
+from sqlalchemy import select, func, case, and_, or_
+from sqlalchemy.dialects.sqlite import insert
+
+from archive import archive_connections
+from events import subscribe
+from models import db, Pool, GroupPool, Hydrochemistry, group_pool_pool, hydrochemistry_latest, \
+                   HYDROCHEMISTRY_PARAMETERS as PARAMETERS
+
+
+def merge_newest(newest, group_pool_id, parameter, date, value):
+    current = newest[group_pool_id].get(parameter)
+    if value is not None and (current is None or date >= current[0]):
+        newest[group_pool_id][parameter] = (date, value)
+
+
+def latest_rows(newest):
+    """Строки таблицы последних значений из {group_pool_id: {параметр: (дата, значение)}}."""
+    rows = []
+    for group_pool_id, values in newest.items():
+        if not values:
+            continue
+        row = {'group_pool_id': group_pool_id, 'hydrochem_date': max(date for date, _ in values.values())}
+        for parameter in PARAMETERS:
+            row[f'{parameter}_date'], row[parameter] = values.get(parameter, (None, None))
+        rows.append(row)
+    return rows
+
+
+def apply_readings(executor, readings):
+    """Учитывает новые измерения: значение параметра заменяется, если оно не старше сохраненного."""
+    newest = defaultdict(dict)
+    for reading in readings:
+        for parameter in PARAMETERS:
+            merge_newest(newest, reading['group_pool_id'], parameter, reading['hydrochem_date'],
+                         reading.get(parameter))
+    rows = latest_rows(newest)
+    if not rows:
+        return
+    statement = insert(hydrochemistry_latest)
+    excluded = statement.excluded
+    table = hydrochemistry_latest.c
+    values = {'hydrochem_date': func.max(func.coalesce(table.hydrochem_date, excluded.hydrochem_date),
+                                         excluded.hydrochem_date)}
+    for parameter in PARAMETERS:
+        date = table[f'{parameter}_date']
+        newer = and_(excluded[f'{parameter}_date'].isnot(None),
+                     or_(date.is_(None), excluded[f'{parameter}_date'] >= date))
+        values[parameter] = case((newer, excluded[parameter]), else_=table[parameter])
+        values[f'{parameter}_date'] = case((newer, excluded[f'{parameter}_date']), else_=date)
+    executor.execute(statement.on_conflict_do_update(index_elements=['group_pool_id'], set_=values), rows)
+
+
+def newest_statement(parameter, group_pool_id=None):
+    """Самое новое непустое значение параметра: по одному бассейну или по всем сразу."""
+    column = getattr(Hydrochemistry, parameter)
+    if group_pool_id is not None:
+        # Обратный проход по индексу (group_pool_id, hydrochem_date) до первого заполненного значения
+        return select(Hydrochemistry.group_pool_id, Hydrochemistry.hydrochem_date, column)\
+            .where(Hydrochemistry.group_pool_id == group_pool_id, column.isnot(None))\
+            .order_by(Hydrochemistry.hydrochem_date.desc()).limit(1)
+    # SQLite берет значение столбца без агрегата из строки с максимальной датой
+    return select(Hydrochemistry.group_pool_id, func.max(Hydrochemistry.hydrochem_date), column)\
+        .where(column.isnot(None)).group_by(Hydrochemistry.group_pool_id)
+
+
+def refresh_latest(executor, group_pool_ids=None):
+    """Пересчитывает последние значения групповых бассейнов (всех, если None) по журналу и архиву."""
+    newest = defaultdict(dict)
+    for group_pool_id in group_pool_ids or ():
+        newest[group_pool_id] = {}
+    for parameter in PARAMETERS:
+        statements = [newest_statement(parameter)] if group_pool_ids is None else \
+            [newest_statement(parameter, group_pool_id) for group_pool_id in group_pool_ids]
+        for statement in statements:
+            for group_pool_id, date, value in executor.execute(statement):
+                merge_newest(newest, group_pool_id, parameter, date, value)
+
+    # Архив хранит более старые месяцы, поэтому из него берутся только недостающие значения
+    missing = {parameter: [group_pool_id for group_pool_id, values in newest.items() if parameter not in values]
+               for parameter in PARAMETERS}
+    if group_pool_ids is None or any(missing.values()):
+        for conn in archive_connections('hydrochemistry', executor=executor):
+            for parameter in PARAMETERS:
+                statement = newest_statement(parameter)
+                if group_pool_ids is not None:
+                    if not missing[parameter]:
+                        continue
+                    statement = statement.where(Hydrochemistry.group_pool_id.in_(missing[parameter]))
+                for group_pool_id, date, value in conn.execute(statement):
+                    merge_newest(newest, group_pool_id, parameter, date, value)
+
+    delete = hydrochemistry_latest.delete()
+    if group_pool_ids is not None:
+        delete = delete.where(hydrochemistry_latest.c.group_pool_id.in_(list(group_pool_ids)))
+    executor.execute(delete)
+    rows = latest_rows(newest)
+    if rows:
+        executor.execute(hydrochemistry_latest.insert(), rows)
+
+
+def rebuild_latest(executor):
+    """Полностью перестраивает таблицу последних значений по журналу и архиву."""
+    refresh_latest(executor)
+
+
+def withdrawn(change):
+    """Может ли изменение убрать из журнала сохраненное последнее значение."""
+    if change.op == 'delete':
+        return True
+    row, old = change.row, change.old
+    if old is None:
+        return False
+    return row['group_pool_id'] != old['group_pool_id'] or row['hydrochem_date'] != old['hydrochem_date'] or \
+        any(old.get(parameter) is not None and row.get(parameter) is None for parameter in PARAMETERS)
+
+
+def water_status_statement(pool_ids=None):
+    """Бассейны с последними значениями параметров их групповых бассейнов одним запросом.
+
+    Бассейн, входящий в несколько групповых бассейнов, дает строку на каждый из них.
+    """
+    statement = select(Pool.id.label('pool_id'), Pool.name.label('pool_name'),
+                       GroupPool.id.label('group_pool_id'), GroupPool.name.label('group_pool_name'),
+                       *[column for column in hydrochemistry_latest.columns if column.key != 'group_pool_id'])\
+        .select_from(Pool)\
+        .outerjoin(group_pool_pool, group_pool_pool.c.pool_id == Pool.id)\
+        .outerjoin(GroupPool, GroupPool.id == group_pool_pool.c.group_pool_id)\
+        .outerjoin(hydrochemistry_latest, hydrochemistry_latest.c.group_pool_id == GroupPool.id)\
+        .order_by(Pool.id, GroupPool.id)
+    if pool_ids is not None:
+        statement = statement.where(Pool.id.in_(pool_ids))
+    return statement
+
+
+def water_status():
+    return db.session.execute(water_status_statement()).mappings().all()
+
+
+@subscribe('hydrochemistry')
+def _on_hydrochemistry(session, changes):
+    stale = set()
+    for change in changes:
+        if withdrawn(change):
+            stale.add(change.old['group_pool_id'])
+            stale.add(change.row['group_pool_id'])
+    if stale:
+        # Пересчет читает журнал уже с изменениями транзакции, в том числе новыми измерениями
+        refresh_latest(session, stale)
+    apply_readings(session, [change.row for change in changes
+                             if change.op != 'delete' and change.row['group_pool_id'] not in stale])
+
+
+@subscribe('group_pool')
+def _on_group_pool(session, changes):
+    deleted = [change.row['id'] for change in changes if change.op == 'delete']
+    if deleted:
+        session.execute(hydrochemistry_latest.delete().where(hydrochemistry_latest.c.group_pool_id.in_(deleted)))
@@ -0,0 +1,76 @@
+"""Запуск для app.exe: сервер отвечает сразу, приложение загружается в фоне.
+
+Пока импортируется приложение и выполняются миграции, /ready отвечает 503,
+а остальные адреса - страницей ожидания, которая обновляется сама. Затем все
+запросы передаются приложению. Адрес и число потоков задаются переменными
+окружения HOST, PORT и WEB_THREADS. Без пакета waitress используется
+сервер Werkzeug с потоками (без отладчика и перезапуска).
+
+Это точка входа app.exe (см. app.spec в корне репозитория); app.py при прямом
+запуске поднимает только сервер разработки.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from startup import STARTED, readiness
+
+logger = logging.getLogger(__name__)
+
+LOADING_PAGE = '''<!doctype html>
+<html lang="ru"><head><meta charset="utf-8"><meta http-equiv="refresh" content="1">
+<title>Загрузка</title></head>
+<body style="font-family: sans-serif; margin: 3em">Приложение запускается, подождите...</body></html>
+'''.encode('utf-8')
+
+
+class Launcher:
+    """WSGI-приложение, которое передает запросы основному после его загрузки."""
+
+    def __init__(self):
+        self.app = None
+        self.error = None
+
+    def load(self):
+        try:
+            from app import prepare_app
+            self.app = prepare_app()
+        except Exception as error:
+            logger.exception('Не удалось запустить приложение')
+            self.error = f'{type(error).__name__}: {error}'
+
+    def __call__(self, environ, start_response):
+        app = self.app
+        if app is not None:
+            return app(environ, start_response)
+        if environ.get('PATH_INFO') == '/ready':
+            body = json.dumps({**readiness(), 'error': self.error}).encode('utf-8')
+            start_response('503 Service Unavailable', [('Content-Type', 'application/json'),
+                                                       ('Content-Length', str(len(body))), ('Retry-After', '1')])
+            return [body]
+        start_response('503 Service Unavailable', [('Content-Type', 'text/html; charset=utf-8'),
+                                                   ('Content-Length', str(len(LOADING_PAGE))), ('Retry-After', '1')])
+        return [LOADING_PAGE]
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    host = os.environ.get('HOST', '127.0.0.1')
+    port = int(os.environ.get('PORT', 5000))
+    threads = int(os.environ.get('WEB_THREADS', 8))
+    launcher = Launcher()
+    threading.Thread(target=launcher.load, name='load-app', daemon=True).start()
+    logger.info('Запуск сервера на %s:%d через %.3f с после старта процесса', host, port, time.time() - STARTED)
+    try:
+        from waitress import serve
+    except ImportError:
+        from werkzeug.serving import run_simple
+        run_simple(host, port, launcher, threaded=True)
+    else:
+        serve(launcher, host=host, port=port, threads=threads)
+
+
+if __name__ == '__main__':
+    main()
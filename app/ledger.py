@@ -0,0 +1,181 @@
+from sqlalchemy import select, func, union
+from sqlalchemy.dialects.sqlite import insert
+
+from archive import archive_connections
+from events import subscribe
+from models import db, FishInventory, FishBoning, FishMovement, PoolStock
+
+
+def checkpoint(executor, pool_id, fish_type_id, at=None):
+    """Последняя инвентаризация пары (бассейн, вид рыбы): дата, количество и биомасса.
+
+    Если на одну дату заведено несколько инвентаризаций, их бонитировки складываются,
+    как и в сводной таблице состава рыбы.
+    """
+    latest = select(func.max(FishInventory.control_date))\
+        .where(FishInventory.pool_id == pool_id, FishInventory.fish_type_id == fish_type_id)
+    if at is not None:
+        latest = latest.where(FishInventory.control_date <= at)
+    checkpoint_date = executor.execute(latest).scalar()
+    if checkpoint_date is None:
+        return None, 0, 0.0
+
+    count, biomass = executor.execute(
+        select(func.coalesce(func.sum(FishBoning.fish_number), 0),
+               func.coalesce(func.sum(FishBoning.fish_biomass), 0.0))
+        .select_from(FishInventory)
+        .join(FishBoning, FishBoning.fish_inventory_id == FishInventory.id)
+        .where(FishInventory.pool_id == pool_id, FishInventory.fish_type_id == fish_type_id,
+               FishInventory.control_date == checkpoint_date)
+    ).one()
+    return checkpoint_date, count, biomass
+
+
+def moved_biomass(executor, pool_column, pool_id, fish_type_id, after=None, at=None):
+    """Биомасса перемещений пары за (after, at] по основной БД и частям архива за этот период.
+
+    В архив уходят только перемещения не позже текущей инвентаризации, но запас
+    на более раннюю дату или после удаления инвентаризации считается и по ним.
+    """
+    query = select(func.coalesce(func.sum(FishMovement.fish_biomass), 0.0))\
+        .where(pool_column == pool_id, FishMovement.fish_type_id == fish_type_id)
+    if after is not None:
+        query = query.where(FishMovement.movement_date > after)
+    if at is not None:
+        query = query.where(FishMovement.movement_date <= at)
+    total = executor.execute(query).scalar()
+    for conn in archive_connections('fish_movement', after, at, executor):
+        total += conn.execute(query).scalar()
+    return total
+
+
+def compute_stock(executor, pool_id, fish_type_id, at=None):
+    """Запас пары на момент at: инвентаризация плюс перемещения после нее.
+
+    Перемещения выбираются по индексам (бассейн, вид, дата) начиная с даты
+    инвентаризации, поэтому стоимость растет только с числом событий после нее.
+    """
+    checkpoint_date, count, checkpoint_biomass = checkpoint(executor, pool_id, fish_type_id, at)
+    moved_in = moved_biomass(executor, FishMovement.pool_id_to, pool_id, fish_type_id, checkpoint_date, at)
+    moved_out = moved_biomass(executor, FishMovement.pool_id_from, pool_id, fish_type_id, checkpoint_date, at)
+    return {
+        'pool_id': pool_id,
+        'fish_type_id': fish_type_id,
+        'checkpoint_date': checkpoint_date,
+        'checkpoint_count': count,
+        'checkpoint_biomass': checkpoint_biomass,
+        'biomass': checkpoint_biomass + moved_in - moved_out,
+    }
+
+
+def stock_pairs(executor, pool_id=None):
+    """Пары (бассейн, вид рыбы), по которым есть инвентаризации или перемещения, в том числе архивные."""
+    queries = [
+        select(FishInventory.pool_id, FishInventory.fish_type_id),
+        select(FishMovement.pool_id_to, FishMovement.fish_type_id).where(FishMovement.pool_id_to.isnot(None)),
+        select(FishMovement.pool_id_from, FishMovement.fish_type_id).where(FishMovement.pool_id_from.isnot(None)),
+    ]
+    if pool_id is not None:
+        queries = [
+            queries[0].where(FishInventory.pool_id == pool_id),
+            queries[1].where(FishMovement.pool_id_to == pool_id),
+            queries[2].where(FishMovement.pool_id_from == pool_id),
+        ]
+    pairs = {tuple(row) for row in executor.execute(union(*queries))}
+    for conn in archive_connections('fish_movement', executor=executor):
+        pairs.update(tuple(row) for row in conn.execute(union(*queries[1:])))
+    return list(pairs)
+
+
+def stock_at(pool_id, timestamp, executor=None):
+    """Биомасса каждого вида рыбы в бассейне на момент timestamp: {fish_type_id: биомасса}."""
+    executor = executor or db.session
+    return {
+        fish_type_id: compute_stock(executor, pool_id, fish_type_id, timestamp)['biomass']
+        for _, fish_type_id in stock_pairs(executor, pool_id)
+    }
+
+
+def refresh_stock(executor, pairs):
+    """Пересчитывает строки журнала запасов для указанных пар (бассейн, вид рыбы)."""
+    rows = [compute_stock(executor, pool_id, fish_type_id) for pool_id, fish_type_id in pairs
+            if pool_id is not None and fish_type_id is not None]
+    if not rows:
+        return
+    statement = insert(PoolStock.__table__)
+    executor.execute(statement.on_conflict_do_update(
+        index_elements=['pool_id', 'fish_type_id'],
+        set_={key: statement.excluded[key] for key in
+              ('checkpoint_date', 'checkpoint_count', 'checkpoint_biomass', 'biomass')}
+    ), rows)
+
+
+def rebuild_ledger(executor):
+    """Полностью перестраивает журнал запасов по инвентаризациям и перемещениям."""
+    executor.execute(PoolStock.__table__.delete())
+    refresh_stock(executor, stock_pairs(executor))
+
+
+def apply_movement(executor, pool_id, fish_type_id, movement_date, delta):
+    """Учитывает новое перемещение без пересчета, если оно позже инвентаризации."""
+    stock = executor.execute(
+        select(PoolStock.checkpoint_date)
+        .where(PoolStock.pool_id == pool_id, PoolStock.fish_type_id == fish_type_id)
+    ).first()
+    if stock is None or (stock.checkpoint_date is not None and movement_date <= stock.checkpoint_date):
+        refresh_stock(executor, [(pool_id, fish_type_id)])
+        return
+    executor.execute(
+        PoolStock.__table__.update()
+        .where(PoolStock.pool_id == pool_id, PoolStock.fish_type_id == fish_type_id)
+        .values(biomass=PoolStock.biomass + delta)
+    )
+
+
+@subscribe('fish_movement')
+def _on_movement(session, changes):
+    pairs = set()
+    for change in changes:
+        if change.op == 'insert':
+            row = change.row
+            if row['pool_id_to'] is not None:
+                apply_movement(session, row['pool_id_to'], row['fish_type_id'], row['movement_date'],
+                               row['fish_biomass'])
+            if row['pool_id_from'] is not None:
+                apply_movement(session, row['pool_id_from'], row['fish_type_id'], row['movement_date'],
+                               -row['fish_biomass'])
+            continue
+        for values in (change.row, change.old):
+            pairs.add((values['pool_id_to'], values['fish_type_id']))
+            pairs.add((values['pool_id_from'], values['fish_type_id']))
+    refresh_stock(session, pairs)
+
+
+@subscribe('fish_inventory')
+def _on_inventory(session, changes):
+    pairs = set()
+    for change in changes:
+        pairs.add((change.row['pool_id'], change.row['fish_type_id']))
+        if change.old is not None:
+            pairs.add((change.old['pool_id'], change.old['fish_type_id']))
+    refresh_stock(session, pairs)
+
+
+@subscribe('fish_boning')
+def _on_boning(session, changes):
+    inventory_ids = set()
+    for change in changes:
+        inventory_ids.add(change.row['fish_inventory_id'])
+        if change.old is not None:
+            inventory_ids.add(change.old['fish_inventory_id'])
+    pairs = session.execute(
+        select(FishInventory.pool_id, FishInventory.fish_type_id).where(FishInventory.id.in_(inventory_ids))
+    ).all()
+    refresh_stock(session, {tuple(pair) for pair in pairs})
+
+
+@subscribe('pool')
+def _on_pool(session, changes):
+    deleted = [change.row['id'] for change in changes if change.op == 'delete']
+    if deleted:
+        session.execute(PoolStock.__table__.delete().where(PoolStock.pool_id.in_(deleted)))
@@ -0,0 +1,143 @@
+import bisect
+import logging
+import threading
+import time
+
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histogram:
+    """Гистограмма в смысле Prometheus: накопленные счетчики по верхним границам."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+def format_labels(labels):
+    return ','.join(f'{key}="{str(value)}"' for key, value in labels)
+
+
+class Metrics:
+    """Метрики запросов: время ответа, число и время SQL-запросов, время отрисовки шаблонов."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.app = None
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('METRICS_QUERY_BUDGET', 50)
+        app.config.setdefault('METRICS_LATENCY_BUDGET', 1.0)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        before_render_template.connect(self._start_render, app)
+        template_rendered.connect(self._finish_render, app)
+        event.listen(Engine, 'before_cursor_execute', self._start_query)
+        event.listen(Engine, 'after_cursor_execute', self._finish_query)
+
+    def _start_request(self):
+        g.metrics = {'start': time.perf_counter(), 'queries': 0, 'sql_time': 0.0, 'render_time': 0.0}
+
+    def _finish_request(self, response):
+        state = g.pop('metrics', None)
+        if state is None:
+            return response
+        elapsed = time.perf_counter() - state['start']
+        endpoint = request.endpoint or 'unknown'
+        labels = {'endpoint': endpoint}
+        self.observe('fish_http_request_duration_seconds', labels, elapsed, LATENCY_BUCKETS)
+        self.observe('fish_sql_queries_per_request', labels, state['queries'], QUERY_BUCKETS)
+        self.observe('fish_sql_duration_seconds_per_request', labels, state['sql_time'], LATENCY_BUCKETS)
+        self.increment('fish_http_requests_total', {'endpoint': endpoint, 'status': response.status_code})
+
+        config = self.app.config
+        if state['queries'] > config['METRICS_QUERY_BUDGET']:
+            self.increment('fish_budget_exceeded_total', {'endpoint': endpoint, 'budget': 'queries'})
+            logger.warning('%s %s: %d SQL-запросов при бюджете %d', request.method, request.path,
+                           state['queries'], config['METRICS_QUERY_BUDGET'])
+        if elapsed > config['METRICS_LATENCY_BUDGET']:
+            self.increment('fish_budget_exceeded_total', {'endpoint': endpoint, 'budget': 'latency'})
+            logger.warning('%s %s: ответ за %.3f с при бюджете %.3f с (SQL %.3f с, шаблоны %.3f с)',
+                           request.method, request.path, elapsed, config['METRICS_LATENCY_BUDGET'],
+                           state['sql_time'], state['render_time'])
+        return response
+
+    def _start_render(self, sender, template, context, **extra):
+        if has_request_context() and 'metrics' in g:
+            g.metrics.setdefault('renders', []).append(time.perf_counter())
+
+    def _finish_render(self, sender, template, context, **extra):
+        if not (has_request_context() and 'metrics' in g and g.metrics.get('renders')):
+            return
+        elapsed = time.perf_counter() - g.metrics['renders'].pop()
+        g.metrics['render_time'] += elapsed
+        self.observe('fish_template_render_seconds', {'template': template.name}, elapsed, LATENCY_BUCKETS)
+
+    def _start_query(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _finish_query(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_start'].pop()
+        # Запросы фоновых потоков (прием данных датчиков) к страницам не относятся
+        if has_request_context() and 'metrics' in g:
+            g.metrics['queries'] += 1
+            g.metrics['sql_time'] += time.perf_counter() - started
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        lines = []
+        declared = set()
+        for (name, labels), histogram in histograms:
+            if name not in declared:
+                lines.append(f'# TYPE {name} histogram')
+                declared.add(name)
+            for bound, total in histogram.samples():
+                lines.append(f'{name}_bucket{{{format_labels(labels + (("le", bound),))}}} {total}')
+            lines.append(f'{name}_sum{{{format_labels(labels)}}} {histogram.sum}')
+            lines.append(f'{name}_count{{{format_labels(labels)}}} {sum(histogram.counts)}')
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f'# TYPE {name} counter')
+                declared.add(name)
+            lines.append(f'{name}{{{format_labels(labels)}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,206 @@
+import re
+
+from sqlalchemy import select, func
+
+from fcr import rebuild_rollups
+from ledger import rebuild_ledger
+from models import db, Hydrochemistry, FishInventory, FishBoning, Feed, FishMovement,\
+                   hydrochemistry_hourly, hydrochemistry_daily, Alert, HydrochemistryAnomaly, \
+                   HYDROCHEMISTRY_PARAMETERS as PARAMETERS
+from rollups import rebuild_hydrochemistry_rollups
+from alerts import recent_window_statement
+from stock import boning_totals_statement
+from latest import rebuild_latest, water_status_statement
+from pagination import keyset_order
+from versions import seed_versions, period_versions_statement
+
+# Миграции схемы: номер версии хранится в PRAGMA user_version файла SQLite
+MIGRATIONS = []
+
+
+def migration(version):
+    def decorator(step):
+        MIGRATIONS.append((version, step))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return step
+    return decorator
+
+
+def schema_version(conn):
+    return conn.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def upgrade_database():
+    """Создает недостающие таблицы и применяет к БД невыполненные миграции."""
+    db.create_all()
+    with db.engine.begin() as conn:
+        version = schema_version(conn)
+        for target, step in MIGRATIONS:
+            if target > version:
+                step(conn)
+                conn.exec_driver_sql(f'PRAGMA user_version = {int(target)}')
+                version = target
+    return version
+
+
+def create_index(conn, name, table, *columns, unique=False):
+    # Миграции описывают индексы своей версии схемы явно, а не берут их из текущих моделей
+    conn.exec_driver_sql(f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {name} '
+                         f'ON {table} ({", ".join(columns)})')
+
+
+def merge_duplicate_readings(conn):
+    """Сливает строки журнала с одинаковыми бассейном и временем в строку с меньшим id.
+
+    Значения более поздних строк заменяют прежние, пустые их не затирают - как при
+    повторном приеме измерения. Возвращает число удаленных строк.
+    """
+    table = Hydrochemistry.__table__
+    duplicates = conn.execute(
+        select(table.c.group_pool_id, table.c.hydrochem_date)
+        .group_by(table.c.group_pool_id, table.c.hydrochem_date).having(func.count() > 1)).all()
+    removed = []
+    for group_pool_id, hydrochem_date in duplicates:
+        rows = conn.execute(select(table).where(table.c.group_pool_id == group_pool_id,
+                                                table.c.hydrochem_date == hydrochem_date)
+                            .order_by(table.c.id)).mappings().all()
+        values = {parameter: rows[0][parameter] for parameter in PARAMETERS}
+        for row in rows[1:]:
+            values.update({parameter: row[parameter] for parameter in PARAMETERS if row[parameter] is not None})
+        conn.execute(table.update().where(table.c.id == rows[0]['id']).values(values))
+        removed += [row['id'] for row in rows[1:]]
+    for start in range(0, len(removed), 500):
+        chunk = removed[start:start + 500]
+        conn.execute(HydrochemistryAnomaly.__table__.delete().where(HydrochemistryAnomaly.hydrochemistry_id.in_(chunk)))
+        conn.execute(table.delete().where(table.c.id.in_(chunk)))
+    if removed:
+        rebuild_hydrochemistry_rollups(conn)
+        rebuild_latest(conn)
+    return len(removed)
+
+
+@migration(1)
+def add_time_range_indexes(conn):
+    create_index(conn, 'ix_group_pool_pool_pool', 'group_pool_pool', 'pool_id')
+    create_index(conn, 'ix_hydrochemistry_date', 'hydrochemistry', 'hydrochem_date')
+    create_index(conn, 'ix_hydrochemistry_group_pool_date', 'hydrochemistry', 'group_pool_id', 'hydrochem_date')
+    create_index(conn, 'ix_fish_inventory_pool_type_date', 'fish_inventory', 'pool_id', 'fish_type_id', 'control_date')
+    create_index(conn, 'ix_fish_boning_inventory', 'fish_boning', 'fish_inventory_id')
+    create_index(conn, 'ix_feed_pool_date', 'feed', 'pool_id', 'feed_date')
+    create_index(conn, 'ix_fish_movement_date', 'fish_movement', 'movement_date')
+
+
+@migration(2)
+def add_pool_stock_ledger(conn):
+    create_index(conn, 'ix_fish_movement_to_type_date', 'fish_movement', 'pool_id_to', 'fish_type_id', 'movement_date')
+    create_index(conn, 'ix_fish_movement_from_type_date', 'fish_movement',
+                 'pool_id_from', 'fish_type_id', 'movement_date')
+    rebuild_ledger(conn)
+
+
+@migration(3)
+def add_fcr_rollups(conn):
+    rebuild_rollups(conn)
+
+
+@migration(4)
+def add_hydrochemistry_rollups(conn):
+    rebuild_hydrochemistry_rollups(conn)
+
+
+@migration(5)
+def add_inventory_date_index(conn):
+    create_index(conn, 'ix_fish_inventory_date', 'fish_inventory', 'control_date')
+
+
+@migration(6)
+def add_hydrochemistry_latest(conn):
+    rebuild_latest(conn)
+
+
+@migration(7)
+def add_table_versions(conn):
+    seed_versions(conn, [table.name for table in db.metadata.sorted_tables])
+
+
+@migration(8)
+def add_hydrochemistry_unique_key(conn):
+    # Индекс (бассейн, время) становится уникальным, старые повторы сначала сливаются
+    merge_duplicate_readings(conn)
+    conn.exec_driver_sql('DROP INDEX IF EXISTS ix_hydrochemistry_group_pool_date')
+    create_index(conn, 'ix_hydrochemistry_group_pool_date', 'hydrochemistry', 'group_pool_id', 'hydrochem_date',
+                 unique=True)
+
+
+@migration(9)
+def add_anomaly_flag(conn):
+    # Раньше хранились только аномальные измерения, поэтому прежние строки отмечены
+    columns = [row[1] for row in conn.exec_driver_sql('PRAGMA table_info(hydrochemistry_anomaly)')]
+    if 'flagged' not in columns:
+        conn.exec_driver_sql('ALTER TABLE hydrochemistry_anomaly ADD COLUMN flagged BOOLEAN NOT NULL DEFAULT 1')
+    conn.exec_driver_sql('DROP INDEX IF EXISTS ix_hydrochemistry_anomaly_parameter_date')
+    create_index(conn, 'ix_hydrochemistry_anomaly_parameter_flagged_date', 'hydrochemistry_anomaly',
+                 'parameter', 'flagged', 'hydrochem_date')
+
+
+# Запросы, которые выполняются на каждой странице журналов и графиков. Отчет о составе
+# стада (последние инвентаризации всех бассейнов) читает таблицу целиком и сюда не входит
+def hot_queries():
+    return {
+        # Версии периодов для ключа кэша графиков, на каждый запрос графика
+        'plot_period_versions': period_versions_statement(0, 1),
+        'hydrochemistry_range': select(Hydrochemistry.id)
+            .where(Hydrochemistry.hydrochem_date.between(0, 1))
+            .order_by(Hydrochemistry.hydrochem_date, Hydrochemistry.id),
+        'hydrochemistry_duplicate': select(Hydrochemistry.id)
+            .where(Hydrochemistry.group_pool_id == 1, Hydrochemistry.hydrochem_date == 0),
+        'hydrochemistry_group_pool_range': select(Hydrochemistry.id)
+            .where(Hydrochemistry.group_pool_id == 1, Hydrochemistry.hydrochem_date.between(0, 1)),
+        # На странице бассейнов читаются все бассейны; здесь проверяются соединения с ними
+        'pool_water_status': water_status_statement([1, 2]),
+        'hydrochemistry_group_pool_latest': select(Hydrochemistry.hydrochem_date)
+            .where(Hydrochemistry.group_pool_id == 1, Hydrochemistry.doxy.isnot(None))
+            .order_by(Hydrochemistry.hydrochem_date.desc()).limit(1),
+        'anomaly_points': select(HydrochemistryAnomaly.hydrochem_date)
+            .where(HydrochemistryAnomaly.parameter == 'ph', HydrochemistryAnomaly.flagged,
+                   HydrochemistryAnomaly.hydrochem_date.between(0, 1)),
+        'fish_boning_by_inventory': select(FishBoning.id).where(FishBoning.fish_inventory_id == 1),
+        # Первая страница журнала - проход по индексу даты до LIMIT; следующие ищут по курсору
+        'fish_inventory_page': keyset_order(select(FishInventory.id), FishInventory.control_date, FishInventory.id,
+                                            [0, 1], reverse=True).limit(1),
+        'fish_boning_totals': boning_totals_statement([1, 2]),
+        'hydrochemistry_hourly_range': select(hydrochemistry_hourly.c.bucket)
+            .where(hydrochemistry_hourly.c.bucket.between(0, 1), hydrochemistry_hourly.c.doxy_count > 0),
+        'hydrochemistry_daily_counts': select(hydrochemistry_daily.c.group_pool_id, func.sum(hydrochemistry_daily.c.doxy_count))
+            .where(hydrochemistry_daily.c.bucket.between(0, 1))
+            .group_by(hydrochemistry_daily.c.group_pool_id),
+        'hydrochemistry_hourly_refresh': select(hydrochemistry_hourly.c.bucket)
+            .where(hydrochemistry_hourly.c.group_pool_id.in_([1, 2]), hydrochemistry_hourly.c.bucket.between(0, 1)),
+        'alert_recent_window': recent_window_statement([1, 2], 3600),
+        'alert_active': select(Alert.id).where(Alert.resolved_at.is_(None), Alert.group_pool_id.in_([1, 2])),
+        'feed_pool_range': select(Feed.id).where(Feed.pool_id == 1, Feed.feed_date.between(0, 1)),
+        'fish_movement_range': select(FishMovement.id).where(FishMovement.movement_date.between(0, 1)),
+        'stock_moved_in': select(func.sum(FishMovement.fish_biomass))
+            .where(FishMovement.pool_id_to == 1, FishMovement.fish_type_id == 1, FishMovement.movement_date > 0),
+        'stock_moved_out': select(func.sum(FishMovement.fish_biomass))
+            .where(FishMovement.pool_id_from == 1, FishMovement.fish_type_id == 1, FishMovement.movement_date > 0),
+    }
+
+
+# Любой SCAN таблицы - полный проход, в том числе по индексу (USING [COVERING] INDEX):
+# у него нет условия поиска, в отличие от SEARCH
+_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: USING (?:COVERING )?INDEX \w+)?$')
+
+
+def check_query_plans(conn):
+    """Прогоняет горячие запросы через EXPLAIN QUERY PLAN и возвращает найденные полные сканирования."""
+    failures = []
+    for name, statement in hot_queries().items():
+        sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+        for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql):
+            detail = row[-1]
+            match = _FULL_SCAN.match(detail)
+            # Просмотр материализованного подзапроса - не полное сканирование таблицы
+            if match and match.group(1) in db.metadata.tables:
+                failures.append((name, detail))
+    return failures
@@ -19,7 +19,8 @@ class GroupPool(db.Model):
 
 group_pool_pool = db.Table('group_pool_pool',
     db.Column('group_pool_id', db.Integer, db.ForeignKey('group_pool.id'), primary_key=True),
-    db.Column('pool_id', db.Integer, db.ForeignKey('pool.id'), primary_key=True)
+    db.Column('pool_id', db.Integer, db.ForeignKey('pool.id'), primary_key=True),
+    db.Index('ix_group_pool_pool_pool', 'pool_id')
 )
 
 class Hydrochemistry(db.Model):
@@ -38,6 +39,61 @@ class Hydrochemistry(db.Model):
 
     group_pool = db.relationship('GroupPool', backref='hydrochemistry_records')
 
+    __table_args__ = (
+        db.Index('ix_hydrochemistry_date', 'hydrochem_date'),
+        # Одно измерение на групповой бассейн и время: прием данных сливает повторы через ON CONFLICT
+        db.Index('ix_hydrochemistry_group_pool_date', 'group_pool_id', 'hydrochem_date', unique=True),
+    )
+
+HYDROCHEMISTRY_PARAMETERS = ['doxy', 'temperature', 'ph', 'no2', 'no3', 'nh4', 'po4', 'salinity', 'illumination']
+
+def hydrochemistry_rollup_table(name):
+    """Сводка гидрохимии по интервалам: min/max/mean/count каждого параметра по групповому бассейну."""
+    columns = []
+    for parameter in HYDROCHEMISTRY_PARAMETERS:
+        columns += [db.Column(f'{parameter}_min', db.Float, nullable=True),
+                    db.Column(f'{parameter}_max', db.Float, nullable=True),
+                    db.Column(f'{parameter}_mean', db.Float, nullable=True),
+                    db.Column(f'{parameter}_count', db.Integer, nullable=False, default=0)]
+    return db.Table(name,
+        db.Column('group_pool_id', db.Integer, db.ForeignKey('group_pool.id'), primary_key=True),
+        db.Column('bucket', db.Integer, primary_key=True),
+        *columns,
+        db.Index(f'ix_{name}_bucket', 'bucket')
+    )
+
+# bucket - начало часа или местных суток
+hydrochemistry_hourly = hydrochemistry_rollup_table('hydrochemistry_hourly')
+hydrochemistry_daily = hydrochemistry_rollup_table('hydrochemistry_daily')
+
+# Последнее известное значение каждого параметра по групповому бассейну и время его измерения.
+# Параметры журнала необязательны, поэтому значения могут быть взяты из разных измерений;
+# hydrochem_date - время самого нового из них
+hydrochemistry_latest = db.Table('hydrochemistry_latest',
+    db.Column('group_pool_id', db.Integer, db.ForeignKey('group_pool.id'), primary_key=True),
+    db.Column('hydrochem_date', db.Integer, nullable=True),
+    *[column for parameter in HYDROCHEMISTRY_PARAMETERS
+      for column in (db.Column(parameter, db.Float, nullable=True),
+                     db.Column(f'{parameter}_date', db.Integer, nullable=True))]
+)
+
+# Версия данных таблицы: увеличивается в той же транзакции, что и запись в таблицу (см. versions.py);
+# modified_at - время последнего изменения с долями секунды
+table_version = db.Table('table_version',
+    db.Column('table_name', db.String(64), primary_key=True),
+    db.Column('version', db.Integer, nullable=False, default=0),
+    db.Column('modified_at', db.Float, nullable=False)
+)
+
+# Версия данных графиков группового бассейна за период длиной PERIOD (см. versions.bump_periods):
+# запись измерения меняет версию только своего периода, а не всех графиков сразу
+hydrochemistry_period_version = db.Table('hydrochemistry_period_version',
+    # Ключ начинается с периода: версии читаются по диапазону времени графика
+    db.Column('period_start', db.Integer, primary_key=True),
+    db.Column('group_pool_id', db.Integer, primary_key=True),
+    db.Column('version', db.Integer, nullable=False, default=0)
+)
+
 class FishType(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -51,6 +107,11 @@ class FishInventory(db.Model):
     pool = db.relationship('Pool', backref=db.backref('fish_inventories', lazy=True))
     fish_type = db.relationship('FishType', backref=db.backref('fish_inventories', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_fish_inventory_pool_type_date', 'pool_id', 'fish_type_id', 'control_date'),
+        db.Index('ix_fish_inventory_date', 'control_date'),
+    )
+
 class FishBoning(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     fish_inventory_id = db.Column(db.Integer, db.ForeignKey('fish_inventory.id'), nullable=False)
@@ -59,6 +120,10 @@ class FishBoning(db.Model):
     fish_comment = db.Column(db.Text, nullable=True)
     fish_inventory = db.relationship('FishInventory', backref=db.backref('fish_bonings', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_fish_boning_inventory', 'fish_inventory_id'),
+    )
+
 class FeedType(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -74,6 +139,10 @@ class Feed(db.Model):
     pool = db.relationship('Pool', backref=db.backref('feeds', lazy=True))
     feed_type = db.relationship('FeedType', backref=db.backref('feeds', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_feed_pool_date', 'pool_id', 'feed_date'),
+    )
+
 class FishMovement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     pool_id_from = db.Column(db.Integer, db.ForeignKey('pool.id'), nullable=True)
@@ -86,3 +155,107 @@ class FishMovement(db.Model):
     pool_from = db.relationship('Pool', foreign_keys=[pool_id_from], backref=db.backref('movements_from', lazy=True))
     pool_to = db.relationship('Pool', foreign_keys=[pool_id_to], backref=db.backref('movements_to', lazy=True))
     fish_type = db.relationship('FishType', backref=db.backref('movements', lazy=True))
+
+    __table_args__ = (
+        db.Index('ix_fish_movement_date', 'movement_date'),
+        db.Index('ix_fish_movement_to_type_date', 'pool_id_to', 'fish_type_id', 'movement_date'),
+        db.Index('ix_fish_movement_from_type_date', 'pool_id_from', 'fish_type_id', 'movement_date'),
+    )
+
+# Текущий запас рыбы в бассейне: последняя инвентаризация плюс перемещения после нее
+class PoolStock(db.Model):
+    pool_id = db.Column(db.Integer, db.ForeignKey('pool.id'), primary_key=True)
+    fish_type_id = db.Column(db.Integer, db.ForeignKey('fish_type.id'), primary_key=True)
+    checkpoint_date = db.Column(db.Integer, nullable=True)
+    checkpoint_count = db.Column(db.Integer, nullable=False, default=0)
+    checkpoint_biomass = db.Column(db.Float, nullable=False, default=0)
+    biomass = db.Column(db.Float, nullable=False, default=0)
+    pool = db.relationship('Pool')
+    fish_type = db.relationship('FishType')
+
+
+# Суточные итоги кормления по бассейну и типу корма (day - начало суток, UNIX timestamp)
+class FeedDaily(db.Model):
+    pool_id = db.Column(db.Integer, db.ForeignKey('pool.id'), primary_key=True)
+    feed_type_id = db.Column(db.Integer, db.ForeignKey('feed_type.id'), primary_key=True)
+    day = db.Column(db.Integer, primary_key=True)
+    feed_total = db.Column(db.Float, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_feed_daily_pool_day', 'pool_id', 'day'),
+    )
+
+# Суточные изменения биомассы: перемещения и биомасса по инвентаризации за сутки
+class BiomassDaily(db.Model):
+    pool_id = db.Column(db.Integer, db.ForeignKey('pool.id'), primary_key=True)
+    fish_type_id = db.Column(db.Integer, db.ForeignKey('fish_type.id'), primary_key=True)
+    day = db.Column(db.Integer, primary_key=True)
+    moved_in = db.Column(db.Float, nullable=False, default=0)
+    moved_out = db.Column(db.Float, nullable=False, default=0)
+    inventory_biomass = db.Column(db.Float, nullable=True)
+
+# Части архива журналов: строки за период [period_start, period_end) вынесены в отдельный файл SQLite
+class ArchivePartition(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    period_start = db.Column(db.Integer, nullable=False)
+    period_end = db.Column(db.Integer, nullable=False)
+    path = db.Column(db.String(200), nullable=False)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('table_name', 'period_start', name='uq_archive_partition_period'),
+    )
+
+# Правило оповещения по гидрохимии: group_pool_id = NULL - для всех групповых бассейнов;
+# kind: 'threshold' - последнее значение, 'rate' - скорость изменения в час за окно,
+# 'window' - среднее за окно; window - длина окна в секундах
+class AlertRule(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    parameter = db.Column(db.String(20), nullable=False)
+    group_pool_id = db.Column(db.Integer, db.ForeignKey('group_pool.id'), nullable=True)
+    kind = db.Column(db.String(20), nullable=False, default='threshold')
+    operator = db.Column(db.String(2), nullable=False)
+    threshold = db.Column(db.Float, nullable=False)
+    window = db.Column(db.Integer, nullable=False, default=0)
+    enabled = db.Column(db.Boolean, nullable=False, default=True)
+
+    group_pool = db.relationship('GroupPool')
+
+# Срабатывание правила по групповому бассейну; активно, пока resolved_at пусто
+class Alert(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    rule_id = db.Column(db.Integer, db.ForeignKey('alert_rule.id'), nullable=False)
+    group_pool_id = db.Column(db.Integer, db.ForeignKey('group_pool.id'), nullable=False)
+    value = db.Column(db.Float, nullable=False)
+    started_at = db.Column(db.Integer, nullable=False)
+    last_seen_at = db.Column(db.Integer, nullable=False)
+    resolved_at = db.Column(db.Integer, nullable=True)
+
+    rule = db.relationship('AlertRule', backref=db.backref('alerts', cascade='all, delete-orphan'))
+    group_pool = db.relationship('GroupPool')
+
+    __table_args__ = (
+        db.Index('ix_alert_active', 'resolved_at', 'group_pool_id'),
+        db.Index('ix_alert_rule', 'rule_id'),
+    )
+
+# Аномальные измерения гидрохимии по параметрам; hydrochemistry_id без внешнего ключа,
+# так как строка журнала может быть перенесена в архив
+class HydrochemistryAnomaly(db.Model):
+    hydrochemistry_id = db.Column(db.Integer, primary_key=True)
+    parameter = db.Column(db.String(20), primary_key=True)
+    group_pool_id = db.Column(db.Integer, db.ForeignKey('group_pool.id'), nullable=False)
+    hydrochem_date = db.Column(db.Integer, nullable=False)
+    value = db.Column(db.Float, nullable=False)
+    robust_score = db.Column(db.Float, nullable=True)
+    ewma_score = db.Column(db.Float, nullable=True)
+    # Оценки хранятся для каждого измерения; отметка выделяет те, что превысили пороги
+    flagged = db.Column(db.Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        db.Index('ix_hydrochemistry_anomaly_parameter_flagged_date', 'parameter', 'flagged', 'hydrochem_date'),
+        db.Index('ix_hydrochemistry_anomaly_group_pool_date', 'group_pool_id', 'hydrochem_date'),
+    )
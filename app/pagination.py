@@ -0,0 +1,81 @@
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def decode_cursor(cursor):
+    """Курсор [значение сортировки, id] или None, если курсора нет или он некорректен.
+
+    Значение сортировки - число или null (NULL в столбце), id - целое число.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != 2:
+        return None
+    value, last_id = values
+    if not (value is None or _is_number(value)) or not isinstance(last_id, int) or isinstance(last_id, bool):
+        return None
+    return values
+
+
+def keyset_filter(sort_attr, id_attr, cursor, reverse=False):
+    value, last_id = cursor
+    # SQLite ставит NULL первыми при сортировке по возрастанию и последними по убыванию
+    if not reverse:
+        if value is None:
+            return or_(and_(sort_attr.is_(None), id_attr > last_id), sort_attr.isnot(None))
+        # Отдельная граница sort_attr >= value дает SQLite поиск по индексу вместо полного прохода
+        return and_(sort_attr >= value, or_(sort_attr > value, and_(sort_attr == value, id_attr > last_id)))
+    if value is None:
+        return and_(sort_attr.is_(None), id_attr < last_id)
+    after = and_(sort_attr <= value, or_(sort_attr < value, and_(sort_attr == value, id_attr < last_id)))
+    # Условие на NULL снова превращает поиск в проход, поэтому для NOT NULL столбцов оно опускается
+    return or_(after, sort_attr.is_(None)) if getattr(sort_attr.expression, 'nullable', True) else after
+
+
+def keyset_order(query, sort_attr, id_attr, cursor=None, reverse=False):
+    """Запрос, отфильтрованный по курсору и упорядоченный как страница."""
+    if cursor is not None:
+        query = query.filter(keyset_filter(sort_attr, id_attr, cursor, reverse))
+    if reverse:
+        return query.order_by(sort_attr.desc(), id_attr.desc())
+    return query.order_by(sort_attr, id_attr)
+
+
+def sort_key(record, sort_attr, id_attr):
+    # Тот же порядок, что у SQLite: NULL меньше любого значения
+    value = getattr(record, sort_attr.key)
+    return value is not None, value if value is not None else 0, getattr(record, id_attr.key)
+
+
+def keyset_page(query, sort_attr, id_attr, cursor=None, reverse=False, per_page=100, extra=()):
+    """Страница записей по курсору (значение сортировки, id) и курсор следующей страницы.
+
+    extra - записи из других источников (архива), уже отобранные по тому же курсору;
+    они сливаются с записями запроса в общем порядке.
+    """
+    records = keyset_order(query, sort_attr, id_attr, cursor, reverse).limit(per_page + 1).all()
+    if extra:
+        records = sorted(list(records) + list(extra), key=lambda record: sort_key(record, sort_attr, id_attr),
+                         reverse=reverse)[:per_page + 1]
+    next_cursor = None
+    if len(records) > per_page:
+        records = records[:per_page]
+        last = records[-1]
+        next_cursor = encode_cursor([getattr(last, sort_attr.key), getattr(last, id_attr.key)])
+    return records, next_cursor
@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+
+from events import subscribe
+from versions import data_version, period_versions, bump_periods
+
+
+def source_version(executor, start_timestamp, end_timestamp):
+    """Версия исходных данных графика за [start, end] в БД, общая для всех процессов.
+
+    Это версии периодов измерений, которые захватывает диапазон, и версия групповых
+    бассейнов, чьи названия выводятся в легенде. Запись измерения меняет версию только
+    своего периода, поэтому графики других периодов остаются в кэше.
+    """
+    return data_version(executor, 'group_pool'), period_versions(executor, start_timestamp, end_timestamp)
+
+
+class PlotCache:
+    """LRU-кэш готовых графиков, ограниченный числом записей и суммарным размером.
+
+    Ключ - (параметр, начало, конец, версия исходных данных за диапазон). Версия берется
+    из БД (source_version), поэтому запись из другого процесса или команды CLI делает
+    устаревшие графики ее диапазона недостижимыми; подписки на события этого процесса
+    лишь раньше освобождают память, занятую такими графиками.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=128 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(parameter, start_timestamp, end_timestamp, version=()):
+        return parameter, start_timestamp, end_timestamp, version
+
+    def get(self, key):
+        with self._lock:
+            plot = self._entries.get(key)
+            if plot is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return plot
+
+    def put(self, key, plot):
+        size = len(plot)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = plot
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, timestamp=None):
+        """Удаляет графики, в диапазон которых попадает время измерения (все, если None)."""
+        with self._lock:
+            for key in list(self._entries):
+                _, start, end, _ = key
+                if timestamp is not None and not start <= timestamp <= end:
+                    continue
+                self._size -= len(self._entries.pop(key))
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'bytes': self._size,
+            }
+
+
+plot_cache = PlotCache()
+
+
+@subscribe('hydrochemistry')
+def _bump_hydrochemistry_periods(session, changes):
+    # Версии периодов увеличиваются в транзакции записи, как и версии таблиц
+    bump_periods(session, [(values['group_pool_id'], values['hydrochem_date'])
+                           for change in changes for values in (change.row, change.old) if values is not None])
+
+
+@subscribe('hydrochemistry', after_commit=True)
+def _invalidate_hydrochemistry(session, changes):
+    for change in changes:
+        plot_cache.invalidate(change.row['hydrochem_date'])
+        if change.old is not None:
+            plot_cache.invalidate(change.old['hydrochem_date'])
+
+
+@subscribe('group_pool', after_commit=True)
+def _invalidate_group_pool(session, changes):
+    # Название группового бассейна выводится в легенде любого графика
+    plot_cache.invalidate()
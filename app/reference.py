@@ -0,0 +1,108 @@
+import threading
+from datetime import datetime
+
+from flask import g, has_app_context
+from sqlalchemy import select
+
+from events import subscribe
+from models import db, Pool, GroupPool, FishType, FeedType, FishInventory
+from versions import table_versions
+
+
+def _inventory_labels(rows):
+    return [(inventory_id, f"{pool_name} - {datetime.fromtimestamp(control_date).strftime('%Y-%m-%d %H:%M:%S')}")
+            for inventory_id, pool_name, control_date in rows]
+
+
+# Справочники для списков выбора: запрос (id, название), преобразование строк
+# и таблицы, по версиям которых проверяется кэш
+REFERENCES = {
+    'pools': (select(Pool.id, Pool.name).order_by(Pool.id), None, ('pool',)),
+    'group_pools': (select(GroupPool.id, GroupPool.name).order_by(GroupPool.id), None, ('group_pool',)),
+    'fish_types': (select(FishType.id, FishType.name).order_by(FishType.id), None, ('fish_type',)),
+    'feed_types': (select(FeedType.id, FeedType.name).order_by(FeedType.id), None, ('feed_type',)),
+    # Последние инвентаризации первыми; в подписи входит название бассейна
+    'inventories': (select(FishInventory.id, Pool.name, FishInventory.control_date).join(Pool)
+                    .order_by(FishInventory.control_date.desc(), FishInventory.id.desc()), _inventory_labels,
+                    ('fish_inventory', 'pool')),
+}
+
+
+# Таблицы всех справочников: их версии читаются одним запросом
+TABLES = sorted({table for _, _, tables in REFERENCES.values() for table in tables})
+
+
+def reference_versions():
+    """Версии таблиц справочников: один запрос на запрос к приложению (контекст приложения).
+
+    Форма с несколькими списками выбора проверяет кэш по уже прочитанным версиям,
+    поэтому в установившемся режиме ее построение стоит одного запроса к table_version.
+    """
+    if has_app_context() and 'reference_versions' in g:
+        return g.reference_versions
+    versions = {name: version for name, (version, _) in table_versions(db.session, TABLES).items()}
+    if has_app_context():
+        g.reference_versions = versions
+    return versions
+
+
+class ReferenceCache:
+    """Справочники в памяти процесса, проверяемые по версиям их таблиц в БД.
+
+    Версии общие для всех процессов (versions.py), поэтому справочник перечитывается
+    после записи из любого рабочего процесса или команды CLI; они читаются один раз
+    за запрос (reference_versions). Версия читается до списка: если запись попала
+    между ними, список новее своей версии и лишь будет перечитан еще раз.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def choices(self, name):
+        """Список (id, название) справочника; вызывающий может его изменять."""
+        statement, convert, tables = REFERENCES[name]
+        versions = reference_versions()
+        version = tuple(versions[table] for table in tables)
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None or entry[0] != version:
+            rows = [tuple(row) for row in db.session.execute(statement)]
+            rows = convert(rows) if convert else rows
+            with self._lock:
+                self._entries[name] = (version, rows)
+            return list(rows)
+        return list(entry[1])
+
+    def names(self, name):
+        """Словарь id -> название справочника."""
+        return dict(self.choices(name))
+
+    def invalidate(self, *names):
+        with self._lock:
+            for name in names or REFERENCES:
+                self._entries.pop(name, None)
+
+    def stats(self):
+        with self._lock:
+            return {name: {'version': self._entries[name][0] if name in self._entries else None,
+                           'cached': name in self._entries,
+                           'size': len(self._entries[name][1]) if name in self._entries else 0}
+                    for name in REFERENCES}
+
+
+reference_cache = ReferenceCache()
+
+
+def choices(name):
+    return reference_cache.choices(name)
+
+
+def _forget_versions(session, changes):
+    # Запись в справочник в этом же запросе: следующий список выбора перечитает версии
+    if has_app_context():
+        g.pop('reference_versions', None)
+
+
+for _table in TABLES:
+    subscribe(_table, after_commit=True)(_forget_versions)
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+from sqlalchemy import select, func, and_, or_
+
+from archive import ARCHIVES, period_start, next_period, archive_connections, move_to_archive
+from fcr import day_start
+from models import db, Hydrochemistry, FishMovement, PoolStock, HYDROCHEMISTRY_PARAMETERS as PARAMETERS, \
+                   hydrochemistry_hourly, hydrochemistry_daily
+from rollups import refresh_hours, refresh_days
+from versions import bump, bump_periods
+
+
+def months_ago(now, months):
+    date = datetime.fromtimestamp(now)
+    month = date.year * 12 + date.month - 1 - months
+    return int(date.replace(year=month // 12, month=month % 12 + 1, day=1, hour=0, minute=0, second=0,
+                            microsecond=0).timestamp())
+
+
+def hydrochemistry_counts(executor, start, end):
+    return executor.execute(
+        select(*[func.count(getattr(Hydrochemistry, parameter)) for parameter in PARAMETERS])
+        .where(Hydrochemistry.hydrochem_date >= start, Hydrochemistry.hydrochem_date < end)
+    ).one()
+
+
+def rollups_confirmed(conn, start, end):
+    """Сходятся ли часовые сводки за [start, end) с измерениями в основной БД и архиве."""
+    counts = list(hydrochemistry_counts(conn, start, end))
+    for archive in archive_connections('hydrochemistry', start, end - 1, conn):
+        counts = [total + count for total, count in zip(counts, hydrochemistry_counts(archive, start, end))]
+    rolled = conn.execute(
+        select(*[func.coalesce(func.sum(hydrochemistry_hourly.c[f'{parameter}_count']), 0)
+                 for parameter in PARAMETERS])
+        .where(hydrochemistry_hourly.c.bucket >= start, hydrochemistry_hourly.c.bucket < end)
+    ).one()
+    return counts == list(rolled)
+
+
+def confirm_rollups(conn, start, end):
+    """Проверяет сводки за период и один раз пересчитывает их при расхождении."""
+    if rollups_confirmed(conn, start, end):
+        return True
+    bucket = Hydrochemistry.hydrochem_date // 3600 * 3600
+    hours = {tuple(row) for row in conn.execute(
+        select(Hydrochemistry.group_pool_id, bucket).distinct()
+        .where(Hydrochemistry.hydrochem_date >= start, Hydrochemistry.hydrochem_date < end))}
+    refresh_hours(conn, hours)
+    refresh_days(conn, {(group_pool_id, day_start(hour)) for group_pool_id, hour in hours})
+    bump(conn, [hydrochemistry_hourly.name, hydrochemistry_daily.name])
+    bump_periods(conn, hours)
+    conn.commit()
+    return rollups_confirmed(conn, start, end)
+
+
+def movement_archivable():
+    # Перемещение нужно журналу запасов, пока оно позже последней инвентаризации пары
+    conditions = []
+    for pool_column in (FishMovement.pool_id_to, FishMovement.pool_id_from):
+        checkpoint = select(PoolStock.checkpoint_date).where(
+            PoolStock.pool_id == pool_column, PoolStock.fish_type_id == FishMovement.fish_type_id
+        ).scalar_subquery()
+        conditions.append(or_(pool_column.is_(None), FishMovement.movement_date <= checkpoint))
+    return and_(*conditions)
+
+
+def archive_table_rows(conn, table_name, cutoff):
+    """Переносит в архив все полные периоды журнала, закончившиеся до cutoff."""
+    model, date_column, period = ARCHIVES[table_name]
+    first = conn.execute(select(func.min(date_column)).where(date_column < cutoff)).scalar()
+    report = {'moved': 0, 'periods': 0, 'skipped': []}
+    if first is None:
+        return report
+
+    conditions = [movement_archivable()] if table_name == 'fish_movement' else []
+    start = period_start(first, period)
+    while next_period(start, period) <= cutoff:
+        end = next_period(start, period)
+        if table_name == 'hydrochemistry' and not confirm_rollups(conn, start, end):
+            report['skipped'].append(start)
+        else:
+            moved = move_to_archive(conn, table_name, start, end, *conditions)
+            if moved:
+                report['moved'] += moved
+                report['periods'] += 1
+        # Пропускаем периоды без строк
+        first = conn.execute(select(func.min(date_column)).where(date_column >= end, date_column < cutoff)).scalar()
+        if first is None:
+            break
+        start = period_start(first, period)
+    return report
+
+
+def apply_retention(hydrochemistry_months, feed_years, movement_years, now=None):
+    """Переносит в архив строки старше сроков хранения; возвращает отчет по журналам.
+
+    Гидрохимия уходит в помесячные файлы только после сверки часовых сводок,
+    по которым дальше строятся графики; кормление и перемещения - в годовые файлы.
+    """
+    now = now or int(datetime.now().timestamp())
+    cutoffs = {
+        'hydrochemistry': months_ago(now, hydrochemistry_months),
+        'feed': months_ago(now, feed_years * 12),
+        'fish_movement': months_ago(now, movement_years * 12),
+    }
+    reports = {}
+    with db.engine.connect() as conn:
+        for table_name, cutoff in cutoffs.items():
+            reports[table_name] = archive_table_rows(conn, table_name, cutoff)
+    return reports
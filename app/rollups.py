@@ -0,0 +1,233 @@
+from collections import defaultdict
+
+from sqlalchemy import select, func
+
+from archive import archive_connections
+from events import subscribe
+from fcr import day_start, next_day
+from models import db, Hydrochemistry, HYDROCHEMISTRY_PARAMETERS as PARAMETERS, \
+                   hydrochemistry_hourly, hydrochemistry_daily
+
+HOUR = 3600
+# Разрешения сводок от мелкого к крупному: (примерная длина интервала, таблица)
+RESOLUTIONS = ((HOUR, hydrochemistry_hourly), (86400, hydrochemistry_daily))
+# Сколько часов журнала пересчитывается одним запросом при полной перестройке
+BACKFILL_WINDOW = 24 * 30
+
+
+def hour_start(timestamp):
+    return timestamp // HOUR * HOUR
+
+
+def hour_aggregates():
+    columns = []
+    for parameter in PARAMETERS:
+        column = getattr(Hydrochemistry, parameter)
+        columns += [func.min(column), func.max(column), func.avg(column), func.count(column)]
+    return columns
+
+
+def day_aggregates():
+    columns = []
+    for parameter in PARAMETERS:
+        count = hydrochemistry_hourly.c[f'{parameter}_count']
+        total = func.sum(hydrochemistry_hourly.c[f'{parameter}_mean'] * count)
+        # Среднее за сутки взвешивается по числу измерений в каждом часе
+        columns += [func.min(hydrochemistry_hourly.c[f'{parameter}_min']),
+                    func.max(hydrochemistry_hourly.c[f'{parameter}_max']),
+                    total / func.nullif(func.sum(count), 0),
+                    func.coalesce(func.sum(count), 0)]
+    return columns
+
+
+def rollup_keys():
+    return ['group_pool_id', 'bucket'] + [f'{parameter}_{name}' for parameter in PARAMETERS
+                                          for name in ('min', 'max', 'mean', 'count')]
+
+
+def replace_buckets(executor, table, keys, rows):
+    """Заменяет строки сводки по ключам (group_pool_id, bucket); пустые интервалы удаляются."""
+    keys = list(keys)
+    for start in range(0, len(keys), 500):
+        executor.execute(table.delete().where(
+            db.tuple_(table.c.group_pool_id, table.c.bucket).in_(keys[start:start + 500])))
+    if rows:
+        names = rollup_keys()
+        executor.execute(table.insert(), [dict(zip(names, row)) for row in rows])
+
+
+def combine(rows):
+    """Сводит строки одного интервала, посчитанные по основной БД и частям архива."""
+    merged = {}
+    for row in rows:
+        key = (row[0], row[1])
+        target = merged.get(key)
+        if target is None:
+            merged[key] = list(row)
+            continue
+        for i in range(2, len(row), 4):
+            low, high, mean, count = row[i:i + 4]
+            if not count:
+                continue
+            if not target[i + 3]:
+                target[i:i + 4] = [low, high, mean, count]
+                continue
+            total = target[i + 3] + count
+            target[i:i + 4] = [min(target[i], low), max(target[i + 1], high),
+                               (target[i + 2] * target[i + 3] + mean * count) / total, total]
+    return list(merged.values())
+
+
+def hour_rows(executor, start, end, group_pool_id=None):
+    """Часовая сводка журнала за [start, end) вместе с архивом, если период в него попадает."""
+    bucket = Hydrochemistry.hydrochem_date // HOUR * HOUR
+    statement = select(Hydrochemistry.group_pool_id, bucket, *hour_aggregates())\
+        .where(Hydrochemistry.hydrochem_date >= start, Hydrochemistry.hydrochem_date < end)\
+        .group_by(Hydrochemistry.group_pool_id, bucket)
+    if group_pool_id is not None:
+        statement = statement.where(Hydrochemistry.group_pool_id == group_pool_id)
+    rows = executor.execute(statement).all()
+    archived = []
+    for conn in archive_connections('hydrochemistry', start, end - 1, executor):
+        archived += conn.execute(statement).all()
+    return combine(rows + archived) if archived else rows
+
+
+def hour_runs(hours):
+    """Разбивает часы на непрерывные отрезки, чтобы читать журнал диапазонами."""
+    runs = []
+    for hour in sorted(hours):
+        if runs and hour - runs[-1][1] <= HOUR:
+            runs[-1][1] = hour
+        else:
+            runs.append([hour, hour])
+    return runs
+
+
+def refresh_hours(executor, keys):
+    """Пересчитывает часовую сводку для ключей (group_pool_id, начало часа) по журналу."""
+    by_group_pool = defaultdict(set)
+    for group_pool_id, hour in keys:
+        by_group_pool[group_pool_id].add(hour)
+
+    rows = []
+    for group_pool_id, hours in by_group_pool.items():
+        for first, last in hour_runs(hours):
+            rows += hour_rows(executor, first, last + HOUR, group_pool_id)
+    replace_buckets(executor, hydrochemistry_hourly, keys, rows)
+
+
+def refresh_days(executor, keys):
+    """Пересчитывает суточную сводку для ключей (group_pool_id, начало суток) по часовой."""
+    by_day = defaultdict(set)
+    for group_pool_id, day in keys:
+        by_day[day].add(group_pool_id)
+
+    rows = []
+    for day, group_pool_ids in by_day.items():
+        rows += executor.execute(
+            select(hydrochemistry_hourly.c.group_pool_id, db.literal(day), *day_aggregates())
+            .where(hydrochemistry_hourly.c.group_pool_id.in_(group_pool_ids),
+                   hydrochemistry_hourly.c.bucket >= day, hydrochemistry_hourly.c.bucket < next_day(day))
+            .group_by(hydrochemistry_hourly.c.group_pool_id)
+        ).all()
+    replace_buckets(executor, hydrochemistry_daily, keys, rows)
+
+
+def rebuild_hydrochemistry_rollups(executor):
+    """Перестраивает часовые и суточные сводки гидрохимии за всю историю.
+
+    Журнал читается окнами по BACKFILL_WINDOW часов, чтобы не держать
+    в памяти и в одной выборке десятки миллионов строк; перенесенные
+    в архив месяцы читаются из его файлов.
+    """
+    executor.execute(hydrochemistry_hourly.delete())
+    executor.execute(hydrochemistry_daily.delete())
+
+    first, last = executor.execute(
+        select(func.min(Hydrochemistry.hydrochem_date), func.max(Hydrochemistry.hydrochem_date))
+    ).one()
+    for conn in archive_connections('hydrochemistry', executor=executor):
+        archived_first, archived_last = conn.execute(
+            select(func.min(Hydrochemistry.hydrochem_date), func.max(Hydrochemistry.hydrochem_date))
+        ).one()
+        if archived_first is not None:
+            first = archived_first if first is None else min(first, archived_first)
+            last = archived_last if last is None else max(last, archived_last)
+    if first is None:
+        return
+
+    step = BACKFILL_WINDOW * HOUR
+    for window in range(hour_start(first), last + 1, step):
+        rows = hour_rows(executor, window, window + step)
+        if rows:
+            names = rollup_keys()
+            executor.execute(hydrochemistry_hourly.insert(), [dict(zip(names, row)) for row in rows])
+
+    days = set()
+    for group_pool_id, hour in executor.execute(
+            select(hydrochemistry_hourly.c.group_pool_id, hydrochemistry_hourly.c.bucket)
+            .execution_options(yield_per=10000)):
+        days.add((group_pool_id, day_start(hour)))
+    refresh_days(executor, days)
+
+
+def choose_resolution(max_count, span, budget, input_factor=1):
+    """Таблица сводки для графика или None, если хватает исходных измерений.
+
+    Сводки подключаются, только когда измерений больше budget: часовая, если в диапазон
+    помещается не более budget * input_factor часов, иначе более грубая суточная.
+    """
+    if max_count <= budget:
+        return None
+    for bucket, table in RESOLUTIONS:
+        if span // bucket <= budget * input_factor:
+            return table
+    return RESOLUTIONS[-1][1]
+
+
+def measurement_counts(parameter, start_timestamp, end_timestamp):
+    """Оценка числа измерений параметра по групповым бассейнам из суточной сводки.
+
+    Крайние сутки учитываются целиком, поэтому оценка может быть немного завышена.
+    """
+    count = hydrochemistry_daily.c[f'{parameter}_count']
+    return dict(db.session.execute(
+        select(hydrochemistry_daily.c.group_pool_id, func.sum(count))
+        .where(hydrochemistry_daily.c.bucket.between(day_start(start_timestamp), end_timestamp), count > 0)
+        .group_by(hydrochemistry_daily.c.group_pool_id)
+    ).all())
+
+
+def raw_measurement_counts(parameter, start_timestamp, end_timestamp):
+    """Точное число измерений параметра по групповым бассейнам из журнала и его архива."""
+    column = getattr(Hydrochemistry, parameter)
+    statement = select(Hydrochemistry.group_pool_id, func.count(column))\
+        .where(Hydrochemistry.hydrochem_date.between(start_timestamp, end_timestamp), column.isnot(None))\
+        .group_by(Hydrochemistry.group_pool_id)
+    counts = defaultdict(int)
+    for source in [db.session, *archive_connections('hydrochemistry', start_timestamp, end_timestamp)]:
+        for group_pool_id, count in source.execute(statement):
+            counts[group_pool_id] += count
+    return dict(counts)
+
+
+def rollup_statement(table, parameter, start_timestamp, end_timestamp):
+    """Интервалы сводки, пересекающиеся с периодом: group_pool_id, bucket, mean, min, max."""
+    start = hour_start(start_timestamp) if table is hydrochemistry_hourly else day_start(start_timestamp)
+    return select(table.c.group_pool_id, table.c.bucket, table.c[f'{parameter}_mean'],
+                  table.c[f'{parameter}_min'], table.c[f'{parameter}_max'])\
+        .where(table.c.bucket.between(start, end_timestamp), table.c[f'{parameter}_count'] > 0)\
+        .order_by(table.c.group_pool_id, table.c.bucket)
+
+
+@subscribe('hydrochemistry')
+def _on_hydrochemistry(session, changes):
+    hours = set()
+    for change in changes:
+        for values in (change.row, change.old):
+            if values is not None:
+                hours.add((values['group_pool_id'], hour_start(values['hydrochem_date'])))
+    if hours:
+        refresh_hours(session, hours)
+        refresh_days(session, {(group_pool_id, day_start(hour)) for group_pool_id, hour in hours})
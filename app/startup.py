@@ -0,0 +1,82 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Время запуска процесса: от него считаются готовность и прогрев в /ready
+STARTED = time.time()
+
+_state = {'ready': False, 'ready_after': None, 'warm': False, 'warm_after': None, 'steps': {}}
+_lock = threading.Lock()
+
+
+def mark_ready():
+    with _lock:
+        _state['ready'] = True
+        _state['ready_after'] = round(time.time() - STARTED, 3)
+
+
+def readiness():
+    """Состояние запуска для /ready: готовность принимать запросы и завершенность прогрева."""
+    with _lock:
+        return {**_state, 'steps': dict(_state['steps']), 'uptime': round(time.time() - STARTED, 3)}
+
+
+def warm_plotly():
+    import plotly.graph_objs as go
+    import plotly.offline as pyo
+
+    # Первый график загружает описания всех свойств Plotly - это дольше самого импорта
+    pyo.plot(go.Figure(data=[go.Scatter(x=[0], y=[0])]), output_type='div')
+
+
+def warm_pandas():
+    import pandas  # noqa: F401
+
+
+def warm_analytics():
+    # Модули графиков и панели сравнения на NumPy, которые app.py импортирует в обработчиках
+    import dashboard  # noqa: F401
+    import downsample  # noqa: F401
+
+
+def warm_templates(app):
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+
+
+def warm_reference_data(app):
+    from alerts import enabled_rules
+    from models import db
+    from reference import reference_cache, REFERENCES
+
+    with app.app_context():
+        for name in REFERENCES:
+            reference_cache.choices(name)
+        enabled_rules(db.session)
+        db.session.remove()
+
+
+def warm_up(app):
+    """Выполняет отложенные при запуске загрузки, чтобы их не ждал первый пользователь."""
+    steps = [('templates', lambda: warm_templates(app)), ('reference_data', lambda: warm_reference_data(app)),
+             ('analytics', warm_analytics), ('plotly', warm_plotly), ('pandas', warm_pandas)]
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            # Прогрев только ускоряет первые запросы; ошибка проявится и при обычном обращении
+            logger.exception('Прогрев %s не удался', name)
+        with _lock:
+            _state['steps'][name] = round(time.perf_counter() - started, 3)
+    with _lock:
+        _state['warm'] = True
+        _state['warm_after'] = round(time.time() - STARTED, 3)
+
+
+def start_warm_up(app):
+    thread = threading.Thread(target=warm_up, args=(app,), name='warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,45 @@
+// Разбор ответов FSH1 (см. columnar.py): заголовок JSON и типизированные массивы без копирования
+const COLUMNAR_TYPES = {int64: BigInt64Array, float32: Float32Array};
+
+function parseColumnar(buffer) {
+    const decoder = new TextDecoder();
+    if (decoder.decode(new Uint8Array(buffer, 0, 4)) !== 'FSH1') {
+        throw new Error('Неизвестный формат данных');
+    }
+    const headerLength = new DataView(buffer).getUint32(4, true);
+    const header = JSON.parse(decoder.decode(new Uint8Array(buffer, 8, headerLength)));
+    const base = 8 + headerLength;
+    header.series.forEach(series => {
+        Object.entries(series.columns).forEach(([name, layout]) => {
+            series.columns[name] = layout === null ? null
+                : new COLUMNAR_TYPES[header.dtypes[name]](buffer, base + layout[0], layout[1]);
+        });
+    });
+    return header;
+}
+
+// UNIX-время в секундах -> миллисекунды местного времени для оси дат Plotly
+function columnarDates(timestamps) {
+    const result = new Float64Array(timestamps.length);
+    for (let i = 0; i < timestamps.length; i++) {
+        const ms = Number(timestamps[i]) * 1000;
+        result[i] = ms - new Date(ms).getTimezoneOffset() * 60000;
+    }
+    return result;
+}
+
+// Загружает ответ FSH1 и передает разобранные данные в render; ошибки выводятся в element
+function loadColumnar(element, url, render) {
+    fetch(url, {credentials: 'same-origin'})
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Ошибка загрузки данных: ' + response.status);
+            }
+            return response.arrayBuffer();
+        })
+        .then(buffer => render(parseColumnar(buffer)))
+        .catch(error => {
+            element.innerHTML = '<p class="mt-3 text-danger"></p>';
+            element.firstChild.textContent = error.message;
+        });
+}
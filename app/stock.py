@@ -0,0 +1,74 @@
+from models import db, Pool, FishType, FishInventory, FishBoning
+
+
+def latest_inventory_subquery(as_of=None):
+    """Дата последней инвентаризации для каждой пары (бассейн, вид рыбы)."""
+    query = db.session.query(
+        FishInventory.pool_id,
+        FishInventory.fish_type_id,
+        db.func.max(FishInventory.control_date).label('latest_date')
+    )
+    if as_of is not None:
+        query = query.filter(FishInventory.control_date <= as_of)
+    return query.group_by(FishInventory.pool_id, FishInventory.fish_type_id).subquery()
+
+
+def stock_by_fish_type(as_of=None):
+    """Количество, биомасса и бассейны по видам рыбы по последним инвентаризациям.
+
+    Все суммы считаются одним сгруппированным запросом, Python только собирает
+    строки (вид, бассейн) в словарь того же вида, что ожидает fish_composition.html.
+    """
+    latest = latest_inventory_subquery(as_of)
+    rows = db.session.query(
+        FishType.name,
+        Pool.name,
+        db.func.coalesce(db.func.sum(FishBoning.fish_number), 0),
+        db.func.coalesce(db.func.sum(FishBoning.fish_biomass), 0)
+    ).select_from(FishInventory).join(
+        latest,
+        db.and_(
+            FishInventory.pool_id == latest.c.pool_id,
+            FishInventory.fish_type_id == latest.c.fish_type_id,
+            FishInventory.control_date == latest.c.latest_date
+        )
+    ).join(FishType, FishInventory.fish_type_id == FishType.id)\
+        .join(Pool, FishInventory.pool_id == Pool.id)\
+        .outerjoin(FishBoning, FishBoning.fish_inventory_id == FishInventory.id)\
+        .group_by(FishType.id, Pool.id)\
+        .order_by(FishType.name, Pool.name)\
+        .all()
+
+    fish_data = {}
+    for fish_type_name, pool_name, total_count, total_mass in rows:
+        if fish_type_name not in fish_data:
+            fish_data[fish_type_name] = {
+                'total_count': 0,
+                'total_mass': 0,
+                'pools': set()
+            }
+        fish_data[fish_type_name]['total_count'] += total_count
+        fish_data[fish_type_name]['total_mass'] += total_mass
+        fish_data[fish_type_name]['pools'].add(pool_name)
+    return fish_data
+
+
+def boning_totals_statement(inventory_ids):
+    return db.select(
+        FishBoning.fish_inventory_id,
+        db.func.count(FishBoning.id).label('bonings'),
+        db.func.sum(FishBoning.fish_number).label('fish_number'),
+        db.func.sum(FishBoning.fish_biomass).label('fish_biomass'),
+        (db.func.sum(FishBoning.fish_biomass) / db.func.nullif(db.func.sum(FishBoning.fish_number), 0))
+        .label('mean_weight')
+    ).where(FishBoning.fish_inventory_id.in_(inventory_ids)).group_by(FishBoning.fish_inventory_id)
+
+
+def boning_totals(inventory_ids):
+    """Итоги бонитировки по инвентаризациям одним сгруппированным запросом: {id: строка}.
+
+    Средняя масса рыбы - суммарная биомасса навесок, деленная на их численность.
+    """
+    if not inventory_ids:
+        return {}
+    return {row.fish_inventory_id: row for row in db.session.execute(boning_totals_statement(inventory_ids))}
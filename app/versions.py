@@ -0,0 +1,99 @@
+"""Версии таблиц в БД: общий для всех процессов признак того, что данные изменились.
+
+Каждая транзакция, изменившая таблицы, перед фиксацией увеличивает их версии в
+table_version, поэтому новую версию видят все рабочие процессы и команды CLI
+сразу после фиксации записи, а откат не оставляет лишних версий. Записи в обход
+сессии (перенос в архив через отдельное соединение) увеличивают версии сами через bump.
+
+Для кэша графиков версии ведутся еще и по групповому бассейну и периоду длиной PERIOD
+(bump_periods), чтобы запись одного измерения не устаревала графики других периодов.
+"""
+import time
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from events import subscribe_tables
+from models import table_version, hydrochemistry_period_version, hydrochemistry_daily
+
+# Длина периода версий данных графиков, секунды
+PERIOD = 30 * 86400
+
+
+def bump(executor, table_names):
+    """Увеличивает версии таблиц; вызывается внутри транзакции, которая их изменила."""
+    names = sorted(set(table_names) - {table_version.name})
+    if not names:
+        return
+    statement = insert(table_version)
+    executor.execute(statement.on_conflict_do_update(
+        index_elements=['table_name'],
+        set_={'version': table_version.c.version + 1, 'modified_at': statement.excluded.modified_at}
+    ), [{'table_name': name, 'version': 1, 'modified_at': time.time()} for name in names])
+
+
+def table_versions(executor, table_names):
+    """{таблица: (версия, время изменения)}; для таблицы без записи - (0, None)."""
+    versions = dict.fromkeys(table_names, (0, None))
+    for name, version, modified_at in executor.execute(
+            select(table_version.c.table_name, table_version.c.version, table_version.c.modified_at)
+            .where(table_version.c.table_name.in_(list(table_names)))):
+        versions[name] = (version, modified_at)
+    return versions
+
+
+def data_version(executor, *table_names):
+    """Кортеж версий таблиц для ключей кэшей: меняется при любой записи в любую из них."""
+    versions = table_versions(executor, table_names)
+    return tuple(versions[name][0] for name in table_names)
+
+
+def period_start(timestamp):
+    return timestamp // PERIOD * PERIOD
+
+
+def bump_periods(executor, keys):
+    """Увеличивает версии периодов по парам (group_pool_id, время) в транзакции записи."""
+    rows = sorted({(group_pool_id, period_start(timestamp)) for group_pool_id, timestamp in keys
+                   if group_pool_id is not None and timestamp is not None})
+    if not rows:
+        return
+    table = hydrochemistry_period_version
+    executor.execute(insert(table).on_conflict_do_update(
+        index_elements=['period_start', 'group_pool_id'], set_={'version': table.c.version + 1}
+    ), [{'group_pool_id': group_pool_id, 'period_start': start, 'version': 1} for group_pool_id, start in rows])
+
+
+def bump_all_periods(executor):
+    """Увеличивает версии всех периодов, по которым есть сводки, - после их полного пересчета."""
+    table = hydrochemistry_period_version
+    executor.execute(table.update().values(version=table.c.version + 1))
+    bump_periods(executor, executor.execute(
+        select(hydrochemistry_daily.c.group_pool_id, hydrochemistry_daily.c.bucket).distinct()).all())
+
+
+def period_versions(executor, start_timestamp, end_timestamp):
+    """Версии периодов, пересекающихся с [start, end]: кортеж (group_pool_id, начало, версия).
+
+    Период без записи в таблице имеет версию 0 и в кортеж не входит.
+    """
+    return tuple(tuple(row) for row in executor.execute(period_versions_statement(start_timestamp, end_timestamp)))
+
+
+def period_versions_statement(start_timestamp, end_timestamp):
+    table = hydrochemistry_period_version
+    return select(table.c.group_pool_id, table.c.period_start, table.c.version)\
+        .where(table.c.period_start.between(period_start(start_timestamp), end_timestamp))\
+        .order_by(table.c.group_pool_id, table.c.period_start)
+
+
+def seed_versions(executor, table_names):
+    """Заводит версии таблицам, у которых их еще нет: данные в них могли меняться и раньше."""
+    now = time.time()
+    executor.execute(insert(table_version).on_conflict_do_nothing(index_elements=['table_name']),
+                     [{'table_name': name, 'version': 1, 'modified_at': now} for name in table_names])
+
+
+@subscribe_tables
+def _bump_changed(session, table_names):
+    bump(session, table_names)
@@ -0,0 +1,19 @@
+"""Точка входа боевого режима вместо app.run(debug=True).
+
+Windows: python wsgi.py - сервер waitress, потоки в одном процессе.
+Linux:   gunicorn -c gunicorn.conf.py wsgi:app
+
+Адрес и число потоков задаются переменными окружения HOST, PORT и WEB_THREADS.
+"""
+import os
+
+from app import prepare_app
+
+# Под gunicorn прогрев запускается в каждом рабочем процессе после fork (gunicorn.conf.py)
+app = prepare_app(warm_up=__name__ == '__main__')
+
+if __name__ == '__main__':
+    from waitress import serve
+
+    serve(app, host=os.environ.get('HOST', '127.0.0.1'), port=int(os.environ.get('PORT', 5000)),
+          threads=int(os.environ.get('WEB_THREADS', 8)))
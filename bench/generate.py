@@ -0,0 +1,188 @@
+"""Заполняет новую БД SQLite синтетическими данными для замеров производительности.
+
+    python bench/generate.py bench.sqlite3 --scale 0.1
+
+По умолчанию объем соответствует крупному хозяйству за несколько лет:
+500 бассейнов, 100 групповых бассейнов, 10 млн измерений гидрохимии,
+1 млн кормлений, по 100 тыс. перемещений и инвентаризаций. Данные
+воспроизводимы: при одинаковых параметрах и --seed получается та же БД.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+
+# Последний день синтетических журналов; фиксирован, чтобы замеры разных версий были сравнимы
+END = int(datetime(2024, 1, 1).timestamp())
+CHUNK = 200_000
+
+# Среднее, разброс и суточная амплитуда параметров гидрохимии
+HYDROCHEMISTRY = {
+    'doxy': (8.5, 0.6, 0.8),
+    'temperature': (12.0, 0.4, 1.0),
+    'ph': (7.2, 0.1, 0.1),
+    'no2': (0.05, 0.01, 0.0),
+    'no3': (5.0, 0.8, 0.0),
+    'nh4': (0.2, 0.05, 0.0),
+    'po4': (0.1, 0.02, 0.0),
+    'salinity': (0.5, 0.05, 0.0),
+    'illumination': (300.0, 40.0, 300.0),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Синтетическая БД для замеров производительности')
+    parser.add_argument('path', help='файл новой БД')
+    parser.add_argument('--scale', type=float, default=1.0, help='множитель всех объемов')
+    parser.add_argument('--pools', type=int, default=500)
+    parser.add_argument('--group-pools', type=int, default=100)
+    parser.add_argument('--hydrochemistry', type=int, default=10_000_000)
+    parser.add_argument('--feeds', type=int, default=1_000_000)
+    parser.add_argument('--movements', type=int, default=100_000)
+    parser.add_argument('--inventories', type=int, default=100_000)
+    parser.add_argument('--fish-types', type=int, default=10)
+    parser.add_argument('--feed-types', type=int, default=5)
+    parser.add_argument('--days', type=int, default=730, help='длина журналов в днях до 2024-01-01')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--force', action='store_true', help='перезаписать существующий файл')
+    return parser.parse_args()
+
+
+def insert(conn, table, columns, rows):
+    conn.exec_driver_sql(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                         rows)
+
+
+def chunks(total):
+    for start in range(0, total, CHUNK):
+        yield start, min(start + CHUNK, total)
+
+
+def dates(rng, count, start):
+    return np.sort(rng.integers(start, END, count))
+
+
+def generate_reference(conn, args):
+    insert(conn, 'pool', ['id', 'name'], [(i, f'Бассейн {i}') for i in range(1, args.pools + 1)])
+    insert(conn, 'group_pool', ['id', 'name'], [(i, f'Группа {i}') for i in range(1, args.group_pools + 1)])
+    # Бассейны делятся между групповыми поровну
+    insert(conn, 'group_pool_pool', ['group_pool_id', 'pool_id'],
+           [(pool_id % args.group_pools + 1, pool_id) for pool_id in range(1, args.pools + 1)])
+    insert(conn, 'fish_type', ['id', 'name'], [(i, f'Вид {i}') for i in range(1, args.fish_types + 1)])
+    insert(conn, 'feed_type', ['id', 'name', 'unit'], [(i, f'Корм {i}', 'кг') for i in range(1, args.feed_types + 1)])
+
+
+def generate_hydrochemistry(conn, rng, args, start):
+    # Измерения идут по всем групповым бассейнам с равным шагом, как от датчиков
+    per_pool = -(-args.hydrochemistry // args.group_pools)
+    step = max(1, (END - start) // per_pool)
+    columns = ['group_pool_id', 'hydrochem_date'] + list(HYDROCHEMISTRY)
+    for first, last in chunks(args.hydrochemistry):
+        index = np.arange(first, last)
+        group_pool_ids = index % args.group_pools + 1
+        timestamps = start + index // args.group_pools * step + rng.integers(0, max(1, step // 2), len(index))
+        phase = np.sin(2 * np.pi * (timestamps % 86400) / 86400)
+        values = [mean + spread * rng.standard_normal(len(index)) + amplitude * phase
+                  for mean, spread, amplitude in HYDROCHEMISTRY.values()]
+        # Часть измерений освещенности отсутствует; NaN SQLite сохраняет как NULL
+        values[-1][rng.random(len(index)) < 0.2] = np.nan
+        insert(conn, 'hydrochemistry', columns,
+               list(zip(group_pool_ids.tolist(), timestamps.tolist(), *[column.tolist() for column in values])))
+
+
+def generate_feeds(conn, rng, args, start):
+    for first, last in chunks(args.feeds):
+        count = last - first
+        insert(conn, 'feed', ['pool_id', 'feed_date', 'feed_type_id', 'feed_value'],
+               list(zip(rng.integers(1, args.pools + 1, count).tolist(), dates(rng, count, start).tolist(),
+                        rng.integers(1, args.feed_types + 1, count).tolist(),
+                        np.round(rng.gamma(4.0, 2.5, count), 2).tolist())))
+
+
+def generate_movements(conn, rng, args, start):
+    for first, last in chunks(args.movements):
+        count = last - first
+        pool_from = rng.integers(1, args.pools + 1, count).astype(object)
+        pool_to = rng.integers(1, args.pools + 1, count).astype(object)
+        # Зарыбление (нет бассейна-источника) и вылов (нет бассейна-получателя)
+        kind = rng.random(count)
+        pool_from[kind < 0.1] = None
+        pool_to[kind > 0.95] = None
+        insert(conn, 'fish_movement',
+               ['pool_id_from', 'pool_id_to', 'fish_type_id', 'movement_date', 'fish_biomass', 'movement_reason'],
+               list(zip(pool_from.tolist(), pool_to.tolist(), rng.integers(1, args.fish_types + 1, count).tolist(),
+                        dates(rng, count, start).tolist(), np.round(rng.gamma(2.0, 50.0, count), 1).tolist(),
+                        ['Пересадка'] * count)))
+
+
+def generate_inventories(conn, rng, args, start):
+    for first, last in chunks(args.inventories):
+        count = last - first
+        insert(conn, 'fish_inventory', ['id', 'control_date', 'pool_id', 'fish_type_id'],
+               list(zip(range(first + 1, last + 1), dates(rng, count, start).tolist(),
+                        rng.integers(1, args.pools + 1, count).tolist(),
+                        rng.integers(1, args.fish_types + 1, count).tolist())))
+        # От одной до трех навесок на инвентаризацию
+        inventory_ids = np.repeat(np.arange(first + 1, last + 1), rng.integers(1, 4, count))
+        numbers = rng.integers(10, 200, len(inventory_ids))
+        insert(conn, 'fish_boning', ['fish_inventory_id', 'fish_number', 'fish_biomass'],
+               list(zip(inventory_ids.tolist(), numbers.tolist(),
+                        np.round(numbers * rng.gamma(3.0, 0.1, len(inventory_ids)), 2).tolist())))
+
+
+def main():
+    args = parse_args()
+    for name in ('pools', 'group_pools', 'hydrochemistry', 'feeds', 'movements', 'inventories'):
+        setattr(args, name, max(1, int(getattr(args, name) * args.scale)))
+    path = os.path.abspath(args.path)
+    if os.path.exists(path):
+        if not args.force:
+            sys.exit(f'{path} уже существует, укажите --force')
+        os.remove(path)
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+    from app import app, create_tables
+    from fcr import rebuild_rollups
+    from latest import rebuild_latest
+    from ledger import rebuild_ledger
+    from models import db
+    from rollups import rebuild_hydrochemistry_rollups
+
+    rng = np.random.default_rng(args.seed)
+    start = END - args.days * 86400
+    with app.app_context():
+        create_tables()
+        with db.engine.connect() as conn:
+            # Файл новый: при сбое его проще создать заново, чем восстанавливать
+            conn.exec_driver_sql('PRAGMA journal_mode=OFF')
+            conn.exec_driver_sql('PRAGMA synchronous=OFF')
+            for name, step in (('reference', lambda: generate_reference(conn, args)),
+                               ('hydrochemistry', lambda: generate_hydrochemistry(conn, rng, args, start)),
+                               ('feed', lambda: generate_feeds(conn, rng, args, start)),
+                               ('fish_movement', lambda: generate_movements(conn, rng, args, start)),
+                               ('fish_inventory', lambda: generate_inventories(conn, rng, args, start))):
+                started = time.perf_counter()
+                step()
+                conn.commit()
+                print(f'{name}: {time.perf_counter() - started:.1f} с', file=sys.stderr)
+
+        # Производные таблицы строятся теми же функциями, что и команды rebuild-*
+        for name, rebuild in (('pool_stock', rebuild_ledger), ('feed_daily, biomass_daily', rebuild_rollups),
+                              ('hydrochemistry_hourly, hydrochemistry_daily', rebuild_hydrochemistry_rollups),
+                              ('hydrochemistry_latest', rebuild_latest)):
+            started = time.perf_counter()
+            rebuild(db.session)
+            db.session.commit()
+            print(f'{name}: {time.perf_counter() - started:.1f} с', file=sys.stderr)
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""Нагрузочный тест: чтение журналов под одновременной записью от датчиков.
+
+    python bench/load.py bench.sqlite3 --duration 20 --readers 8 --out load.json
+
+Запускает сервер в отдельном процессе в двух режимах и нагружает его одинаково:
+- baseline - отладочный сервер Werkzeug с потоками и настройками SQLite по умолчанию
+  (журнал DELETE, synchronous=FULL, без mmap), как при app.run();
+- tuned - точка входа wsgi.py (waitress) с PRAGMA из database.py.
+
+Читатели в цикле открывают страницы журналов, писатель отправляет пачки измерений
+в /api/ingest/hydrochemistry. Для каждого режима выводятся пропускная способность,
+p50/p95 времени ответа и число ошибок, а также выигрыш tuned относительно baseline.
+БД изменяется (добавляются измерения), поэтому тест лучше запускать на копии.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, 'app')
+TOKEN = 'load-test'
+READ_URLS = ['/hydrochemistry', '/hydrochemistry?sort_by=doxy&reverse=true', '/inventory', '/fish_composition',
+             '/stock']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест чтения под записью')
+    parser.add_argument('path', help='файл БД из bench/generate.py')
+    parser.add_argument('--duration', type=float, default=20.0, help='длительность каждого режима, с')
+    parser.add_argument('--readers', type=int, default=8, help='число одновременных читателей')
+    parser.add_argument('--batch', type=int, default=50, help='измерений в одной отправке писателя')
+    parser.add_argument('--write-interval', type=float, default=0.05, help='пауза писателя между отправками, с')
+    parser.add_argument('--threads', type=int, default=8, help='потоков сервера')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--mode', action='append', choices=['baseline', 'tuned'], help='режимы, по умолчанию оба')
+    parser.add_argument('--serve', choices=['baseline', 'tuned'], help=argparse.SUPPRESS)
+    parser.add_argument('--out', help='файл для JSON, по умолчанию stdout')
+    return parser.parse_args()
+
+
+def serve(args):
+    """Сервер в дочернем процессе."""
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.path)}'
+    os.environ['INGEST_TOKENS'] = TOKEN
+    os.environ['WEB_THREADS'] = str(args.threads)
+    sys.path.insert(0, APP_DIR)
+    if args.serve == 'baseline':
+        # Режим журнала сохраняется в файле БД, поэтому возвращаем умолчание явно
+        with sqlite3.connect(args.path) as conn:
+            conn.execute('PRAGMA journal_mode=DELETE')
+        from app import app, create_tables
+        from werkzeug.serving import run_simple
+
+        app.config['SQLITE_PRAGMAS'] = {}
+        app.config['WTF_CSRF_ENABLED'] = False
+        with app.app_context():
+            create_tables()
+        run_simple('127.0.0.1', args.port, app, threaded=True)
+    else:
+        from wsgi import app
+        from waitress import serve as waitress_serve
+
+        app.config['WTF_CSRF_ENABLED'] = False
+        waitress_serve(app, host='127.0.0.1', port=args.port, threads=args.threads, _quiet=True)
+
+
+def open_session(base):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    opener.open(base + '/login', urllib.parse.urlencode({'username': 'admin', 'password': 'admin'}).encode(),
+                timeout=30).read()
+    return opener
+
+
+def wait_ready(base, process, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Сервер завершился при запуске')
+        try:
+            urllib.request.urlopen(base + '/login', timeout=2).read()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.5)
+    raise RuntimeError('Сервер не запустился')
+
+
+def reader(base, stop, latencies, errors):
+    opener = open_session(base)
+    while not stop.is_set():
+        url = random.choice(READ_URLS)
+        started = time.perf_counter()
+        try:
+            opener.open(base + url, timeout=60).read()
+            latencies.append(time.perf_counter() - started)
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            errors.append(url)
+
+
+def writer(base, stop, args, group_pool_ids, report):
+    timestamp = int(time.time())
+    while not stop.is_set():
+        readings = []
+        for _ in range(args.batch):
+            timestamp += 1
+            readings.append({'group_pool_id': random.choice(group_pool_ids), 'timestamp': timestamp,
+                             'doxy': round(random.gauss(8.5, 0.5), 2), 'temperature': round(random.gauss(12, 0.5), 2)})
+        request = urllib.request.Request(base + '/api/ingest/hydrochemistry', json.dumps(readings).encode(),
+                                         {'Content-Type': 'application/json', 'Authorization': f'Bearer {TOKEN}'})
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                report['accepted'] += json.loads(response.read())['accepted']
+        except urllib.error.HTTPError as error:
+            report['rejected'] += 1 if error.code == 503 else 0
+            report['errors'] += 0 if error.code == 503 else 1
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            report['errors'] += 1
+        time.sleep(args.write_interval)
+
+
+def run_mode(args, mode, group_pool_ids):
+    base = f'http://127.0.0.1:{args.port}'
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), args.path, '--serve', mode,
+                                '--port', str(args.port), '--threads', str(args.threads)],
+                               stdout=subprocess.DEVNULL, stderr=log)
+    try:
+        try:
+            wait_ready(base, process)
+        except RuntimeError:
+            log.seek(0)
+            sys.stderr.write(log.read().decode(errors='replace')[-2000:])
+            raise
+        # Прогрев: первые открытия страниц заполняют кэши процесса
+        opener = open_session(base)
+        for url in READ_URLS:
+            opener.open(base + url, timeout=60).read()
+
+        stop = threading.Event()
+        latencies, errors = [], []
+        writes = {'accepted': 0, 'rejected': 0, 'errors': 0}
+        threads = [threading.Thread(target=reader, args=(base, stop, latencies, errors))
+                   for _ in range(args.readers)]
+        threads.append(threading.Thread(target=writer, args=(base, stop, args, group_pool_ids, writes)))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+        log.close()
+
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 2) if latencies else None,
+        'p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 2) if latencies else None,
+        'read_errors': len(errors),
+        'readings_accepted': writes['accepted'],
+        'ingest_rejected': writes['rejected'],
+        'ingest_errors': writes['errors'],
+    }
+
+
+def main():
+    args = parse_args()
+    if args.serve:
+        serve(args)
+        return
+    if not os.path.exists(args.path):
+        sys.exit(f'{args.path} не найден, создайте БД командой bench/generate.py')
+    with sqlite3.connect(args.path) as conn:
+        group_pool_ids = [row[0] for row in conn.execute('SELECT id FROM group_pool')]
+
+    results = {}
+    for mode in args.mode or ['baseline', 'tuned']:
+        results[mode] = run_mode(args, mode, group_pool_ids)
+        print(f'{mode}: {results[mode]["throughput_rps"]} запросов/с, p95 {results[mode]["p95_ms"]} мс',
+              file=sys.stderr)
+    report = {'readers': args.readers, 'threads': args.threads, 'duration': args.duration,
+              'write_batch': args.batch, 'write_interval': args.write_interval, 'modes': results}
+    if 'baseline' in results and 'tuned' in results and results['baseline']['throughput_rps']:
+        report['throughput_gain'] = round(results['tuned']['throughput_rps'] / results['baseline']['throughput_rps'], 2)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""Замеры основных страниц на БД, созданной bench/generate.py.
+
+    python bench/run.py bench.sqlite3 --iterations 20 --out result.json
+
+Страницы вызываются через тестовый клиент Flask с входом под admin, поэтому
+в замер попадает весь путь запроса: представление, SQL и шаблон. Для каждого
+сценария выводятся p50/p95 времени ответа, число SQL-запросов и пиковая
+память процесса (RSS) в формате JSON.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+COUNTED_TABLES = ('pool', 'group_pool', 'hydrochemistry', 'feed', 'fish_movement', 'fish_inventory',
+                  'fish_boning', 'hydrochemistry_hourly')
+
+# Сценарий замера: cold - сбросить кэш графиков перед запросом, status - ожидаемый код ответа,
+# cleanup - функция, которая после каждого запроса (вне замера) откатывает его запись в БД
+Scenario = namedtuple('Scenario', 'method url data cold status cleanup', defaults=(None, False, 200, None))
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Замеры страниц на синтетической БД')
+    parser.add_argument('path', help='файл БД из bench/generate.py')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--scenario', action='append', help='запустить только указанные сценарии')
+    parser.add_argument('--out', help='файл для JSON, по умолчанию stdout')
+    return parser.parse_args()
+
+
+def peak_rss():
+    """Пиковый RSS процесса в байтах или None, если платформа его не сообщает."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux сообщает килобайты, macOS - байты
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def journal_form(group_pool_ids, date):
+    """Данные формы generate_journal.html: по одной строке измерений на каждый групповой бассейн."""
+    data = {}
+    for index, group_pool_id in enumerate(group_pool_ids):
+        data[f'select_{group_pool_id}'] = 'on'
+        data[f'date_{group_pool_id}'] = datetime.fromtimestamp(date).strftime('%Y-%m-%dT%H:%M')
+        for offset, parameter in enumerate(('doxy', 'temperature', 'ph', 'no2', 'no3', 'nh4', 'po4', 'salinity',
+                                            'illumination')):
+            data[f'{parameter}_{group_pool_id}'] = str(round(5 + offset + index * 0.01, 2))
+    return data
+
+
+def delete_journal(app, date):
+    """Удаляет строки, сохраненные сценарием журнала, через ORM, чтобы сводки и оповещения пересчитались."""
+    from models import db, Hydrochemistry
+
+    with app.app_context():
+        for record in Hydrochemistry.query.filter(Hydrochemistry.hydrochem_date == date):
+            db.session.delete(record)
+        db.session.commit()
+        db.session.remove()
+
+
+def scenarios(app, last, group_pool_ids):
+    """Сценарии замера по имени."""
+    day = datetime.fromtimestamp(last).date()
+    week_ago = last - 7 * 86400
+    end = int(datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp())
+    series = '/api/v1/hydrochemistry/series?parameter=doxy&end={}&start={}'.format
+    # Новый журнал на минуту позже последнего измерения; после каждого запроса он удаляется
+    journal_date = (last // 60 + 1) * 60
+    return {
+        'hydrochemistry': Scenario('GET', '/hydrochemistry'),
+        'hydrochemistry_sorted': Scenario('GET', '/hydrochemistry?sort_by=doxy&reverse=true'),
+        'hydrochemistry_week': Scenario('GET', f'/hydrochemistry?start={week_ago}&end={last}'),
+        # Страница графика только ссылается на серии, их загружает браузер
+        'plot_graph': Scenario('POST', '/plot_graph', {'parameter': 'doxy',
+                                                       'end_date': (day + timedelta(days=1)).isoformat(),
+                                                       'start_date': (day - timedelta(days=90)).isoformat()}),
+        'plot_series_90d': Scenario('GET', series(end, end - 90 * 86400), cold=True),
+        'plot_series_2y': Scenario('GET', series(end, end - 730 * 86400), cold=True),
+        'plot_series_cached': Scenario('GET', series(end, end - 90 * 86400)),
+        'dashboard_30d': Scenario('GET', f'/api/v1/hydrochemistry/dashboard?start={end - 30 * 86400}&end={end}',
+                                  cold=True),
+        'fish_composition': Scenario('GET', '/fish_composition'),
+        'inventory': Scenario('GET', '/inventory'),
+        'feeding': Scenario('GET', '/feeding'),
+        'movement': Scenario('GET', '/movement'),
+        'generate_journal': Scenario('GET', '/hydrochemistry/generate'),
+        # Сохранение журнала по всем бассейнам: проверка CSRF, вставка, сводки и оповещения
+        'generate_journal_post': Scenario('POST', '/hydrochemistry/generate', journal_form(group_pool_ids, journal_date),
+                                          status=302, cleanup=lambda: delete_journal(app, journal_date)),
+    }
+
+
+def measure(client, plot_cache, queries, scenario, csrf_token, iterations, warmup):
+    method, url = scenario.method, scenario.url
+    # Формы отправляются с CSRF-токеном, как из браузера
+    data = dict(scenario.data, csrf_token=csrf_token) if scenario.data is not None else None
+    latencies, counts, sizes = [], [], []
+    for i in range(warmup + iterations):
+        if scenario.cold:
+            plot_cache.clear()
+        before = queries[0]
+        started = time.perf_counter()
+        response = client.open(url, method=method, data=data)
+        elapsed = time.perf_counter() - started
+        if response.status_code != scenario.status:
+            raise RuntimeError(f'{method} {url}: {response.status_code}')
+        if scenario.cleanup:
+            scenario.cleanup()
+        if i >= warmup:
+            latencies.append(elapsed)
+            counts.append(queries[0] - before)
+            sizes.append(len(response.data))
+    return {
+        'method': method,
+        'url': url,
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 2),
+        'p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2),
+        'queries': int(np.median(counts)),
+        'queries_max': max(counts),
+        'response_bytes': int(np.median(sizes)),
+        'peak_rss_bytes': peak_rss(),
+    }
+
+
+def main():
+    args = parse_args()
+    path = os.path.abspath(args.path)
+    if not os.path.exists(path):
+        sys.exit(f'{path} не найден, создайте БД командой bench/generate.py')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+    from app import app
+    from models import db, GroupPool
+    from plot_cache import plot_cache
+    from sqlalchemy import event, func, select
+
+    app.config['TESTING'] = True
+    queries = [0]
+
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_query(*args):
+            queries[0] += 1
+
+        rows = {table: db.session.execute(select(func.count()).select_from(db.metadata.tables[table])).scalar()
+                for table in COUNTED_TABLES}
+        last = db.session.execute(db.text('SELECT max(hydrochem_date) FROM hydrochemistry')).scalar()
+        group_pool_ids = db.session.execute(select(GroupPool.id).order_by(GroupPool.id)).scalars().all()
+        db.session.remove()
+    if last is None:
+        sys.exit('В БД нет измерений гидрохимии')
+
+    client = app.test_client()
+    # CSRF-токен привязан к сессии и годится для всех форм этого клиента
+    token = CSRF_TOKEN.search(client.get('/login').get_data(as_text=True))
+    response = client.post('/login', data={'username': 'admin', 'password': 'admin',
+                                           'csrf_token': token.group(1) if token else ''})
+    if response.status_code != 302:
+        sys.exit('Не удалось войти под admin')
+    csrf_token = CSRF_TOKEN.search(client.get('/hydrochemistry/generate').get_data(as_text=True)).group(1)
+
+    results = {}
+    for name, scenario in scenarios(app, last, group_pool_ids).items():
+        if args.scenario and name not in args.scenario:
+            continue
+        results[name] = measure(client, plot_cache, queries, scenario, csrf_token, args.iterations, args.warmup)
+        print(f'{name}: p50 {results[name]["p50_ms"]} мс, p95 {results[name]["p95_ms"]} мс, '
+              f'{results[name]["queries"]} запросов', file=sys.stderr)
+
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'database': path,
+        'database_bytes': os.path.getsize(path),
+        'rows': rows,
+        'iterations': args.iterations,
+        'warmup': args.warmup,
+        'scenarios': results,
+        'peak_rss_bytes': peak_rss(),
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Замер холодного запуска: время импорта приложения и время до первого ответа.
+
+    python bench/startup.py --db bench.sqlite3 --runs 5 --out startup.json
+
+Каждый прогон запускает app/launcher.py (как app.exe) в новом процессе и опрашивает
+/ready. Выводятся медианы: время до первого ответа сервера, до готовности
+приложения, до окончания фонового прогрева и до первой открытой страницы входа,
+а также время импорта модуля app в отдельном процессе.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, 'app')
+POLL_INTERVAL = 0.01
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Замер холодного запуска приложения')
+    parser.add_argument('--db', help='файл БД, по умолчанию БД приложения')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=5056)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--out', help='файл для JSON, по умолчанию stdout')
+    return parser.parse_args()
+
+
+def environment(args):
+    env = dict(os.environ, PORT=str(args.port))
+    if args.db:
+        env['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+    return env
+
+
+def import_time(env):
+    code = 'import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)'
+    result = subprocess.run([sys.executable, '-c', code], cwd=APP_DIR, env=env, capture_output=True, text=True,
+                            check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def poll(url):
+    """(код ответа, тело) или None, если сервер еще не принимает соединения."""
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+
+def launch(args, env):
+    base = f'http://127.0.0.1:{args.port}'
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(APP_DIR, 'launcher.py')], cwd=APP_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    timings = {}
+    try:
+        while time.perf_counter() - started < args.timeout:
+            if process.poll() is not None:
+                raise RuntimeError('Приложение завершилось при запуске')
+            result = poll(base + '/ready')
+            now = time.perf_counter() - started
+            if result is not None:
+                timings.setdefault('first_response', now)
+                status, body = result
+                if status == 200:
+                    timings.setdefault('ready', now)
+                    if 'login_page' not in timings:
+                        page_started = time.perf_counter()
+                        status, _ = poll(base + '/login')
+                        timings['login_page'] = now + time.perf_counter() - page_started
+                    if json.loads(body).get('warm'):
+                        timings['warm'] = now
+                        timings['steps'] = json.loads(body)['steps']
+                        return timings
+            time.sleep(POLL_INTERVAL)
+        raise RuntimeError('Приложение не прогрелось за отведенное время')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def median(values):
+    return round(statistics.median(values), 3)
+
+
+def main():
+    args = parse_args()
+    env = environment(args)
+    imports = [import_time(env) for _ in range(args.runs)]
+    runs = [launch(args, env) for _ in range(args.runs)]
+    report = {
+        'runs': args.runs,
+        'import_app_seconds': median(imports),
+        'first_response_seconds': median([run['first_response'] for run in runs]),
+        'ready_seconds': median([run['ready'] for run in runs]),
+        'login_page_seconds': median([run['login_page'] for run in runs]),
+        'warm_seconds': median([run['warm'] for run in runs]),
+        'warm_steps': {name: median([run['steps'][name] for run in runs]) for name in runs[0]['steps']},
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,8 +2,14 @@
 
 start app.exe
 
-TIMEOUT /T 2 /NOBREAK
- 
+rem Ждем, пока приложение ответит на /ready, но не дольше двух минут.
+rem ping -n 2 ждет около секунды: между первым и вторым запросом проходит секунда
+for /L %%i in (1,1,120) do (
+    curl -s -f -o NUL http://127.0.0.1:5000/ready && goto ready
+    ping -n 2 127.0.0.1 >NUL
+)
+
+:ready
 start http://127.0.0.1:5000/
  
-exit
\ No newline at end of file
+exit
@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+# Приложение читает DATABASE_URL при импорте, поэтому временная БД задается до него
+_directory = tempfile.mkdtemp(prefix='fish-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_directory, 'db.sqlite3')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+import app as application  # noqa: E402
+from models import db, table_version  # noqa: E402
+from versions import bump  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    application.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False,
+                                  ARCHIVE_DIR=os.path.join(_directory, 'archive'))
+    application.prepare_app(warm_up=False)
+    return application.app
+
+
+@pytest.fixture
+def session(app):
+    """Сессия БД внутри контекста приложения; после теста все таблицы очищаются."""
+    with app.app_context():
+        yield db.session
+        db.session.rollback()
+        # Версии таблиц не сбрасываются, а увеличиваются, как при обычном удалении:
+        # иначе кэши процесса, проверяемые по версиям, вернули бы данные прошлого теста
+        tables = [table for table in reversed(db.metadata.sorted_tables)
+                  if table.name not in ('user', table_version.name)]
+        with db.engine.begin() as conn:
+            for table in tables:
+                conn.execute(table.delete())
+            bump(conn, [table.name for table in tables])
+
+
+@pytest.fixture
+def client(app, session, monkeypatch):
+    """Клиент приложения без входа в систему."""
+    monkeypatch.setitem(app.config, 'LOGIN_DISABLED', True)
+    return app.test_client()
+
+
+@pytest.fixture
+def archive_dir(app, tmp_path, monkeypatch):
+    """Каталог архива для одного теста."""
+    monkeypatch.setitem(app.config, 'ARCHIVE_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def statements(app):
+    """Контекстный менеджер, собирающий SQL, выполненный внутри него."""
+    @contextmanager
+    def collect():
+        executed = []
+
+        def listener(conn, cursor, statement, parameters, context, executemany):
+            executed.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            yield executed
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+    return collect
@@ -0,0 +1,65 @@
+from models import GroupPool, Hydrochemistry, AlertRule, Alert
+
+
+def add_reading(session, group_pool, date, ph):
+    reading = Hydrochemistry(group_pool_id=group_pool.id, hydrochem_date=date, ph=ph)
+    session.add(reading)
+    session.commit()
+    return reading
+
+
+def active(session):
+    return session.query(Alert).filter(Alert.resolved_at.is_(None)).all()
+
+
+def test_alert_opens_on_reading(session):
+    group_pool = GroupPool(name='ГБ 1')
+    session.add_all([group_pool, AlertRule(name='pH высокий', parameter='ph', kind='threshold', operator='>',
+                                           threshold=8.0)])
+    session.commit()
+    add_reading(session, group_pool, 1_700_000_000, 7.5)
+    assert active(session) == []
+    add_reading(session, group_pool, 1_700_000_600, 8.5)
+    assert [alert.value for alert in active(session)] == [8.5]
+
+
+def test_deleting_triggering_reading_closes_alert(session):
+    group_pool = GroupPool(name='ГБ 1')
+    session.add_all([group_pool, AlertRule(name='pH высокий', parameter='ph', kind='threshold', operator='>',
+                                           threshold=8.0)])
+    session.commit()
+    add_reading(session, group_pool, 1_700_000_000, 7.5)
+    reading = add_reading(session, group_pool, 1_700_000_600, 8.5)
+    assert len(active(session)) == 1
+
+    # Последним снова становится нормальное измерение
+    session.delete(reading)
+    session.commit()
+    assert active(session) == []
+    assert session.query(Alert).one().resolved_at is not None
+
+
+def test_deleting_last_reading_closes_alert(session):
+    group_pool = GroupPool(name='ГБ 1')
+    session.add_all([group_pool, AlertRule(name='pH высокий', parameter='ph', kind='threshold', operator='>',
+                                           threshold=8.0)])
+    session.commit()
+    reading = add_reading(session, group_pool, 1_700_000_000, 8.5)
+    assert len(active(session)) == 1
+
+    session.delete(reading)
+    session.commit()
+    assert active(session) == []
+
+
+def test_deleting_other_reading_keeps_alert(session):
+    group_pool = GroupPool(name='ГБ 1')
+    session.add_all([group_pool, AlertRule(name='pH высокий', parameter='ph', kind='threshold', operator='>',
+                                           threshold=8.0)])
+    session.commit()
+    old = add_reading(session, group_pool, 1_700_000_000, 7.5)
+    add_reading(session, group_pool, 1_700_000_600, 8.5)
+
+    session.delete(old)
+    session.commit()
+    assert [alert.value for alert in active(session)] == [8.5]
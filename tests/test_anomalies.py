@@ -0,0 +1,26 @@
+from anomalies import anomaly_points, anomaly_scores, detect_anomalies
+from models import GroupPool, Hydrochemistry, HydrochemistryAnomaly
+
+START = 1_700_000_000
+
+
+def test_every_reading_is_scored_and_spike_is_flagged(session):
+    group_pool = GroupPool(name='ГБ 1')
+    session.add(group_pool)
+    session.commit()
+    readings = [Hydrochemistry(group_pool_id=group_pool.id, hydrochem_date=START + 3600 * i,
+                               ph=7.0 + 0.01 * (i % 5)) for i in range(39)]
+    spike = Hydrochemistry(group_pool_id=group_pool.id, hydrochem_date=START + 3600 * 39, ph=9.0)
+    session.add_all(readings + [spike])
+    session.commit()
+
+    assert detect_anomalies() == 1
+    # Оценки есть у каждого измерения pH, пустые параметры не оцениваются
+    scores = session.query(HydrochemistryAnomaly).all()
+    assert {score.parameter for score in scores} == {'ph'} and len(scores) == 40
+    assert [score.hydrochemistry_id for score in scores if score.flagged] == [spike.id]
+    assert session.get(HydrochemistryAnomaly, (readings[-1].id, 'ph')).robust_score is not None
+
+    assert list(anomaly_scores([reading.id for reading in readings + [spike]])) == [spike.id]
+    points = anomaly_points('ph', START, START + 3600 * 40, [group_pool.id])
+    assert points == {group_pool.id: ([spike.hydrochem_date], [9.0])}
@@ -0,0 +1,61 @@
+import pytest
+
+from models import GroupPool, Hydrochemistry
+from pagination import encode_cursor
+
+HEADERS = {'Authorization': 'Bearer secret'}
+
+
+@pytest.fixture
+def api(app, session, monkeypatch):
+    monkeypatch.setitem(app.config, 'API_TOKENS', ['secret'])
+    client = app.test_client()
+    return lambda url, **headers: client.get(url, headers={**HEADERS, **headers})
+
+
+@pytest.fixture
+def readings(session):
+    group_pool = GroupPool(name='ГБ 1')
+    session.add(group_pool)
+    session.commit()
+    session.add_all([Hydrochemistry(group_pool_id=group_pool.id, hydrochem_date=1_700_000_000 + 60 * i, ph=7.0)
+                     for i in range(5)])
+    session.commit()
+    return group_pool
+
+
+def test_pages_follow_cursor(api, readings):
+    dates, url = [], '/api/v1/hydrochemistry?limit=2&fields=hydrochem_date'
+    while url:
+        body = api(url).json
+        dates += [record['hydrochem_date'] for record in body['data']]
+        url = f"/api/v1/hydrochemistry?limit=2&fields=hydrochem_date&after={body['next']}" if body['next'] else None
+    assert dates == [1_700_000_000 + 60 * i for i in range(5)]
+
+
+@pytest.mark.parametrize('cursor', ['not-base64!', encode_cursor(['x', 1]), encode_cursor([1, True]),
+                                    encode_cursor([1]), encode_cursor({'a': 1})])
+def test_bad_cursor_is_400(api, readings, cursor):
+    response = api(f'/api/v1/hydrochemistry?after={cursor}')
+    assert response.status_code == 400
+    assert 'error' in response.json
+
+
+def test_unchanged_collection_answers_304(api, readings, session, statements):
+    first = api('/api/v1/hydrochemistry')
+    etag = first.headers['ETag']
+
+    with statements() as executed:
+        response = api('/api/v1/hydrochemistry', **{'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    # Условный GET стоит одного запроса к версии таблицы, коллекция не читается
+    assert [sql for sql in executed if 'table_version' in sql] and \
+        not [sql for sql in executed if 'FROM hydrochemistry' in sql]
+
+    session.add(Hydrochemistry(group_pool_id=readings.id, hydrochem_date=1_700_001_000, ph=7.1))
+    session.commit()
+    response = api('/api/v1/hydrochemistry', **{'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(response.json['data']) == 6
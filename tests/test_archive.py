@@ -0,0 +1,43 @@
+import csv
+import io
+from datetime import datetime
+
+from exporter import generate_csv
+from models import db, GroupPool, Hydrochemistry
+from retention import archive_table_rows
+
+
+def timestamp(*args):
+    return int(datetime(*args).timestamp())
+
+
+DATES = [timestamp(2020, 1, 10), timestamp(2020, 1, 20), timestamp(2020, 2, 10), timestamp(2023, 5, 1)]
+
+
+def test_archived_readings_are_still_read(app, session, archive_dir, monkeypatch):
+    group_pool = GroupPool(name='ГБ 1')
+    session.add(group_pool)
+    session.commit()
+    session.add_all([Hydrochemistry(group_pool_id=group_pool.id, hydrochem_date=date, ph=7.0 + i)
+                     for i, date in enumerate(DATES)])
+    session.commit()
+
+    with db.engine.connect() as conn:
+        report = archive_table_rows(conn, 'hydrochemistry', timestamp(2020, 3, 1))
+    assert (report['moved'], report['periods']) == (3, 2)
+    assert sorted(path.name for path in archive_dir.iterdir()) == ['hydrochemistry-2020-01.sqlite3',
+                                                                    'hydrochemistry-2020-02.sqlite3']
+    assert session.query(Hydrochemistry).count() == 1
+
+    # Выгрузка и API читают архив вместе с основной БД в общем порядке дат
+    exported = csv.DictReader(io.StringIO(''.join(generate_csv('hydrochemistry'))))
+    assert [float(row['ph']) for row in exported] == [7.0, 8.0, 9.0, 10.0]
+
+    monkeypatch.setitem(app.config, 'API_TOKENS', ['secret'])
+    client = app.test_client()
+    dates, url = [], '/api/v1/hydrochemistry?limit=2&fields=hydrochem_date'
+    while url:
+        body = client.get(url, headers={'Authorization': 'Bearer secret'}).json
+        dates += [record['hydrochem_date'] for record in body['data']]
+        url = f"/api/v1/hydrochemistry?limit=2&fields=hydrochem_date&after={body['next']}" if body['next'] else None
+    assert dates == DATES
@@ -0,0 +1,62 @@
+import json
+import math
+import struct
+
+import numpy as np
+from sqlalchemy import select
+
+from columnar import DTYPES, MAGIC, encode_columns, fetch_array
+from models import db, GroupPool, Hydrochemistry
+
+
+def decode(payload):
+    # Тот же разбор, что в static/js/columnar.js
+    assert payload[:4] == MAGIC
+    (length,) = struct.unpack('<I', payload[4:8])
+    assert length % 8 == 0
+    header = json.loads(payload[8:8 + length].decode('utf-8'))
+    data = payload[8 + length:]
+    series = []
+    for entry in header['series']:
+        columns = {}
+        for name, layout in entry['columns'].items():
+            if layout is None:
+                columns[name] = None
+                continue
+            offset, count = layout
+            assert offset % 8 == 0
+            columns[name] = np.frombuffer(data, dtype=DTYPES[header['dtypes'][name]], count=count, offset=offset)
+        series.append((entry, columns))
+    return header, series
+
+
+def test_columns_round_trip():
+    dtypes = {'x': 'int64', 'mean': 'float32', 'min': 'float32'}
+    payload = encode_columns([
+        ({'name': 'ГБ 1'}, {'x': [1, 2, 3], 'mean': [7.0, 7.5, float('nan')], 'min': None}),
+        ({'name': 'ГБ 2', 'scale': float('inf')}, {'x': [4], 'mean': [8.0], 'min': [7.0]}),
+    ], dtypes, resolution='raw', budget=float('nan'))
+
+    header, series = decode(payload)
+    # NaN и Infinity в заголовке недопустимы для JSON.parse и заменяются на null
+    assert (header['resolution'], header['budget']) == ('raw', None)
+    (first, first_columns), (second, second_columns) = series
+    assert first['name'] == 'ГБ 1' and second['scale'] is None
+    assert first_columns['x'].tolist() == [1, 2, 3] and first_columns['min'] is None
+    assert first_columns['mean'][:2].tolist() == [7.0, 7.5] and math.isnan(first_columns['mean'][2])
+    assert (second_columns['x'].tolist(), second_columns['min'].tolist()) == ([4], [7.0])
+
+
+def test_fetch_array_turns_null_into_nan(session):
+    group_pool = GroupPool(name='ГБ 1')
+    session.add(group_pool)
+    session.commit()
+    session.add_all([Hydrochemistry(group_pool_id=group_pool.id, hydrochem_date=1_700_000_000, ph=7.0),
+                     Hydrochemistry(group_pool_id=group_pool.id, hydrochem_date=1_700_000_060, ph=None)])
+    session.commit()
+
+    dtype = np.dtype([('x', np.int64), ('ph', np.float64)])
+    data = fetch_array(db.session.connection(), select(Hydrochemistry.hydrochem_date, Hydrochemistry.ph)
+                       .order_by(Hydrochemistry.hydrochem_date), dtype)
+    assert data['x'].tolist() == [1_700_000_000, 1_700_000_060]
+    assert data['ph'][0] == 7.0 and math.isnan(data['ph'][1])
@@ -0,0 +1,23 @@
+from downsample import downsample_series
+from models import GroupPool, Hydrochemistry, hydrochemistry_daily, hydrochemistry_hourly
+
+START = 1_700_000_000
+
+
+def test_series_read_raw_readings_when_rollup_is_empty(session):
+    group_pool = GroupPool(name='ГБ 1')
+    session.add(group_pool)
+    session.commit()
+    session.add_all([Hydrochemistry(group_pool_id=group_pool.id, hydrochem_date=START + 600 * i, ph=7.0 + 0.1 * i)
+                     for i in range(3)])
+    session.commit()
+    # Сводка отстает от журнала: строк за период в ней еще нет
+    session.execute(hydrochemistry_daily.delete())
+    session.execute(hydrochemistry_hourly.delete())
+    session.commit()
+
+    series = downsample_series('ph', START, START + 3600)
+    assert list(series) == [group_pool.id]
+    assert series[group_pool.id]['x'].tolist() == [START, START + 600, START + 1200]
+    assert series[group_pool.id]['mean'].tolist() == [7.0, 7.1, 7.2]
+    assert downsample_series('doxy', START, START + 3600) == {}
@@ -0,0 +1,42 @@
+import csv
+import io
+from datetime import datetime
+
+import pyarrow.parquet as pq
+
+from exporter import generate_csv, local_timezone, write_parquet
+from models import GroupPool, Hydrochemistry
+
+START = 1_700_000_000
+
+
+def add_readings(session):
+    group_pool = GroupPool(name='ГБ 1')
+    session.add(group_pool)
+    session.commit()
+    session.add_all([Hydrochemistry(group_pool_id=group_pool.id, hydrochem_date=START + 3600 * i, ph=7.0 + i)
+                     for i in range(3)])
+    session.commit()
+
+
+def test_csv_has_local_dates_and_period(session):
+    add_readings(session)
+    rows = list(csv.DictReader(io.StringIO(''.join(generate_csv('hydrochemistry', START + 3600, chunk_size=1)))))
+    # Дата выгружается в местном времени и в том виде, в каком ее принимает загрузка CSV
+    assert [row['hydrochem_date'] for row in rows] == [
+        datetime.fromtimestamp(START + 3600 * i).strftime('%Y-%m-%d %H:%M:%S') for i in (1, 2)]
+    assert [row['ph'] for row in rows] == ['8.0', '9.0']
+
+
+def test_parquet_keeps_instants_with_server_timezone(session):
+    add_readings(session)
+    target = io.BytesIO()
+    assert write_parquet('hydrochemistry', target, chunk_size=2) == 3
+
+    table = pq.read_table(io.BytesIO(target.getvalue()))
+    assert pq.ParquetFile(io.BytesIO(target.getvalue())).num_row_groups == 2
+    # Секунды Parquet хранит в миллисекундах; важны сами моменты времени и пояс
+    assert table.schema.field('hydrochem_date').type.tz == local_timezone()
+    assert [value.timestamp() for value in table.column('hydrochem_date').to_pylist()] == \
+        [START + 3600 * i for i in range(3)]
+    assert table.column('ph').to_pylist() == [7.0, 8.0, 9.0]
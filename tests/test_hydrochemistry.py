@@ -0,0 +1,37 @@
+from models import GroupPool, Hydrochemistry
+
+
+def add_group_pools(session, *names):
+    group_pools = [GroupPool(name=name) for name in names]
+    session.add_all(group_pools)
+    session.commit()
+    return group_pools
+
+
+def form_data(group_pool, date, **values):
+    return {'group_pool_id': group_pool.id, 'hydrochem_date': date, **values}
+
+
+def test_edit_to_existing_key_is_rejected(session, client):
+    first, second = add_group_pools(session, 'ГБ 1', 'ГБ 2')
+    session.add_all([Hydrochemistry(group_pool_id=first.id, hydrochem_date=1_700_000_000, ph=7.0),
+                     Hydrochemistry(group_pool_id=second.id, hydrochem_date=1_700_000_000, ph=7.5)])
+    session.commit()
+    record = session.query(Hydrochemistry).filter_by(group_pool_id=second.id).one()
+
+    response = client.post(f'/hydrochemistry/edit/{record.id}',
+                           data=form_data(first, '2023-11-14 22:13:20', ph='8.0'))
+    assert response.status_code == 200
+    assert 'уже есть запись на эту дату' in response.get_data(as_text=True)
+    session.expire_all()
+    assert session.get(Hydrochemistry, record.id).group_pool_id == second.id
+
+
+def test_new_reading_with_existing_key_is_rejected(session, client):
+    group_pool, = add_group_pools(session, 'ГБ 1')
+    session.add(Hydrochemistry(group_pool_id=group_pool.id, hydrochem_date=1_700_000_000, ph=7.0))
+    session.commit()
+
+    response = client.post('/hydrochemistry/new', data=form_data(group_pool, '2023-11-14 22:13:20', ph='8.0'))
+    assert response.status_code == 200
+    assert session.query(Hydrochemistry).count() == 1
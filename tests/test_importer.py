@@ -0,0 +1,43 @@
+import io
+from datetime import datetime
+
+import pytest
+
+from importer import RowError, import_rows
+from models import GroupPool, Hydrochemistry
+
+
+def timestamp(text):
+    return int(datetime.strptime(text, '%Y-%m-%d %H:%M:%S').timestamp())
+
+
+def csv_file(*lines):
+    return io.BytesIO('\n'.join(lines).encode('utf-8-sig'))
+
+
+def test_rows_are_checked_one_by_one(session):
+    group_pool = GroupPool(name='ГБ 1')
+    session.add(group_pool)
+    session.commit()
+    report = import_rows('hydrochemistry', csv_file(
+        'group_pool;hydrochem_date;ph;doxy',
+        'гб 1;2023-11-14 22:00:00;7,1;',
+        'ГБ 1;2023-11-14 22:00:00;7,2;',
+        'ГБ 9;2023-11-14 23:00:00;7,0;',
+        'ГБ 1;14.11.2023;7,0;',
+        'ГБ 1;2023-11-14 23:00:00;кислый;',
+        '',
+        f'{group_pool.id};2023-11-15 00:00:00;7.3;8',
+    ), batch_size=2)
+
+    assert report.inserted == 2
+    assert [line for line, _ in report.errors] == [3, 4, 5, 6]
+    assert 'уже существует' in report.errors[0][1] and 'ГБ 9' in report.errors[1][1]
+    saved = session.query(Hydrochemistry).order_by(Hydrochemistry.hydrochem_date).all()
+    assert [(reading.hydrochem_date, reading.ph, reading.doxy) for reading in saved] == [
+        (timestamp('2023-11-14 22:00:00'), 7.1, None), (timestamp('2023-11-15 00:00:00'), 7.3, 8.0)]
+
+
+def test_file_without_required_column_is_refused(session):
+    with pytest.raises(RowError, match='Дата'):
+        import_rows('hydrochemistry', csv_file('group_pool,ph', 'ГБ 1,7.0'))
@@ -0,0 +1,86 @@
+import json
+import time
+
+import pytest
+
+from ingest import IngestBuffer, ReadingError, parse_reading, replay_dead_letter
+from models import GroupPool, Hydrochemistry
+
+
+@pytest.fixture
+def group_pool(session):
+    group_pool = GroupPool(name='ГБ 1')
+    session.add(group_pool)
+    session.commit()
+    return group_pool
+
+
+@pytest.mark.parametrize('timestamp', [float('nan'), float('inf'), -float('inf'), 2 ** 63, 10 ** 400, -1,
+                                       '9999-01-01T00:00:00', 'вчера', True, None])
+def test_bad_timestamp_is_rejected(timestamp):
+    with pytest.raises(ReadingError):
+        parse_reading({'group_pool_id': 1, 'timestamp': timestamp, 'ph': 7.0}, {1})
+
+
+@pytest.mark.parametrize('value', [float('nan'), float('inf'), 10 ** 400, '7.0', True])
+def test_bad_value_is_rejected(value):
+    with pytest.raises(ReadingError):
+        parse_reading({'group_pool_id': 1, 'timestamp': 1_700_000_000, 'ph': value}, {1})
+
+
+def test_reading_is_converted():
+    row = parse_reading({'group_pool_id': 1, 'timestamp': '2023-11-14T22:13:20', 'ph': 7, 'doxy': None}, {1})
+    assert row['ph'] == 7.0 and row['doxy'] is None
+    assert isinstance(row['hydrochem_date'], int)
+
+
+def test_endpoint_rejects_bad_readings_one_by_one(app, session, group_pool, monkeypatch):
+    monkeypatch.setitem(app.config, 'INGEST_TOKENS', ['secret'])
+    # Flask разбирает NaN и Infinity в JSON, поэтому тело собирается вручную
+    body = ('[{"group_pool_id": %d, "timestamp": NaN, "ph": 7.0},'
+            ' {"group_pool_id": %d, "timestamp": 1700000000, "ph": Infinity},'
+            ' {"group_pool_id": %d, "timestamp": 99999999999999999999, "ph": 7.0},'
+            ' {"group_pool_id": %d, "timestamp": 1700000000, "ph": 7.2}]') % ((group_pool.id,) * 4)
+    response = app.test_client().post('/api/ingest/hydrochemistry', data=body, content_type='application/json',
+                                      headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 202
+    assert response.json['accepted'] == 1
+    assert [item['index'] for item in response.json['rejected']] == [0, 1, 2]
+
+    deadline = time.monotonic() + 10
+    while session.query(Hydrochemistry).count() == 0 and time.monotonic() < deadline:
+        time.sleep(0.1)
+        session.rollback()
+    assert [reading.ph for reading in session.query(Hydrochemistry)] == [7.2]
+
+
+def test_flush_merges_repeated_readings(app, session, group_pool):
+    buffer = IngestBuffer(app)
+    reading = {'group_pool_id': group_pool.id, 'hydrochem_date': 1_700_000_000}
+    buffer.flush([parse_reading({**reading, 'ph': 7.0}, {group_pool.id}),
+                  parse_reading({**reading, 'doxy': 8.0}, {group_pool.id})])
+    buffer.flush([parse_reading({**reading, 'ph': 7.5}, {group_pool.id})])
+
+    saved = session.query(Hydrochemistry).one()
+    assert (saved.ph, saved.doxy) == (7.5, 8.0)
+    assert (buffer.flushed, buffer.merged) == (1, 2)
+
+
+def test_failed_batch_goes_to_dead_letter_and_replays(app, session, group_pool, tmp_path, monkeypatch):
+    path = str(tmp_path / 'failed.jsonl')
+    buffer = IngestBuffer(app, retries=1, dead_letter=path)
+    row = parse_reading({'group_pool_id': group_pool.id, 'timestamp': 1_700_000_000, 'ph': 7.0}, {group_pool.id})
+
+    def broken(batch):
+        raise RuntimeError('БД недоступна')
+
+    monkeypatch.setattr(buffer, 'flush', broken)
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+    assert buffer.save([row]) is False
+    assert (buffer.retried, buffer.failed) == (1, 1)
+    with open(path, encoding='utf-8') as file:
+        assert [json.loads(line) for line in file] == [row]
+
+    monkeypatch.undo()
+    assert replay_dead_letter(buffer, path) == (1, 0)
+    assert session.query(Hydrochemistry).one().ph == 7.0
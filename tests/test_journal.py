@@ -0,0 +1,41 @@
+from journal import parse_journal_form, save_journal
+from models import GroupPool, Hydrochemistry, hydrochemistry_hourly
+
+
+def add_group_pools(session):
+    group_pools = [GroupPool(name='ГБ 1'), GroupPool(name='ГБ 2')]
+    session.add_all(group_pools)
+    session.commit()
+    return group_pools
+
+
+def journal_form(group_pools, **values):
+    form = {}
+    for gp in group_pools:
+        form.update({f'select_{gp.id}': 'on', f'date_{gp.id}': '2023-11-14T22:00', f'ph_{gp.id}': '7.0'})
+    form.update(values)
+    return form
+
+
+def test_form_errors_are_reported_per_group_pool(session):
+    first, second = add_group_pools(session)
+    rows, errors = parse_journal_form(journal_form([first, second], **{f'date_{first.id}': 'вчера',
+                                                                       f'ph_{second.id}': '7,0'}), [first, second])
+    assert rows == [] and set(errors) == {first.id, second.id}
+
+
+def test_journal_is_saved_whole_or_not_at_all(session):
+    group_pools = add_group_pools(session)
+    rows, errors = parse_journal_form(journal_form(group_pools), group_pools)
+    assert errors == {} and len(rows) == 2
+    assert save_journal(rows[:1], group_pools) == {}
+
+    # Запись первого бассейна уже есть, поэтому не сохраняется и запись второго
+    errors = save_journal(rows, group_pools)
+    assert list(errors) == [group_pools[0].id]
+    assert session.query(Hydrochemistry).count() == 1
+
+    assert save_journal(rows[1:], group_pools) == {}
+    assert session.query(Hydrochemistry).count() == 2
+    # Массовая вставка проходит через события, как запись из формы: сводка обновлена
+    assert session.query(hydrochemistry_hourly).count() == 2
@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine
+
+from migrations import MIGRATIONS, check_query_plans, schema_version
+from models import db
+
+# Таблицы первой версии; таблицы, добавленные позже, create_all создает сразу с индексами
+ORIGINAL_TABLES = ('group_pool_pool', 'hydrochemistry', 'fish_inventory', 'fish_boning', 'feed', 'fish_movement')
+
+
+def test_hot_queries_use_indexes(app):
+    with app.app_context(), db.engine.connect() as conn:
+        assert schema_version(conn) == MIGRATIONS[-1][0]
+        assert check_query_plans(conn) == []
+
+
+def test_old_database_is_upgraded(app, tmp_path):
+    # Файл версии 0: таблицы уже есть, индексов и ключа (бассейн, время) еще нет, в журнале повторы
+    engine = create_engine('sqlite:///' + str(tmp_path / 'old.sqlite3'))
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for (name,) in conn.exec_driver_sql(f"SELECT name FROM sqlite_master WHERE type = 'index' "
+                                            f"AND name LIKE 'ix_%' AND tbl_name IN {ORIGINAL_TABLES}").all():
+            conn.exec_driver_sql(f'DROP INDEX {name}')
+        conn.exec_driver_sql("INSERT INTO group_pool (id, name) VALUES (1, 'ГБ 1')")
+        conn.exec_driver_sql('INSERT INTO hydrochemistry (group_pool_id, hydrochem_date, ph, doxy) '
+                             'VALUES (1, 1700000000, 7.0, NULL), (1, 1700000000, 7.5, 8.0)')
+
+    with app.app_context(), engine.begin() as conn:
+        for version, step in MIGRATIONS:
+            step(conn)
+            conn.exec_driver_sql(f'PRAGMA user_version = {int(version)}')
+        assert conn.exec_driver_sql('SELECT ph, doxy FROM hydrochemistry').all() == [(7.5, 8.0)]
+        indexes = {row[1]: row[2] for row in conn.exec_driver_sql('PRAGMA index_list(hydrochemistry)')}
+        assert indexes['ix_hydrochemistry_group_pool_date'] == 1
+        assert check_query_plans(conn) == []
@@ -0,0 +1,46 @@
+from app import series_payload
+from models import GroupPool, Hydrochemistry
+from plot_cache import plot_cache, source_version
+from versions import PERIOD
+
+FIRST = 1_700_000_000 // PERIOD * PERIOD
+LATER = FIRST + 3 * PERIOD
+FIRST_RANGE = (FIRST, FIRST + PERIOD - 1)
+LATER_RANGE = (LATER, LATER + PERIOD - 1)
+
+
+def add_reading(session, group_pool, date):
+    session.add(Hydrochemistry(group_pool_id=group_pool.id, hydrochem_date=date, ph=7.0))
+    session.commit()
+
+
+def cached_series(start, end):
+    misses = plot_cache.stats()['misses']
+    series_payload('ph', start, end)
+    return plot_cache.stats()['misses'] == misses
+
+
+def test_source_version_changes_only_for_written_period(session):
+    group_pool = GroupPool(name='ГБ 1')
+    session.add(group_pool)
+    session.commit()
+    first, later = source_version(session, *FIRST_RANGE), source_version(session, *LATER_RANGE)
+
+    add_reading(session, group_pool, LATER + 60)
+    assert source_version(session, *FIRST_RANGE) == first
+    assert source_version(session, *LATER_RANGE) != later
+    assert source_version(session, FIRST, LATER + 60) != source_version(session, *FIRST_RANGE)
+
+
+def test_write_keeps_graphs_of_other_periods_cached(session):
+    plot_cache.clear()
+    group_pool = GroupPool(name='ГБ 1')
+    session.add(group_pool)
+    session.commit()
+    add_reading(session, group_pool, FIRST + 60)
+    add_reading(session, group_pool, LATER + 60)
+    assert not cached_series(*FIRST_RANGE) and not cached_series(*LATER_RANGE)
+
+    add_reading(session, group_pool, LATER + 120)
+    assert cached_series(*FIRST_RANGE)
+    assert not cached_series(*LATER_RANGE)
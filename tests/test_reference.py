@@ -0,0 +1,27 @@
+from flask import g
+
+from models import Pool, FishType
+
+
+def test_form_reads_versions_once_per_request(session, client, statements):
+    session.add_all([Pool(name='Б 1'), FishType(name='Осетр')])
+    session.commit()
+    assert client.get('/fish_movement/new').status_code == 200
+    # Клиент тестов работает в контексте приложения фикстуры; новый запрос начинается с пустого g
+    g.pop('reference_versions', None)
+
+    # Три списка выбора: одна проверка версий и ни одного чтения справочников
+    with statements() as executed:
+        response = client.get('/fish_movement/new')
+    assert response.status_code == 200
+    assert len([sql for sql in executed if 'table_version' in sql]) == 1
+    assert not [sql for sql in executed if 'FROM pool' in sql or 'FROM fish_type' in sql]
+
+
+def test_write_in_request_refreshes_choices(session, client):
+    session.add(Pool(name='Б 1'))
+    session.commit()
+    client.get('/fish_movement/new')
+    session.add(Pool(name='Б 2'))
+    session.commit()
+    assert 'Б 2' in client.get('/fish_movement/new').get_data(as_text=True)
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from ledger import stock_at
+from models import db, Pool, FishType, FishInventory, FishBoning, FishMovement, PoolStock
+from retention import archive_table_rows
+
+
+def timestamp(*args):
+    return int(datetime(*args).timestamp())
+
+
+def add_inventory(session, pool, fish_type, date, biomass):
+    inventory = FishInventory(pool_id=pool.id, fish_type_id=fish_type.id, control_date=date)
+    session.add(inventory)
+    session.flush()
+    session.add(FishBoning(fish_inventory_id=inventory.id, fish_number=100, fish_biomass=biomass))
+    session.commit()
+
+
+def add_movement(session, pool_from, pool_to, fish_type, date, biomass):
+    session.add(FishMovement(pool_id_from=pool_from.id if pool_from else None,
+                             pool_id_to=pool_to.id if pool_to else None, fish_type_id=fish_type.id,
+                             movement_date=date, fish_biomass=biomass, movement_reason='посадка'))
+    session.commit()
+
+
+def test_stock_at_reads_archived_movements(session, archive_dir):
+    pool, other = Pool(name='Б 1'), Pool(name='Б 2')
+    fish_type = FishType(name='Осетр')
+    session.add_all([pool, other, fish_type])
+    session.commit()
+    add_inventory(session, pool, fish_type, timestamp(2020, 2, 1), 100.0)
+    add_movement(session, None, pool, fish_type, timestamp(2020, 5, 1), 20.0)
+    add_movement(session, pool, other, fish_type, timestamp(2020, 8, 1), 5.0)
+    add_inventory(session, pool, fish_type, timestamp(2021, 3, 1), 150.0)
+    add_inventory(session, other, fish_type, timestamp(2021, 3, 1), 4.0)
+    add_movement(session, None, pool, fish_type, timestamp(2021, 6, 1), 10.0)
+
+    # 2020 год целиком раньше текущей инвентаризации, 2021 - нет
+    with db.engine.connect() as conn:
+        report = archive_table_rows(conn, 'fish_movement', timestamp(2022, 1, 1))
+    assert report['moved'] == 2
+    assert (archive_dir / 'fish_movement-2020.sqlite3').exists()
+    assert session.query(FishMovement).count() == 1
+
+    assert stock_at(pool.id, timestamp(2020, 6, 1)) == {fish_type.id: 120.0}
+    assert stock_at(pool.id, timestamp(2020, 9, 1)) == {fish_type.id: 115.0}
+    assert stock_at(other.id, timestamp(2020, 9, 1)) == {fish_type.id: 5.0}
+    assert stock_at(pool.id, timestamp(2021, 7, 1)) == {fish_type.id: 160.0}
+    assert session.get(PoolStock, (pool.id, fish_type.id)).biomass == 160.0
+
+
+def test_movement_journal_pages_through_archive(session, client, archive_dir):
+    pool = Pool(name='Б 1')
+    fish_type = FishType(name='Осетр')
+    session.add_all([pool, fish_type])
+    session.commit()
+    add_inventory(session, pool, fish_type, timestamp(2021, 3, 1), 150.0)
+    for month in range(1, 5):
+        add_movement(session, None, pool, fish_type, timestamp(2020, month, 1), float(month))
+    add_movement(session, None, pool, fish_type, timestamp(2021, 6, 1), 10.0)
+    with db.engine.connect() as conn:
+        assert archive_table_rows(conn, 'fish_movement', timestamp(2022, 1, 1))['moved'] == 4
+
+    seen = []
+    url = '/movement?per_page=2'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_data(as_text=True)
+        seen.append(page.count('>Архив</span>'))
+        marker = page.find('/movement?after=')
+        url = page[marker:page.index('"', marker)].replace('&amp;', '&') if marker >= 0 else None
+    assert seen == [2, 2, 0]
@@ -0,0 +1,33 @@
+from models import Pool
+from versions import bump, table_versions
+
+
+def version(session, table_name):
+    return table_versions(session, [table_name])[table_name][0]
+
+
+def test_commit_bumps_version_and_rollback_does_not(session):
+    before = version(session, 'pool')
+    session.add(Pool(name='Бассейн 1'))
+    session.commit()
+    assert version(session, 'pool') == before + 1
+
+    session.add(Pool(name='Бассейн 2'))
+    session.flush()
+    session.rollback()
+    assert version(session, 'pool') == before + 1
+
+
+def test_etag_changes_after_write(app, session):
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin'})
+    response = client.get('/api/v1/pools')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert client.get('/api/v1/pools', headers={'If-None-Match': etag}).status_code == 304
+
+    # Запись другой сессией, как из команды CLI или другого рабочего процесса
+    with session.get_bind().begin() as conn:
+        conn.execute(Pool.__table__.insert().values(name='Бассейн 3'))
+        bump(conn, ['pool'])
+    assert client.get('/api/v1/pools', headers={'If-None-Match': etag}).status_code == 200